@@ -0,0 +1,226 @@
+"""
+Framework overhead benchmarks for lib.agents, lib.rag and lib.llm.
+
+Everything runs against the local StubOpenAIServer, so the numbers measure our
+own code (state machine, memory, message handling, HTTP client) rather than
+the provider. Run from the starter directory:
+
+    python -m benchmarks.bench_agents
+    python -m benchmarks.bench_agents --depths 0 2 5 --histories 0 20 --turns 50
+    python -m benchmarks.bench_agents --json results.json --baseline baseline.json
+
+With --baseline, the exit status is 1 when any scenario's turns/sec dropped by
+more than --tolerance compared to the baseline file, which makes the script
+usable as a CI regression gate.
+"""
+from typing import Any, Dict, List, Optional
+import argparse
+import gc
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+from lib.agents import Agent
+from lib.instrumentation import MetricsCollector
+from lib.llm import LLM
+from lib.tooling import tool
+
+from benchmarks.stub_server import StubOpenAIServer
+
+
+@tool
+def lookup_game(title: str) -> str:
+    """Look up a game by title"""
+    return f"{title}: released 1999 on Game Boy Color, published by Nintendo."
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process, in MB"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def make_agent(server: StubOpenAIServer, collector: MetricsCollector) -> Agent:
+    agent = Agent(
+        model_name="gpt-4o-mini",
+        instructions="You are a benchmark agent.",
+        tools=[lookup_game],
+        llm=LLM(model="gpt-4o-mini", api_key="stub", base_url=server.base_url),
+    )
+    agent.workflow.add_observer(collector)
+    return agent
+
+
+def step_latencies(collector: MetricsCollector) -> Dict[str, Dict[str, float]]:
+    return {
+        step_id: {key: round(stats[key] * 1000, 3) for key in ("p50", "p99", "mean")}
+        for step_id, stats in collector.summary().items()
+        if not step_id.startswith("__")
+    }
+
+
+def bench_agent(server: StubOpenAIServer, depth: int, history: int, turns: int) -> Dict[str, Any]:
+    """Agent loop with `depth` tool calls per turn, after `history` earlier turns"""
+    server.tool_depth = depth
+    collector = MetricsCollector()
+    agent = make_agent(server, collector)
+    session_id = f"bench-{depth}-{history}"
+
+    for i in range(history):
+        agent.invoke(f"Warm-up question {i}", session_id)
+    collector.reset()
+
+    gc.collect()
+    started = time.perf_counter()
+    for i in range(turns):
+        agent.invoke(f"Question {i}", session_id)
+    elapsed = time.perf_counter() - started
+
+    # Allocations are measured in a separate pass, tracemalloc slows everything down
+    alloc_turns = max(1, min(turns, 10))
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for i in range(alloc_turns):
+        agent.invoke(f"Traced question {i}", session_id)
+    after = tracemalloc.take_snapshot()
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    allocated = sum(stat.size_diff for stat in stats if stat.size_diff > 0)
+    blocks = sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+
+    return {
+        "scenario": f"agent depth={depth} history={history}",
+        "turns": turns,
+        "turns_per_sec": round(turns / elapsed, 2),
+        "step_latency_ms": step_latencies(collector),
+        "retained_kb_per_turn": round(allocated / alloc_turns / 1024, 2),
+        "retained_blocks_per_turn": blocks // alloc_turns,
+        "traced_peak_kb": round(traced_peak / 1024, 2),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_rag(server: StubOpenAIServer, documents: int, turns: int) -> Dict[str, Any]:
+    """RAG pipeline over `documents` stub-embedded documents"""
+    from lib.documents import Document
+    from lib.rag import RAG
+    from lib.vector_db import VectorStoreManager
+
+    collector = MetricsCollector()
+    with tempfile.TemporaryDirectory() as path:
+        manager = VectorStoreManager(path, openai_api_key="stub", openai_base_url=server.base_url)
+        store = manager.create_store("bench", force=True)
+        store.add([
+            Document(id=str(i), content=f"Game {i} is a platformer released in {1980 + i % 40}.")
+            for i in range(documents)
+        ])
+        llm = LLM(api_key="stub", base_url=server.base_url)
+        rag = RAG(llm, store)
+        rag.workflow.add_observer(collector)
+
+        gc.collect()
+        started = time.perf_counter()
+        for i in range(turns):
+            rag.invoke(f"Which game was released in {1980 + i % 40}?")
+        elapsed = time.perf_counter() - started
+
+    return {
+        "scenario": f"rag documents={documents}",
+        "turns": turns,
+        "turns_per_sec": round(turns / elapsed, 2),
+        "step_latency_ms": step_latencies(collector),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_llm(server: StubOpenAIServer, calls: int, concurrency: int) -> Dict[str, Any]:
+    """Raw LLM.invoke and LLM.batch throughput"""
+    server.tool_depth = 0
+    llm = LLM(api_key="stub", base_url=server.base_url)
+
+    started = time.perf_counter()
+    for i in range(calls):
+        llm.invoke(f"Prompt {i}")
+    sequential = time.perf_counter() - started
+
+    started = time.perf_counter()
+    llm.batch([f"Prompt {i}" for i in range(calls)], max_concurrency=concurrency)
+    batched = time.perf_counter() - started
+
+    return {
+        "scenario": f"llm calls={calls}",
+        "turns": calls,
+        "turns_per_sec": round(calls / sequential, 2),
+        "batch_calls_per_sec": round(calls / batched, 2),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, tolerance: float) -> List[str]:
+    """Scenarios whose turns/sec fell more than `tolerance` below the baseline"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {r["scenario"]: r for r in json.load(f)}
+
+    regressions = []
+    for result in results:
+        previous = baseline.get(result["scenario"])
+        if previous and result["turns_per_sec"] < previous["turns_per_sec"] * (1 - tolerance):
+            regressions.append(
+                f"{result['scenario']}: {result['turns_per_sec']} turns/s "
+                f"(baseline {previous['turns_per_sec']})"
+            )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--depths", type=int, nargs="+", default=[0, 1, 3], help="tool calls per turn")
+    parser.add_argument("--histories", type=int, nargs="+", default=[0, 20], help="earlier turns in the session")
+    parser.add_argument("--turns", type=int, default=30, help="measured turns per scenario")
+    parser.add_argument("--latency", type=float, default=0.0, help="stub server latency in seconds")
+    parser.add_argument("--rag-documents", type=int, default=0, help="also benchmark RAG over this many documents (needs chromadb)")
+    parser.add_argument("--llm-calls", type=int, default=100, help="calls for the raw LLM benchmark (0 to skip)")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results file to compare turns/sec against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown vs the baseline")
+    args = parser.parse_args(argv)
+
+    results = []
+    with StubOpenAIServer(latency=args.latency, tool_arguments={"title": "Pokémon Gold"}) as server:
+        for depth in args.depths:
+            for history in args.histories:
+                results.append(bench_agent(server, depth, history, args.turns))
+                print(json.dumps(results[-1]))
+        if args.rag_documents:
+            results.append(bench_rag(server, args.rag_documents, args.turns))
+            print(json.dumps(results[-1]))
+        if args.llm_calls:
+            results.append(bench_llm(server, args.llm_calls, concurrency=8))
+            print(json.dumps(results[-1]))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+"""
+Deterministic OpenAI-compatible HTTP server for benchmarks.
+
+Serves /v1/chat/completions (plain and streaming) and /v1/embeddings on
+localhost, so lib.llm, lib.agents and lib.rag can run end to end without
+network time or cost. Replies are scripted, latency and token usage are
+configurable.
+
+Example:
+    >>> with StubOpenAIServer(tool_depth=2, latency=0.05) as server:
+    ...     llm = LLM(api_key="stub", base_url=server.base_url)
+    ...     llm.invoke("Hi").content
+    'Stub answer to: Hi'
+"""
+from typing import Any, Callable, Dict, List, Optional, Union
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import base64
+import hashlib
+import itertools
+import json
+import struct
+import threading
+import time
+
+
+# A reply is {"content": str} and/or {"tool_calls": [{"name": str, "arguments": dict}]}
+Reply = Dict[str, Any]
+Script = Union[List[Reply], Callable[[Dict[str, Any]], Reply]]
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class StubOpenAIServer:
+    """
+    Local stand-in for the OpenAI API.
+
+    Without a script, every chat request is answered by the agent-loop policy:
+    while the current turn (the messages after the last user message) has fewer
+    than `tool_depth` tool results and the request offers tools, the reply calls
+    the first tool; otherwise it is a text answer echoing the last user message.
+
+    Args:
+        script: Optional list of replies used in order (cycling), or a function
+            from the request body to a reply
+        tool_depth: Tool calls per turn made by the default policy
+        tool_arguments: Arguments of those tool calls
+        latency: Seconds to wait before answering each request
+        completion_tokens: Completion size reported in `usage`
+        embedding_dim: Size of the vectors returned by /v1/embeddings
+        port: Port to listen on (0 picks a free one)
+    """
+
+    def __init__(self, script: Optional[Script] = None, tool_depth: int = 0,
+                 tool_arguments: Optional[Dict[str, Any]] = None, latency: float = 0.0,
+                 completion_tokens: int = 32, embedding_dim: int = 64, port: int = 0):
+        self.script = script
+        self.tool_depth = tool_depth
+        self.tool_arguments = tool_arguments or {}
+        self.latency = latency
+        self.completion_tokens = completion_tokens
+        self.embedding_dim = embedding_dim
+        self.requests = 0
+        self._replies = 0
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    def __repr__(self):
+        return f"StubOpenAIServer({self.base_url}, tool_depth={self.tool_depth}, latency={self.latency})"
+
+    def __enter__(self) -> "StubOpenAIServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _next_id(self, prefix: str) -> str:
+        return f"{prefix}_{next(self._counter)}"
+
+    def reply_for(self, body: Dict[str, Any]) -> Reply:
+        """The scripted reply to a chat completion request"""
+        if callable(self.script):
+            return self.script(body)
+        if self.script:
+            with self._lock:
+                index = self._replies % len(self.script)
+                self._replies += 1
+            return self.script[index]
+
+        messages = body.get("messages", [])
+        last_user = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=-1)
+        tool_results = sum(1 for m in messages[last_user + 1:] if m.get("role") == "tool")
+        tools = body.get("tools") or []
+        if tools and tool_results < self.tool_depth:
+            return {"tool_calls": [{"name": tools[0]["function"]["name"], "arguments": self.tool_arguments}]}
+
+        question = messages[last_user].get("content", "") if last_user >= 0 else ""
+        return {"content": f"Stub answer to: {question}"}
+
+    def _usage(self, body: Dict[str, Any]) -> Dict[str, int]:
+        prompt_tokens = sum(estimate_tokens(json.dumps(m)) for m in body.get("messages", []))
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": prompt_tokens + self.completion_tokens,
+        }
+
+    def completion(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        reply = self.reply_for(body)
+        tool_calls = [
+            {
+                "id": self._next_id("call"),
+                "type": "function",
+                "function": {"name": call["name"], "arguments": json.dumps(call.get("arguments", {}))},
+            }
+            for call in reply.get("tool_calls", [])
+        ]
+        message = {"role": "assistant", "content": reply.get("content")}
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        return {
+            "id": self._next_id("chatcmpl"),
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if tool_calls else "stop",
+            }],
+            "usage": self._usage(body),
+        }
+
+    def completion_chunks(self, body: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """The same completion split into streaming chunks"""
+        completion = self.completion(body)
+        message = completion["choices"][0]["message"]
+        base = {
+            "id": completion["id"],
+            "object": "chat.completion.chunk",
+            "created": completion["created"],
+            "model": completion["model"],
+        }
+
+        def chunk(delta, finish_reason=None):
+            return {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+        chunks = [chunk({"role": "assistant", "content": ""})]
+        content = message.get("content") or ""
+        words = content.split(" ")
+        for i, word in enumerate(words):
+            chunks.append(chunk({"content": word if i == len(words) - 1 else word + " "}))
+        for index, call in enumerate(message.get("tool_calls", [])):
+            # Name first, arguments in a second fragment, like the real API
+            chunks.append(chunk({"tool_calls": [{
+                "index": index, "id": call["id"], "type": "function",
+                "function": {"name": call["function"]["name"], "arguments": ""},
+            }]}))
+            chunks.append(chunk({"tool_calls": [{
+                "index": index, "function": {"arguments": call["function"]["arguments"]},
+            }]}))
+        chunks.append(chunk({}, completion["choices"][0]["finish_reason"]))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            chunks.append({**base, "choices": [], "usage": completion["usage"]})
+        return chunks
+
+    def embedding(self, text: str) -> List[float]:
+        """Deterministic unit vector derived from the text's hash"""
+        digest = b""
+        seed = text.encode("utf-8")
+        while len(digest) < self.embedding_dim:
+            seed = hashlib.sha256(seed).digest()
+            digest += seed
+        vector = [b / 255.0 - 0.5 for b in digest[:self.embedding_dim]]
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        return [v / norm for v in vector]
+
+    def embeddings(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        data = []
+        for index, text in enumerate(inputs):
+            vector = self.embedding(str(text))
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(struct.pack(f"<{len(vector)}f", *vector)).decode("ascii")
+            data.append({"object": "embedding", "index": index, "embedding": vector})
+        tokens = sum(estimate_tokens(str(text)) for text in inputs)
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "stub-embedding"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; with Nagle's algorithm
+            # the body waits for the client's delayed ACK (~40 ms per request)
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, payload: Dict[str, Any]):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if server.latency:
+                    time.sleep(server.latency)
+
+                path = self.path.rstrip("/")
+                if path.endswith("/chat/completions"):
+                    if body.get("stream"):
+                        self._stream(server.completion_chunks(body))
+                    else:
+                        self._send_json(200, server.completion(body))
+                elif path.endswith("/embeddings"):
+                    self._send_json(200, server.embeddings(body))
+                else:
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+                    return
+                with server._lock:
+                    server.requests += 1
+
+            def _stream(self, chunks: List[Dict[str, Any]]):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for chunk in chunks + ["[DONE]"]:
+                    data = chunk if isinstance(chunk, str) else json.dumps(chunk)
+                    event = f"data: {data}\n\n".encode("utf-8")
+                    self.wfile.write(f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the stub OpenAI server in the foreground")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--tool-depth", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    stub = StubOpenAIServer(tool_depth=args.tool_depth, latency=args.latency, port=args.port)
+    print(f"Serving {stub.base_url} (Ctrl+C to stop)")
+    try:
+        stub._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -1,26 +1,61 @@
-from typing import TypedDict, List, Optional, Union, TypeVar
+from typing import TYPE_CHECKING, Annotated, TypedDict, Callable, Dict, Iterator, List, Optional, Union, TypeVar
+from concurrent.futures import Executor, ThreadPoolExecutor, wait
+from contextlib import asynccontextmanager, contextmanager
+import asyncio
+import inspect
 import json
+import operator
+import queue
+import threading
 
-from lib.state_machine import StateMachine, Step, EntryPoint, Termination, Run
+from lib.state_machine import StateMachine, Step, EntryPoint, Termination, Run, Resource, RetentionPolicy, Overwrite
 from lib.llm import LLM
 from lib.messages import AIMessage, UserMessage, SystemMessage, ToolMessage
-from lib.tooling import Tool, ToolCall
+from lib.tooling import Tool, ToolCall, ToolRegistry, ToolArgumentError
 from lib.memory import ShortTermMemory
+from lib.context import ContextPolicy, count_tokens
+from lib.ratelimit import RateLimiter
+
+if TYPE_CHECKING:
+    from lib.cascade import CascadingLLM
 
 # Define the state schema
 class AgentState(TypedDict):
     user_query: str  # The current user query being processed
     instructions: str  # System instructions for the agent
-    messages: List[dict]  # List of conversation messages
+    messages: Annotated[List[dict], operator.add]  # Conversation messages; steps return only the new ones
     current_tool_calls: Optional[List[ToolCall]]  # Current pending tool calls
     total_tokens: int  # Track the cumulative total
-    
+    context_tokens_saved: int  # Prompt tokens removed by the context policy this run
+
+
+class _SessionLock:
+    """Lock of one session, shared by `invoke` and `ainvoke`.
+
+    `users` counts holders and waiters so the lock is dropped once the session
+    is idle. Coroutines queue on a per-loop asyncio.Lock first, so at most one
+    of them per session and loop ever waits on the thread lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.async_locks: Dict[asyncio.AbstractEventLoop, asyncio.Lock] = {}
+        self.users = 0
+
+
 class Agent:
     def __init__(self, 
                  model_name: str,
                  instructions: str, 
                  tools: List[Tool] = None,
-                 temperature: float = 0.7):
+                 temperature: float = 0.7,
+                 retention: Optional[RetentionPolicy] = None,
+                 parallel_tool_calls: bool = True,
+                 tool_timeout: Optional[float] = None,
+                 max_tool_workers: int = 8,
+                 context_policy: Optional[ContextPolicy] = None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 llm: Optional[Union[LLM, "CascadingLLM"]] = None):
         """
         Initialize an Agent
         
@@ -29,12 +64,60 @@ class Agent:
             instructions: System instructions for the agent
             tools: Optional list of tools available to the agent
             temperature: Temperature parameter for LLM (default: 0.7)
+            retention: Optional policy for the snapshots each Run keeps, e.g.
+                KeepFinalSnapshot() when only the conversation matters (default: keep all)
+            parallel_tool_calls: Run the tool calls of one turn concurrently on the
+                agent's thread pool (default: True). A single call without a
+                timeout runs inline.
+            tool_timeout: Optional seconds a tool call may take in parallel mode,
+                including time spent waiting for a free worker; a call that takes
+                longer is reported to the model as timed out. Its thread cannot be
+                stopped and keeps a pool worker busy until the tool returns;
+                `timed_out_tool_calls` counts these calls
+            max_tool_workers: Size of the thread pool shared by every turn and
+                session of this agent (default: 8)
+            context_policy: Optional policy trimming the conversation history before
+                each run, e.g. TokenBudget(4000) (default: send the full history)
+            rate_limiter: Optional RateLimiter; pass the same one to every agent that
+                shares a provider quota
+            llm: Optional model to use instead of LLM(model_name, temperature), e.g. a
+                CascadingLLM; the agent uses a copy offering the model's tools plus
+                `tools`, so one model can be shared by agents with different tools.
+                `temperature` and `rate_limiter` are then ignored
         """
         self.instructions = instructions
-        self.tools = tools if tools else []
+        self.tools = ToolRegistry(tools)
         self.model_name = model_name
         self.temperature = temperature
+        self.retention = retention
+        self.parallel_tool_calls = parallel_tool_calls
+        self.tool_timeout = tool_timeout
+        self.max_tool_workers = max_tool_workers
+        # Created on first use; `close` shuts it down
+        self._tool_executor: Optional[ThreadPoolExecutor] = None
+        self._tool_executor_guard = threading.Lock()
+        # Timed-out calls whose threads may still be running
+        self.timed_out_tool_calls = 0
+        self.context_policy = context_policy
+
+        if llm is not None:
+            # The agent gets its own registry; the model passed in is left unchanged
+            self.tools = ToolRegistry([*llm.tools, *self.tools])
+            self.llm = llm.with_tools(self.tools)
+        else:
+            # One LLM for every turn; its client comes from the shared pool
+            self.llm = LLM(
+                model=self.model_name,
+                temperature=self.temperature,
+                tools=self.tools,
+                rate_limiter=rate_limiter
+            )
         
+        # Turns of one session run one at a time; different sessions run concurrently.
+        # Only sessions with a turn in progress have an entry.
+        self._session_locks: Dict[str, _SessionLock] = {}
+        self._session_locks_guard = threading.Lock()
+
         # Initialize memory and state machine
         self.memory = ShortTermMemory()
         self.workflow = self._create_state_machine()
@@ -44,27 +127,40 @@ class Agent:
         messages = state.get("messages", [])
         
         # If no messages exist, start with system message
-        if not messages:
-            messages = [SystemMessage(content=state["instructions"])]
+        new_messages = [] if messages else [SystemMessage(content=state["instructions"])]
             
         # Add the new user message
-        messages.append(UserMessage(content=state["user_query"]))
+        new_messages.append(UserMessage(content=state["user_query"]))
+
+        # Trim the history; the trimmed list replaces the history later runs build on
+        if self.context_policy:
+            messages = messages + new_messages
+            trimmed = self.context_policy.apply(messages)
+            tokens_saved = max(0, count_tokens(messages, self.model_name) - count_tokens(trimmed, self.model_name))
+            return {
+                "messages": Overwrite(trimmed),
+                "session_id": state["session_id"],
+                "context_tokens_saved": tokens_saved,
+            }
         
         return {
-            "messages": messages,
-            "session_id": state["session_id"]
+            "messages": new_messages,
+            "session_id": state["session_id"],
+            "context_tokens_saved": 0,
         }
 
-    def _llm_step(self, state: AgentState) -> AgentState:
+    def _llm_step(self, state: AgentState, resource: Resource = None) -> AgentState:
         """Step logic: Process the current state through the LLM"""
-        # Initialize LLM
-        llm = LLM(
-            model=self.model_name,
-            temperature=self.temperature,
-            tools=self.tools
-        )
-
-        response = llm.invoke(state["messages"])
+        on_token = resource.vars.get("on_token") if resource else None
+        if on_token:
+            # Stream the completion, passing content deltas on as they arrive
+            for chunk in self.llm.stream(state["messages"]):
+                if isinstance(chunk, str):
+                    on_token(chunk)
+                else:
+                    response = chunk
+        else:
+            response = self.llm.invoke(state["messages"])
         tool_calls = response.tool_calls if response.tool_calls else None
 
         current_total = state.get("total_tokens", 0)
@@ -78,43 +174,90 @@ class Agent:
         )
 
         return {
-            "messages": state["messages"] + [ai_message],
+            "messages": [ai_message],
             "current_tool_calls": tool_calls,
             "session_id": state["session_id"],
             "total_tokens": current_total,
         }
 
+    def _call_tool(self, call: ToolCall) -> Optional[ToolMessage]:
+        """Execute a single tool call, or return None if the tool is unknown"""
+        function_name = call.function.name
+        tool = self.tools.get(function_name)
+        if not tool:
+            return None
+
+        try:
+            function_args = self.tools.validate(function_name, call.function.arguments)
+        except ToolArgumentError as e:
+            # Let the model see what was wrong and retry the call
+            return ToolMessage(
+                content=json.dumps(f"Error: {e}"),
+                tool_call_id=call.id,
+                name=function_name,
+            )
+
+        result = tool(**function_args)
+        if inspect.isawaitable(result):
+            # Async tools get their own event loop in the calling thread
+            result = asyncio.run(result)
+        return ToolMessage(
+            content=json.dumps(str(result)), 
+            tool_call_id=call.id, 
+            name=function_name, 
+        )
+
+    def _get_tool_executor(self) -> ThreadPoolExecutor:
+        with self._tool_executor_guard:
+            if self._tool_executor is None:
+                self._tool_executor = ThreadPoolExecutor(
+                    max_workers=self.max_tool_workers, thread_name_prefix="agent-tool"
+                )
+            return self._tool_executor
+
+    def _call_tools_parallel(self, tool_calls: List[ToolCall]) -> List[Optional[ToolMessage]]:
+        """Execute tool calls concurrently, keeping the order of `tool_calls`"""
+        executor = self._get_tool_executor()
+        futures = [executor.submit(self._call_tool, call) for call in tool_calls]
+        wait(futures, timeout=self.tool_timeout)
+
+        tool_messages = []
+        for call, future in zip(tool_calls, futures):
+            if future.done():
+                tool_messages.append(future.result())
+                continue
+            # A call still queued is dropped; a running one can't be interrupted
+            # and holds its worker until it returns, its result discarded
+            if not future.cancel():
+                with self._tool_executor_guard:
+                    self.timed_out_tool_calls += 1
+            tool_messages.append(ToolMessage(
+                content=json.dumps(f"Error: tool '{call.function.name}' timed out after {self.tool_timeout}s"),
+                tool_call_id=call.id,
+                name=call.function.name,
+            ))
+        return tool_messages
+
     def _tool_step(self, state: AgentState) -> AgentState:
         """Step logic: Execute any pending tool calls"""
         tool_calls = state["current_tool_calls"] or []
-        tool_messages = []
         
-        for call in tool_calls:
-            # Access tool call data correctly
-            function_name = call.function.name
-            function_args = json.loads(call.function.arguments)
-            tool_call_id = call.id
-            # Find the matching tool
-            tool = next((t for t in self.tools if t.name == function_name), None)
-            if tool:
-                result = str(tool(**function_args))
-                tool_message = ToolMessage(
-                    content=json.dumps(result), 
-                    tool_call_id=tool_call_id, 
-                    name=function_name, 
-                )
-                tool_messages.append(tool_message)
+        if self.parallel_tool_calls and (len(tool_calls) > 1 or (tool_calls and self.tool_timeout is not None)):
+            tool_messages = self._call_tools_parallel(tool_calls)
+        else:
+            tool_messages = [self._call_tool(call) for call in tool_calls]
+        tool_messages = [message for message in tool_messages if message is not None]
         
         # Clear tool calls and add results to messages
         return {
-            "messages": state["messages"] + tool_messages,
+            "messages": tool_messages,
             "current_tool_calls": None,
             "session_id": state["session_id"]
         }
 
     def _create_state_machine(self) -> StateMachine[AgentState]:
         """Create the internal state machine for the agent"""
-        machine = StateMachine[AgentState](AgentState)
+        machine = StateMachine[AgentState](AgentState, retention=self.retention)
         
         # Create steps
         entry = EntryPoint[AgentState]()
@@ -141,19 +284,57 @@ class Agent:
         
         return machine
 
-    def invoke(self, query: str, session_id: Optional[str] = None) -> Run:
-        """
-        Run the agent on a query
-        
-        Args:
-            query: The user's query to process
-            session_id: Optional session identifier (uses "default" if None)
-            
-        Returns:
-            The final run object after processing
-        """
-        session_id = session_id or "default"
+    def _checkout_session_lock(self, session_id: str) -> _SessionLock:
+        with self._session_locks_guard:
+            entry = self._session_locks.get(session_id)
+            if entry is None:
+                entry = self._session_locks[session_id] = _SessionLock()
+            entry.users += 1
+            return entry
+
+    def _checkin_session_lock(self, session_id: str, entry: _SessionLock):
+        with self._session_locks_guard:
+            entry.users -= 1
+            if entry.users == 0:
+                del self._session_locks[session_id]
+
+    @contextmanager
+    def _hold_session(self, session_id: str):
+        """Hold the session from reading its history until the new run is stored,
+        so concurrent calls on one session can't drop each other's turns"""
+        entry = self._checkout_session_lock(session_id)
+        try:
+            with entry.lock:
+                yield
+        finally:
+            self._checkin_session_lock(session_id, entry)
 
+    @asynccontextmanager
+    async def _ahold_session(self, session_id: str):
+        """Async counterpart of `_hold_session`; waiting coroutines don't use threads"""
+        entry = self._checkout_session_lock(session_id)
+        try:
+            loop = asyncio.get_running_loop()
+            with self._session_locks_guard:
+                async_lock = entry.async_locks.setdefault(loop, asyncio.Lock())
+            async with async_lock:
+                if not entry.lock.acquire(blocking=False):
+                    # Held by a sync `invoke`: wait for it in a thread, one per session at most
+                    acquired = asyncio.ensure_future(asyncio.to_thread(entry.lock.acquire))
+                    try:
+                        await asyncio.shield(acquired)
+                    except asyncio.CancelledError:
+                        # The thread still takes the lock; give it back once it does
+                        acquired.add_done_callback(lambda _: entry.lock.release())
+                        raise
+                try:
+                    yield
+                finally:
+                    entry.lock.release()
+        finally:
+            self._checkin_session_lock(session_id, entry)
+
+    def _initial_state(self, query: str, session_id: str) -> AgentState:
         # Create session if it doesn't exist
         self.memory.create_session(session_id)
 
@@ -165,7 +346,7 @@ class Agent:
             if last_state:
                 previous_messages = last_state["messages"]
 
-        initial_state: AgentState = {
+        return {
             "user_query": query,
             "instructions": self.instructions,
             "messages": previous_messages,
@@ -173,13 +354,113 @@ class Agent:
             "session_id": session_id,
         }
 
-        run_object = self.workflow.run(initial_state)
+    def invoke(self, query: str, session_id: Optional[str] = None,
+               on_token: Optional[Callable[[str], None]] = None) -> Run:
+        """
+        Run the agent on a query
         
+        Args:
+            query: The user's query to process
+            session_id: Optional session identifier (uses "default" if None)
+            on_token: Optional callback receiving the model's content deltas as
+                they are generated; LLM calls are streamed when it is given
+            
+        Returns:
+            The final run object after processing
+        """
+        session_id = session_id or "default"
+        with self._hold_session(session_id):
+            return self._turn(query, session_id, on_token)
+
+    def _turn(self, query: str, session_id: str, on_token: Optional[Callable[[str], None]]) -> Run:
+        """Run one turn of a session whose lock is held"""
+        initial_state = self._initial_state(query, session_id)
+
+        run_object = self.workflow.run(initial_state, Resource(vars={"on_token": on_token}))
+
         # Store the complete run object in memory
         self.memory.add(run_object, session_id)
+        return run_object
+
+    async def ainvoke(self, query: str, session_id: Optional[str] = None,
+                      on_token: Optional[Callable[[str], None]] = None,
+                      executor: Optional[Executor] = None) -> Run:
+        """
+        Async counterpart of `invoke`, so many sessions can share one event loop
         
+        Args:
+            query: The user's query to process
+            session_id: Optional session identifier (uses "default" if None)
+            on_token: Optional callback receiving the model's content deltas; it
+                is called from a worker thread
+            executor: Optional executor running the whole turn on one of its
+                workers once the session is free; by default steps and memory
+                I/O run on the loop's default executor
+            
+        Returns:
+            The final run object after processing
+        """
+        session_id = session_id or "default"
+        async with self._ahold_session(session_id):
+            if executor is not None:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(executor, self._turn, query, session_id, on_token)
+
+            # Memory may do disk I/O (SQLiteShortTermMemory), keep it off the loop
+            initial_state = await asyncio.to_thread(self._initial_state, query, session_id)
+
+            run_object = await self.workflow.arun(initial_state, Resource(vars={"on_token": on_token}))
+
+            await asyncio.to_thread(self.memory.add, run_object, session_id)
+
         return run_object
 
+    def stream(self, query: str, session_id: Optional[str] = None) -> Iterator[str]:
+        """
+        Run the agent on a query and yield the model's tokens as they arrive
+
+        The run executes on a background thread. Tokens of every LLM call in the
+        run are yielded, including text the model produces before calling tools.
+        The final Run is the generator's return value, and a failed run re-raises
+        its error.
+
+        Example:
+            >>> for token in agent.stream("When was Gran Turismo released?"):
+            ...     print(token, end="", flush=True)
+        """
+        tokens: queue.Queue = queue.Queue()
+        done = object()
+        outcome = {}
+
+        def worker():
+            try:
+                outcome["run"] = self.invoke(query, session_id, on_token=tokens.put)
+            except BaseException as e:
+                outcome["error"] = e
+            finally:
+                tokens.put(done)
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+
+        while True:
+            token = tokens.get()
+            if token is done:
+                break
+            yield token
+        thread.join()
+
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["run"]
+
+    def close(self):
+        """Shut down the tool thread pool; calls still running are not waited for"""
+        with self._tool_executor_guard:
+            executor, self._tool_executor = self._tool_executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
     def get_session_runs(self, session_id: Optional[str] = None) -> List[Run]:
         """Get all Run objects for a session
         
@@ -192,9 +473,37 @@ class Agent:
         return self.memory.get_all_objects(session_id)
 
     def reset_session(self, session_id: Optional[str] = None):
-        """Reset memory for a specific session
+        """Reset memory for a specific session, or for every session
+        
+        Args:
+            session_id: Optional session to reset; None resets every session
+            
+        Raises:
+            RuntimeError: If session_id is None while a turn is in progress
+        """
+        if session_id is None:
+            # Holding the guard keeps new turns from starting until the reset is done
+            with self._session_locks_guard:
+                if self._session_locks:
+                    raise RuntimeError(
+                        f"Cannot reset every session while turns are in progress: {sorted(self._session_locks)}"
+                    )
+                self.memory.reset()
+            return
+        with self._hold_session(session_id):
+            self.memory.reset(session_id)
+
+    def delete_session(self, session_id: str) -> bool:
+        """Delete a session and its runs, waiting for a turn in progress to finish
         
         Args:
-            session_id: Optional session to reset (uses "default" if None)
+            session_id: The session to delete
+            
+        Returns:
+            bool: True if the session was deleted, False if it didn't exist
+            
+        Raises:
+            ValueError: If attempting to delete the default session
         """
-        self.memory.reset(session_id)
+        with self._hold_session(session_id):
+            return self.memory.delete_session(session_id)
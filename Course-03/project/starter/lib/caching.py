@@ -0,0 +1,233 @@
+from typing import Any, Dict, List, Optional, Sequence
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import is_dataclass, asdict
+from decimal import Decimal
+from enum import Enum
+from pathlib import PurePath
+import datetime
+import hashlib
+import json
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+
+
+# Returned by Cache.get when a key is absent or expired, so None can be cached
+MISSING = object()
+
+
+def _encode(value: Any) -> Any:
+    """json.dumps fallback that turns common non-JSON values into stable data.
+
+    Raises:
+        TypeError: For values without a stable encoding; their default repr
+            contains a memory address, which differs between processes and may
+            be reused by another object after garbage collection
+    """
+    if hasattr(value, "model_dump"):
+        # pydantic models (messages, tool calls, response formats)
+        return {"__model__": type(value).__qualname__, **value.model_dump(mode="json")}
+    if is_dataclass(value) and not isinstance(value, type):
+        return {"__dataclass__": type(value).__qualname__, **asdict(value)}
+    if isinstance(value, (set, frozenset)):
+        return sorted(fingerprint(item) for item in value)
+    if isinstance(value, type):
+        if hasattr(value, "model_json_schema"):
+            return {"__type__": f"{value.__module__}.{value.__qualname__}", "schema": value.model_json_schema()}
+        return {"__type__": f"{value.__module__}.{value.__qualname__}"}
+    if isinstance(value, bytes):
+        return value.hex()
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return {"__enum__": type(value).__qualname__, "value": value.value}
+    if isinstance(value, (Decimal, uuid.UUID, PurePath)):
+        return str(value)
+    raise TypeError(
+        f"Cannot fingerprint {type(value).__qualname__} values: they have no stable encoding. "
+        "Convert them to JSON data or a dataclass/pydantic model, or leave their field out of a pure step's `reads`."
+    )
+
+
+def fingerprint(value: Any) -> str:
+    """
+    Stable SHA-256 hash of a value.
+
+    The value is serialized to canonical JSON (sorted keys, no whitespace), so
+    equal data gives the same fingerprint across processes and runs. Pydantic
+    models, dataclasses, sets, classes, dates, enums, decimals, UUIDs and paths
+    are supported.
+
+    Raises:
+        TypeError: If the value contains anything else, e.g. an arbitrary object
+    """
+    canonical = json.dumps(value, default=_encode, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class Cache(ABC):
+    """
+    Key-value cache with hit/miss counters.
+
+    Keys are strings, usually produced by `fingerprint`. Entries older than
+    `ttl` seconds are treated as missing (no expiry if `ttl` is None).
+    """
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    @abstractmethod
+    def get(self, key: str) -> Any:
+        """Return the cached value or MISSING"""
+
+    @abstractmethod
+    def set(self, key: str, value: Any):
+        """Store a value"""
+
+    @abstractmethod
+    def clear(self):
+        """Drop every entry"""
+
+
+class LRUCache(Cache):
+    """In-memory cache that evicts the least recently used entry beyond `maxsize`"""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        super().__init__(ttl)
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"LRUCache(size={len(self._entries)}, maxsize={self.maxsize}, ttl={self.ttl})"
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Picklable, e.g. for pure steps of a state machine sent to a process pool
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[1]):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCache(Cache):
+    """Persistent cache stored as pickled values in a local SQLite file"""
+
+    def __init__(self, path: str = "cache.db", ttl: Optional[float] = None):
+        super().__init__(ttl)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, created REAL NOT NULL)"
+            )
+
+    def __repr__(self):
+        return f"SQLiteCache('{self.path}', ttl={self.ttl})"
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None or self._expired(row[1]):
+                if row is not None:
+                    with self._conn:
+                        self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self.misses += 1
+                return MISSING
+            self.hits += 1
+        return pickle.loads(row[0])
+
+    def set(self, key: str, value: Any):
+        data = pickle.dumps(value)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created) VALUES (?, ?, ?)",
+                (key, data, time.time()),
+            )
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cache")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class TieredCache(Cache):
+    """
+    Chain of caches checked in order, typically a fast in-memory tier in front
+    of a persistent one. A hit in a later tier is copied into the earlier tiers;
+    writes go to every tier. Each tier applies its own TTL.
+
+    Example:
+        >>> cache = TieredCache([LRUCache(maxsize=512), SQLiteCache("llm_cache.db", ttl=7 * 24 * 3600)])
+    """
+
+    def __init__(self, tiers: Sequence[Cache]):
+        super().__init__(ttl=None)
+        self.tiers: List[Cache] = list(tiers)
+
+    def __repr__(self):
+        return f"TieredCache({self.tiers})"
+
+    def get(self, key: str) -> Any:
+        for i, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not MISSING:
+                for earlier in self.tiers[:i]:
+                    earlier.set(key, value)
+                self.hits += 1
+                return value
+        self.misses += 1
+        return MISSING
+
+    def set(self, key: str, value: Any):
+        for tier in self.tiers:
+            tier.set(key, value)
+
+    def clear(self):
+        for tier in self.tiers:
+            tier.clear()
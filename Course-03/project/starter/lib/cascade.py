@@ -0,0 +1,231 @@
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Union
+from collections import Counter
+import copy
+import threading
+
+from pydantic import BaseModel, Field
+
+from lib.llm import LLM
+from lib.messages import AIMessage, BaseMessage, TokenUsage, UserMessage
+from lib.parsers import OutputParser
+from lib.tooling import Tool, ToolRegistry
+
+
+# A check looks at the request and a tier's answer and returns True to accept it
+Check = Callable[[List[BaseMessage], AIMessage], bool]
+
+
+def parses_with(parser: OutputParser) -> Check:
+    """Accept answers the parser can parse, e.g. PydanticOutputParser(model_class=...)"""
+    def parses(messages: List[BaseMessage], response: AIMessage) -> bool:
+        try:
+            parser.parse(response)
+        except Exception:
+            return False
+        return True
+    parses.__name__ = f"parses_with_{type(parser).__name__}"
+    return parses
+
+
+def has_tool_call(messages: List[BaseMessage], response: AIMessage) -> bool:
+    """Accept answers that call at least one tool"""
+    return bool(response.tool_calls)
+
+
+def has_content(messages: List[BaseMessage], response: AIMessage) -> bool:
+    """Accept answers with either text or a tool call"""
+    return bool(response.tool_calls) or bool((response.content or "").strip())
+
+
+class JudgeScore(BaseModel):
+    """Structured confidence score from the judge"""
+    confidence: float = Field(description="Confidence between 0 and 1 that the answer is correct and complete", ge=0, le=1)
+
+
+def judge_confidence(judge: LLM, threshold: float = 0.7) -> Check:
+    """
+    Accept answers a judge model rates at least `threshold` confident.
+
+    Tool calls are accepted without asking the judge; their results are judged
+    on the next turn.
+    """
+    def confident(messages: List[BaseMessage], response: AIMessage) -> bool:
+        if response.tool_calls:
+            return True
+        question = next((m.content for m in reversed(messages) if isinstance(m, UserMessage)), "")
+        verdict = judge.invoke(
+            f"Question: {question}\nAnswer: {response.content}\n\n"
+            "How confident are you that the answer is correct and complete?",
+            response_format=JudgeScore,
+        )
+        try:
+            return JudgeScore.model_validate_json(verdict.content).confidence >= threshold
+        except Exception:
+            return False
+    confident.__name__ = f"judge_confidence_{threshold}"
+    return confident
+
+
+def _add_usage(total: Optional[TokenUsage], usage: Optional[TokenUsage]) -> Optional[TokenUsage]:
+    if usage is None:
+        return total
+    if total is None:
+        return usage.model_copy()
+    return TokenUsage(
+        prompt_tokens=total.prompt_tokens + usage.prompt_tokens,
+        completion_tokens=total.completion_tokens + usage.completion_tokens,
+        total_tokens=total.total_tokens + usage.total_tokens,
+    )
+
+
+class CascadingLLM:
+    """
+    Tries a cheap model first and escalates to stronger ones only when needed.
+
+    Each tier's answer goes through the checks; the first answer passing all of
+    them is returned, and the last tier's answer is returned as is. A tier that
+    raises is treated as a failed check. The returned message's token usage is
+    the sum over every tier that was tried.
+
+    Exposes `invoke`, `stream`, `register_tool` and `with_tools` like LLM, so it
+    can be passed to an Agent. The cascade offers the tools of the first tier
+    and never registers tools on the tiers passed in.
+
+    Example:
+        >>> llm = CascadingLLM(
+        ...     [LLM(model="gpt-4o-mini"), LLM(model="gpt-4o")],
+        ...     checks=[has_content, parses_with(PydanticOutputParser(model_class=GameAnswer))],
+        ... )
+        >>> agent = Agent(model_name="gpt-4o-mini", instructions="...", llm=llm)
+        >>> llm.stats
+        {'calls': 120, 'escalations': 9, 'escalation_rate': 0.075, ...}
+    """
+
+    def __init__(self, tiers: Sequence[LLM], checks: Optional[Sequence[Check]] = None):
+        if not tiers:
+            raise ValueError("CascadingLLM needs at least one tier")
+        self.tiers = list(tiers)
+        self.checks: List[Check] = list(checks) if checks is not None else [has_content]
+        # All tiers offer the same tools, from a registry of the cascade's own
+        self.tools = ToolRegistry(self.tiers[0].tools)
+        self.tiers = [tier.with_tools(self.tools) for tier in self.tiers]
+
+        # Counters are shared with the copies made by `with_tools`
+        self._lock = threading.Lock()
+        self._counts: Counter = Counter()
+        self._answered_by: Counter = Counter()
+        self._failures: Counter = Counter()
+
+    def __repr__(self):
+        return f"CascadingLLM({[tier.model for tier in self.tiers]})"
+
+    @classmethod
+    def from_models(cls, models: Sequence[str], checks: Optional[Sequence[Check]] = None,
+                    tools: Optional[Union[List[Tool], ToolRegistry]] = None, **llm_kwargs) -> "CascadingLLM":
+        """Build the tiers from model names, cheapest first"""
+        registry = tools if isinstance(tools, ToolRegistry) else ToolRegistry(tools)
+        return cls([LLM(model=model, tools=registry, **llm_kwargs) for model in models], checks)
+
+    @property
+    def model(self) -> str:
+        return self.tiers[0].model
+
+    @property
+    def stats(self) -> Dict[str, object]:
+        """Calls, escalations and the share of calls each tier answered"""
+        with self._lock:
+            calls, escalations = self._counts["calls"], self._counts["escalations"]
+            return {
+                "calls": calls,
+                "escalations": escalations,
+                "escalation_rate": escalations / calls if calls else 0.0,
+                "answered_by": dict(self._answered_by),
+                "check_failures": dict(self._failures),
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self._counts.clear()
+            self._answered_by.clear()
+            self._failures.clear()
+
+    def register_tool(self, tool: Tool):
+        self.tools.register(tool)
+
+    def with_tools(self, tools: Optional[Union[List[Tool], ToolRegistry]]) -> "CascadingLLM":
+        """A copy of this cascade offering `tools`; checks and stats stay shared"""
+        clone = copy.copy(self)
+        clone.tools = tools if isinstance(tools, ToolRegistry) else ToolRegistry(tools)
+        clone.tiers = [tier.with_tools(clone.tools) for tier in self.tiers]
+        return clone
+
+    def _failed_check(self, messages: List[BaseMessage], response: AIMessage) -> Optional[str]:
+        for check in self.checks:
+            if not check(messages, response):
+                return getattr(check, "__name__", repr(check))
+        return None
+
+    def _record(self, tier: LLM, escalated: bool):
+        with self._lock:
+            self._counts["calls"] += 1
+            self._counts["escalations"] += int(escalated)
+            self._answered_by[tier.model] += 1
+
+    def _record_failure(self, reason: str):
+        with self._lock:
+            self._failures[reason] += 1
+
+    def invoke(self,
+               input: str | BaseMessage | List[BaseMessage],
+               response_format: BaseModel = None) -> AIMessage:
+        messages = self.tiers[0]._convert_input(input)
+        usage = None
+        for i, tier in enumerate(self.tiers):
+            last = i == len(self.tiers) - 1
+            try:
+                response = tier.invoke(messages, response_format=response_format)
+            except Exception as e:
+                if last:
+                    raise
+                self._record_failure(type(e).__name__)
+                continue
+
+            usage = _add_usage(usage, response.token_usage)
+            failed = None if last else self._failed_check(messages, response)
+            if failed is None:
+                self._record(tier, escalated=i > 0)
+                return response.model_copy(update={"token_usage": usage})
+            self._record_failure(failed)
+
+    def stream(self, input: str | BaseMessage | List[BaseMessage]) -> Iterator[Union[str, AIMessage]]:
+        """
+        Like LLM.stream. Answers of the cheaper tiers are buffered until they pass
+        the checks, so callers never see tokens of an answer that gets replaced;
+        the last tier streams live.
+        """
+        messages = self.tiers[0]._convert_input(input)
+        usage = None
+        for i, tier in enumerate(self.tiers[:-1]):
+            try:
+                chunks = list(tier.stream(messages))
+            except Exception as e:
+                self._record_failure(type(e).__name__)
+                continue
+
+            response = chunks[-1]
+            usage = _add_usage(usage, response.token_usage)
+            failed = self._failed_check(messages, response)
+            if failed is None:
+                self._record(tier, escalated=i > 0)
+                yield from chunks[:-1]
+                yield response.model_copy(update={"token_usage": usage})
+                return
+            self._record_failure(failed)
+
+        last = self.tiers[-1]
+        for chunk in last.stream(messages):
+            if isinstance(chunk, str):
+                yield chunk
+            else:
+                self._record(last, escalated=len(self.tiers) > 1)
+                yield chunk.model_copy(update={"token_usage": _add_usage(usage, chunk.token_usage)})
@@ -0,0 +1,223 @@
+from typing import Any, Dict, List, Optional, Tuple, Type
+from abc import ABC, abstractmethod
+from datetime import datetime
+import pickle
+import sqlite3
+import threading
+
+from lib.state_machine import Run, Snapshot, StateSchema
+
+
+class CheckpointStore(ABC):
+    """
+    Durable storage for the snapshots of a Run.
+
+    A StateMachine configured with a checkpoint store saves every snapshot as
+    soon as it is produced, so an interrupted run can be continued with
+    `StateMachine.resume(run_id)` instead of being started over.
+    """
+
+    @abstractmethod
+    def start_run(self, run: Run, initial_state: Dict[str, Any]):
+        """Record a new run together with the state it was started with"""
+
+    @abstractmethod
+    def save_snapshot(self, run_id: str, snapshot: Snapshot, branch: bool = False):
+        """Persist a snapshot. `branch` marks snapshots produced inside a parallel branch"""
+
+    @abstractmethod
+    def complete_run(self, run: Run):
+        """Mark a run as finished"""
+
+    @abstractmethod
+    def load_run(self, run_id: str, state_schema: Type[StateSchema]) -> Tuple[Run, Optional[Dict[str, Any]]]:
+        """Rebuild a run from storage without changing what is stored
+
+        Returns:
+            The run and the initial state it was started with
+
+        Raises:
+            KeyError: If the run is unknown
+        """
+
+    @abstractmethod
+    def prune(self, run_id: str) -> int:
+        """Delete the snapshots of an incomplete run that `load_run` leaves out,
+        i.e. those of parallel branches a resume runs again. Returns how many
+        were deleted"""
+
+    @abstractmethod
+    def load_snapshots(self, run_id: str, state_schema: Type[StateSchema]) -> List[Snapshot]:
+        """All stored snapshots of a run in the order they were saved, including
+        snapshots spilled by a RetentionPolicy"""
+
+    @abstractmethod
+    def get_incomplete_runs(self) -> List[str]:
+        """Ids of runs that were started but never completed"""
+
+
+class SQLiteCheckpointStore(CheckpointStore):
+    """
+    Checkpoint store backed by a local SQLite file.
+
+    Snapshots are written as they are produced, one row each, holding only the
+    pickled delta of the snapshot plus a reference to its parent. Rebuilding
+    a run therefore restores the same structural sharing the live run had.
+
+    Example:
+        >>> store = SQLiteCheckpointStore("checkpoints.db")
+        >>> machine = StateMachine[AgentState](AgentState, checkpointer=store)
+        >>> # ... process crashes mid-run ...
+        >>> for run_id in store.get_incomplete_runs():
+        ...     machine.resume(run_id)
+    """
+
+    def __init__(self, path: str = "checkpoints.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS runs (
+                    run_id TEXT PRIMARY KEY,
+                    start_timestamp TEXT NOT NULL,
+                    end_timestamp TEXT,
+                    initial_state BLOB
+                )"""
+            )
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS snapshots (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_id TEXT NOT NULL,
+                    snapshot_id TEXT NOT NULL,
+                    parent_id TEXT,
+                    step_id TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    depth INTEGER NOT NULL,
+                    branch INTEGER NOT NULL,
+                    delta BLOB NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_snapshots_run ON snapshots (run_id, seq)")
+
+    def __repr__(self):
+        return f"SQLiteCheckpointStore('{self.path}')"
+
+    def start_run(self, run: Run, initial_state: Dict[str, Any]):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO runs (run_id, start_timestamp, end_timestamp, initial_state) VALUES (?, ?, NULL, ?)",
+                (run.run_id, run.start_timestamp.isoformat(), pickle.dumps(dict(initial_state))),
+            )
+
+    def save_snapshot(self, run_id: str, snapshot: Snapshot, branch: bool = False):
+        row = (
+            run_id,
+            snapshot.snapshot_id,
+            snapshot.parent.snapshot_id if snapshot.parent is not None else None,
+            snapshot.step_id,
+            snapshot.timestamp.isoformat(),
+            snapshot.depth,
+            int(branch),
+            pickle.dumps(snapshot.delta),
+        )
+        with self._lock, self._conn:
+            self._conn.execute(
+                """INSERT INTO snapshots (run_id, snapshot_id, parent_id, step_id, timestamp, depth, branch, delta)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                row,
+            )
+
+    def complete_run(self, run: Run):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE runs SET end_timestamp = ? WHERE run_id = ?",
+                (run.end_timestamp.isoformat(), run.run_id),
+            )
+
+    def load_run(self, run_id: str, state_schema: Type[StateSchema]) -> Tuple[Run, Optional[Dict[str, Any]]]:
+        """Rebuild a run from storage
+
+        Snapshots of parallel branches that were still running when the run was
+        interrupted are left out: a resumed run restarts that fan-out from the
+        last snapshot on the main path. They stay stored until `prune`.
+        """
+        with self._lock:
+            run_row = self._conn.execute(
+                "SELECT start_timestamp, end_timestamp, initial_state FROM runs WHERE run_id = ?",
+                (run_id,),
+            ).fetchone()
+            if run_row is None:
+                raise KeyError(f"Run '{run_id}' not found in {self}")
+            last_seq = self._last_main_seq(run_id) if run_row[1] is None else None
+
+        run = Run(
+            run_id=run_id,
+            start_timestamp=datetime.fromisoformat(run_row[0]),
+            end_timestamp=datetime.fromisoformat(run_row[1]) if run_row[1] else None,
+        )
+        if run_row[1] is not None or last_seq is not None:
+            for snapshot in self._load_snapshots(run_id, state_schema, last_seq):
+                run.add_snapshot(snapshot)
+
+        initial_state = pickle.loads(run_row[2]) if run_row[2] is not None else None
+        return run, initial_state
+
+    def _last_main_seq(self, run_id: str) -> Optional[int]:
+        """Sequence number of the last snapshot outside a parallel branch"""
+        return self._conn.execute(
+            "SELECT MAX(seq) FROM snapshots WHERE run_id = ? AND branch = 0", (run_id,)
+        ).fetchone()[0]
+
+    def prune(self, run_id: str) -> int:
+        with self._lock, self._conn:
+            ended = self._conn.execute("SELECT end_timestamp FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+            if ended is None or ended[0] is not None:
+                return 0
+            last_seq = self._last_main_seq(run_id)
+            return self._conn.execute(
+                "DELETE FROM snapshots WHERE run_id = ? AND seq > ?", (run_id, -1 if last_seq is None else last_seq)
+            ).rowcount
+
+    def load_snapshots(self, run_id: str, state_schema: Type[StateSchema]) -> List[Snapshot]:
+        return self._load_snapshots(run_id, state_schema)
+
+    def _load_snapshots(self, run_id: str, state_schema: Type[StateSchema],
+                        last_seq: Optional[int] = None) -> List[Snapshot]:
+        query = """SELECT snapshot_id, parent_id, step_id, timestamp, depth, delta
+                   FROM snapshots WHERE run_id = ?"""
+        params: Tuple = (run_id,)
+        if last_seq is not None:
+            query += " AND seq <= ?"
+            params += (last_seq,)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY seq", params).fetchall()
+
+        snapshots: List[Snapshot] = []
+        by_id: Dict[str, Snapshot] = {}
+        for snapshot_id, parent_id, step_id, timestamp, depth, delta in rows:
+            snapshot = Snapshot(
+                snapshot_id=snapshot_id,
+                timestamp=datetime.fromisoformat(timestamp),
+                state_schema=state_schema,
+                step_id=step_id,
+                delta=pickle.loads(delta),
+                parent=by_id.get(parent_id),
+                depth=depth,
+            )
+            by_id[snapshot_id] = snapshot
+            snapshots.append(snapshot)
+        return snapshots
+
+    def get_incomplete_runs(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT run_id FROM runs WHERE end_timestamp IS NULL ORDER BY start_timestamp"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,195 @@
+from typing import TYPE_CHECKING, List, Optional, Tuple
+from abc import ABC, abstractmethod
+
+from lib.messages import BaseMessage, SystemMessage, UserMessage, AIMessage
+from lib.caching import LRUCache, MISSING, fingerprint
+
+if TYPE_CHECKING:
+    from lib.llm import LLM
+
+try:
+    import tiktoken
+except ImportError:  # optional, counts are approximated without it
+    tiktoken = None
+
+
+# Fixed cost of every message in a chat completion request (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(messages: List[BaseMessage], model: str = "gpt-4o-mini") -> int:
+    """
+    Number of prompt tokens the messages take up.
+
+    Uses tiktoken when it is installed and falls back to roughly four
+    characters per token otherwise.
+    """
+    texts = []
+    for message in messages:
+        texts.append(message.content or "")
+        for call in getattr(message, "tool_calls", None) or []:
+            texts.append(call.function.name)
+            texts.append(call.function.arguments)
+
+    if tiktoken is not None:
+        encoding = _encoding(model)
+        content_tokens = sum(len(encoding.encode(text)) for text in texts)
+    else:
+        content_tokens = sum(len(text) for text in texts) // 4
+    return content_tokens + MESSAGE_OVERHEAD_TOKENS * len(messages)
+
+
+def split_turns(messages: List[BaseMessage]) -> Tuple[List[BaseMessage], List[List[BaseMessage]]]:
+    """
+    Split a conversation into its leading system messages and its turns.
+
+    A turn starts with a user message and holds every assistant and tool message
+    that follows it, so an assistant's tool calls always stay in the same turn as
+    their tool results.
+    """
+    head: List[BaseMessage] = []
+    turns: List[List[BaseMessage]] = []
+    for message in messages:
+        if isinstance(message, UserMessage) or (turns == [] and not isinstance(message, SystemMessage)):
+            turns.append([message])
+        elif turns:
+            turns[-1].append(message)
+        else:
+            head.append(message)
+    return head, turns
+
+
+class ContextPolicy(ABC):
+    """
+    Decides which part of a conversation is sent to the model.
+
+    Policies keep the leading system messages and drop or condense whole turns,
+    oldest first, so tool calls are never separated from their results.
+
+    Example:
+        >>> agent = Agent(model_name="gpt-4o-mini", instructions="...",
+        ...               context_policy=TokenBudget(max_tokens=4000))
+    """
+
+    @abstractmethod
+    def apply(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """Return the messages to keep"""
+
+
+class LastTurns(ContextPolicy):
+    """Keep the system messages and the last `turns` turns"""
+
+    def __init__(self, turns: int):
+        if turns < 1:
+            raise ValueError("LastTurns must keep at least one turn")
+        self.turns = turns
+
+    def __repr__(self):
+        return f"LastTurns({self.turns})"
+
+    def apply(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        head, turns = split_turns(messages)
+        return head + [message for turn in turns[-self.turns:] for message in turn]
+
+
+class TokenBudget(ContextPolicy):
+    """
+    Keep as many recent turns as fit in `max_tokens`.
+
+    The system messages and the latest turn are always kept, even if they alone
+    exceed the budget.
+    """
+
+    def __init__(self, max_tokens: int, model: str = "gpt-4o-mini"):
+        self.max_tokens = max_tokens
+        self.model = model
+
+    def __repr__(self):
+        return f"TokenBudget({self.max_tokens}, model='{self.model}')"
+
+    def apply(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        head, turns = split_turns(messages)
+        used = count_tokens(head, self.model)
+
+        kept: List[List[BaseMessage]] = []
+        for turn in reversed(turns):
+            cost = count_tokens(turn, self.model)
+            if kept and used + cost > self.max_tokens:
+                break
+            kept.append(turn)
+            used += cost
+        return head + [message for turn in reversed(kept) for message in turn]
+
+
+class SummarizeOlderTurns(ContextPolicy):
+    """
+    Keep the last `keep_turns` turns and replace older ones with a summary.
+
+    The summary is a system message placed after the instructions. When more
+    turns age out later, they are folded into the existing summary, so each turn
+    is summarized once. Summaries are cached by the messages they cover.
+
+    Args:
+        llm: Model used to write the summaries, typically a cheap one
+        keep_turns: Number of recent turns kept verbatim
+        max_summary_words: Length guideline given to the summarizer
+    """
+
+    SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+    def __init__(self, llm: "LLM", keep_turns: int = 4, max_summary_words: int = 150):
+        self.llm = llm
+        self.keep_turns = keep_turns
+        self.max_summary_words = max_summary_words
+        self._summaries = LRUCache(maxsize=256)
+
+    def __repr__(self):
+        return f"SummarizeOlderTurns(keep_turns={self.keep_turns})"
+
+    def apply(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        head, turns = split_turns(messages)
+        if len(turns) <= self.keep_turns:
+            return messages
+
+        summary = next(
+            (m.content for m in head if isinstance(m, SystemMessage) and m.content.startswith(self.SUMMARY_PREFIX)),
+            None,
+        )
+        head = [m for m in head if not (isinstance(m, SystemMessage) and m.content.startswith(self.SUMMARY_PREFIX))]
+
+        older = [message for turn in turns[:-self.keep_turns] for message in turn]
+        recent = [message for turn in turns[-self.keep_turns:] for message in turn]
+        summary = self._summarize(summary, older)
+        return head + [SystemMessage(content=self.SUMMARY_PREFIX + summary)] + recent
+
+    def _summarize(self, previous: Optional[str], messages: List[BaseMessage]) -> str:
+        key = fingerprint([previous, messages])
+        cached = self._summaries.get(key)
+        if cached is not MISSING:
+            return cached
+
+        lines = []
+        for message in messages:
+            if isinstance(message, AIMessage) and message.tool_calls:
+                calls = ", ".join(f"{c.function.name}({c.function.arguments})" for c in message.tool_calls)
+                lines.append(f"assistant called {calls}")
+            if message.content:
+                lines.append(f"{message.role}: {message.content}")
+        prompt = (
+            f"Summarize this conversation in at most {self.max_summary_words} words. "
+            "Keep facts, names, numbers and open questions the assistant may need later.\n\n"
+        )
+        if previous:
+            prompt += f"Earlier summary:\n{previous[len(self.SUMMARY_PREFIX):]}\n\nNew messages:\n"
+        prompt += "\n".join(lines)
+
+        summary = self.llm.invoke(prompt).content or ""
+        self._summaries.set(key, summary)
+        return summary
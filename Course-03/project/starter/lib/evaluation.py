@@ -5,6 +5,7 @@ from pydantic import BaseModel, Field
 from lib.agents import AgentState
 from lib.state_machine import Run
 from lib.llm import LLM
+from lib.caching import Cache
 from lib.messages import AIMessage, BaseMessage
 from lib.parsers import PydanticOutputParser
 
@@ -64,8 +65,13 @@ class JudgeEvaluation(BaseModel):
 class AgentEvaluator:
     """Comprehensive agent evaluation framework"""
     
-    def __init__(self):
-        self.llm_judge = LLM(model="gpt-4o-mini")
+    def __init__(self, cache: Optional[Cache] = None):
+        """
+        Args:
+            cache: Optional response cache for the judge, so repeated evaluation
+                runs don't pay for the same judgement twice
+        """
+        self.llm_judge = LLM(model="gpt-4o-mini", cache=cache)
     
     def evaluate_final_response(self, 
                           test_case: TestCase, 
@@ -249,12 +255,9 @@ class AgentEvaluator:
         if not final_state:
             return self._create_failed_evaluation("No final state found")
         
-        # Analyze the trajectory
-        actual_steps = [
-            snapshot for snapshot in run.snapshots 
-            if snapshot.step_id not in ["__entry__", "__termination__"]
-        ]
-        steps_taken = len(actual_steps)
+        # Analyze the trajectory. A retention policy may have evicted snapshots,
+        # so count every snapshot the run took; the first one is the entry step's
+        steps_taken = max(run.snapshot_total, len(run.snapshots)) - 1
         messages = final_state.get("messages", [])
         total_tokens = final_state.get("total_tokens", 0)
         
@@ -0,0 +1,163 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from collections import Counter, defaultdict, deque
+import threading
+import time
+
+from lib.state_machine import (
+    StateMachineObserver, Run, Step, Snapshot, EntryPoint, StateSchema,
+)
+
+
+class ConsoleObserver(StateMachineObserver):
+    """
+    Prints run progress to stdout, the way the StateMachine used to do by default.
+
+    Example:
+        >>> machine.add_observer(ConsoleObserver())
+    """
+
+    def on_step_end(self, run: Run, step: Step, snapshot: Optional[Snapshot], error: Optional[BaseException]):
+        if error is not None:
+            print(f"[StateMachine] Step failed: {step.step_id} ({type(error).__name__}: {error})")
+        elif isinstance(step, EntryPoint):
+            print(f"[StateMachine] Starting: {step.step_id}")
+        else:
+            print(f"[StateMachine] Executing step: {step.step_id}")
+
+    def on_transition(self, run: Run, source: str, targets: List[str]):
+        if len(targets) > 1:
+            print(f"[StateMachine] Fan-out: {targets}")
+        elif targets[0] == "__termination__":
+            print(f"[StateMachine] Terminating: {targets[0]}")
+
+
+class MetricsCollector(StateMachineObserver):
+    """
+    Records wall time, CPU time and exceptions for every step.
+
+    Each run gets its own records in `run.metrics`, and the collector also keeps
+    per-step latencies across all runs it observed, so the same instance can be
+    shared by many runs to build latency histograms. Only the last
+    `max_samples` latencies of each step are kept, so a long-lived collector
+    uses bounded memory; histograms and percentiles cover those samples.
+
+    CPU time is the thread CPU time spent between `on_step_start` and
+    `on_step_end`. For `arun` that thread is the event loop, so it also counts
+    other coroutines that ran in the meantime.
+
+    Example:
+        >>> collector = MetricsCollector()
+        >>> agent.workflow.add_observer(collector)
+        >>> run = agent.invoke("Which Mario game was the first 3D platformer?")
+        >>> run.metrics["step_totals"]["llm_processor"]["wall_time"]
+        >>> collector.histogram("tool_executor")
+    """
+
+    DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self, max_samples: int = 10_000):
+        if max_samples < 1:
+            raise ValueError("MetricsCollector needs max_samples >= 1")
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._started: Dict[Tuple[str, str, int], Tuple[float, float]] = {}
+        self._latencies: Dict[str, deque] = defaultdict(lambda: deque(maxlen=self.max_samples))
+        # Executions per step, including those whose samples were dropped
+        self._counts: Counter = Counter()
+
+    def __repr__(self):
+        return f"MetricsCollector(steps={list(self._latencies)})"
+
+    def on_run_start(self, run: Run, state: StateSchema):
+        run.metrics.setdefault("steps", [])
+        run.metrics.setdefault("errors", [])
+
+    def on_step_start(self, run: Run, step: Step, state: StateSchema):
+        key = (run.run_id, step.step_id, threading.get_ident())
+        with self._lock:
+            self._started[key] = (time.perf_counter(), time.thread_time())
+
+    def on_step_end(self, run: Run, step: Step, snapshot: Optional[Snapshot], error: Optional[BaseException]):
+        key = (run.run_id, step.step_id, threading.get_ident())
+        with self._lock:
+            started = self._started.pop(key, None)
+        if started is None:
+            return
+
+        wall_start, cpu_start = started
+        record = {
+            "step_id": step.step_id,
+            "wall_time": time.perf_counter() - wall_start,
+            "cpu_time": time.thread_time() - cpu_start,
+            "error": repr(error) if error is not None else None,
+        }
+        with self._lock:
+            run.metrics.setdefault("steps", []).append(record)
+            if error is not None:
+                run.metrics.setdefault("errors", []).append({"step_id": step.step_id, "error": repr(error)})
+            self._latencies[step.step_id].append(record["wall_time"])
+            self._counts[step.step_id] += 1
+
+    def on_run_end(self, run: Run, error: Optional[BaseException]):
+        with self._lock:
+            totals: Dict[str, Dict[str, float]] = defaultdict(lambda: {"wall_time": 0.0, "cpu_time": 0.0, "calls": 0})
+            for record in run.metrics.get("steps", []):
+                total = totals[record["step_id"]]
+                total["wall_time"] += record["wall_time"]
+                total["cpu_time"] += record["cpu_time"]
+                total["calls"] += 1
+            run.metrics["step_totals"] = dict(totals)
+            if error is not None:
+                run.metrics["run_error"] = repr(error)
+
+    def latencies(self, step_id: str) -> List[float]:
+        """The last `max_samples` wall times recorded for a step, in seconds"""
+        with self._lock:
+            return list(self._latencies.get(step_id, []))
+
+    def histogram(self, step_id: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Dict[str, int]:
+        """
+        Cumulative latency histogram for a step.
+
+        Args:
+            step_id: Step to report on
+            buckets: Upper bounds in seconds, in increasing order
+
+        Returns:
+            Dict mapping "<=bound" (and "+Inf") to the number of executions at or
+            below that bound, Prometheus-style
+        """
+        values = self.latencies(step_id)
+        histogram = {f"<={bound}": sum(1 for v in values if v <= bound) for bound in buckets}
+        histogram["+Inf"] = len(values)
+        return histogram
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Count of all executions, then mean, p50, p95, p99 and max wall time
+        over the retained samples, per step"""
+        with self._lock:
+            latencies = {step_id: sorted(values) for step_id, values in self._latencies.items()}
+            counts = dict(self._counts)
+
+        def percentile(values: List[float], q: float) -> float:
+            return values[min(len(values) - 1, int(q * len(values)))]
+
+        return {
+            step_id: {
+                "count": counts[step_id],
+                "samples": len(values),
+                "mean": sum(values) / len(values),
+                "p50": percentile(values, 0.50),
+                "p95": percentile(values, 0.95),
+                "p99": percentile(values, 0.99),
+                "max": values[-1],
+            }
+            for step_id, values in latencies.items() if values
+        }
+
+    def reset(self):
+        """Forget all latencies recorded so far"""
+        with self._lock:
+            self._latencies.clear()
+            self._counts.clear()
+            self._started.clear()
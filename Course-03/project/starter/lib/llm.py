@@ -1,6 +1,15 @@
-from typing import List, Optional, Dict, Any
+from typing import Callable, List, Optional, Dict, Any, Iterator, Sequence, Tuple, Type, Union
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import copy
+import json
+import threading
+import time
+import httpx
 from pydantic import BaseModel
-from openai import OpenAI
+from openai import OpenAI, APIConnectionError, APIStatusError, RateLimitError
+from openai.types.chat.chat_completion_message_tool_call import Function
 from lib.messages import (
     AnyMessage,
     TokenUsage,
@@ -8,7 +17,118 @@ from lib.messages import (
     BaseMessage,
     UserMessage,
 )
-from lib.tooling import Tool
+from lib.tooling import Tool, ToolCall, ToolRegistry
+from lib.caching import Cache, LRUCache, SQLiteCache, TieredCache, MISSING, fingerprint
+from lib.context import count_tokens
+from lib.ratelimit import RateLimiter, RetryPolicy
+
+
+class ClientPool:
+    """
+    Process-wide registry of OpenAI clients keyed by (api_key, base_url).
+
+    Every LLM with the same credentials shares one client and therefore one
+    HTTP connection pool, so keep-alive connections are reused across calls,
+    steps and agents. Clients are thread-safe and created lazily.
+
+    Example:
+        >>> client_pool.configure(max_connections=200)
+        >>> client = client_pool.get(api_key="sk-...", base_url="https://openai.vocareum.com/v1")
+    """
+
+    def __init__(self, max_connections: int = 100, max_keepalive_connections: int = 20):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self._clients: Dict[Tuple[Optional[str], Optional[str]], OpenAI] = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"ClientPool(clients={len(self._clients)}, max_connections={self.max_connections})"
+
+    def configure(self, max_connections: Optional[int] = None, max_keepalive_connections: Optional[int] = None):
+        """Change the pool size used for clients created from now on"""
+        with self._lock:
+            if max_connections is not None:
+                self.max_connections = max_connections
+            if max_keepalive_connections is not None:
+                self.max_keepalive_connections = max_keepalive_connections
+
+    def get(self, api_key: Optional[str] = None, base_url: Optional[str] = None) -> OpenAI:
+        """Return the shared client for these credentials, creating it on first use.
+        Without an api_key the client falls back to the OPENAI_API_KEY environment variable."""
+        key = (api_key, base_url)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+
+        with self._lock:
+            if key not in self._clients:
+                http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_keepalive_connections,
+                    ),
+                    timeout=httpx.Timeout(600.0, connect=5.0),
+                )
+                self._clients[key] = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+            return self._clients[key]
+
+    def close(self):
+        """Close every client and its connections"""
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
+
+
+client_pool = ClientPool()
+
+
+def _retry_after(error: APIStatusError) -> Optional[float]:
+    """Seconds the server asked us to wait, from the retry-after(-ms) headers"""
+    headers = error.response.headers if error.response is not None else {}
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, APIConnectionError):
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+
+def response_cache(path: Optional[str] = "llm_cache.db", maxsize: int = 1024, ttl: Optional[float] = None) -> Cache:
+    """
+    Cache for LLM responses: an in-memory LRU tier in front of a SQLite file.
+
+    Args:
+        path: SQLite file for the persistent tier, or None for memory only
+        maxsize: Number of responses kept in memory
+        ttl: Optional seconds after which a cached response is ignored
+
+    Example:
+        >>> cache = response_cache("llm_cache.db", ttl=24 * 3600)
+        >>> llm = LLM(model="gpt-4o-mini", cache=cache)
+        >>> cache.stats
+    """
+    memory = LRUCache(maxsize=maxsize, ttl=ttl)
+    if path is None:
+        return memory
+    return TieredCache([memory, SQLiteCache(path, ttl=ttl)])
 
 
 class LLM:
@@ -16,20 +136,53 @@ class LLM:
         self,
         model: str = "gpt-4o-mini",
         temperature: float = 0.0,
-        tools: Optional[List[Tool]] = None,
+        tools: Optional[List[Tool] | ToolRegistry] = None,
         api_key: Optional[str] = None,
-        base_url: Optional[str] = None
-        
+        base_url: Optional[str] = None,
+        cache: Optional[Cache] = None,
+        cache_nondeterministic: bool = False,
+        rate_limiter: Optional[RateLimiter] = None,
+        retry: Optional[RetryPolicy] = RetryPolicy(),
+        completion_tokens_estimate: int = 256,
     ):
+        """
+        Args:
+            model: Model name
+            temperature: Sampling temperature
+            tools: Tools the model may call, as a list or a shared ToolRegistry
+            api_key: Optional API key (falls back to OPENAI_API_KEY)
+            base_url: Optional API base url
+            cache: Optional response cache, keyed by a hash of the whole request
+                and the base url; see `response_cache`. Cached answers report
+                zero token usage
+            cache_nondeterministic: Also cache calls with temperature > 0, which
+                otherwise always go to the API (default: False)
+            rate_limiter: Optional limiter shared by every LLM on the same quota
+            retry: Backoff used on 429, 5xx and connection errors, or None to fail
+                on the first error
+            completion_tokens_estimate: Completion size assumed when reserving
+                tokens-per-minute budget before a request; corrected afterwards
+        """
         self.model = model
         self.temperature = temperature
-        self.client = OpenAI(api_key=api_key, base_url=base_url) if api_key else OpenAI()
-        self.tools: Dict[str, Tool] = {
-            tool.name: tool for tool in (tools or [])
-        }
+        self.cache = cache
+        self.cache_nondeterministic = cache_nondeterministic
+        self.rate_limiter = rate_limiter
+        self.retry = retry
+        self.completion_tokens_estimate = completion_tokens_estimate
+        # Retries are handled here, so the SDK must not retry as well
+        self.client = client_pool.get(api_key, base_url).with_options(max_retries=0)
+        # A registry passed in is shared, so tools registered later are seen here too
+        self.tools = tools if isinstance(tools, ToolRegistry) else ToolRegistry(tools)
 
     def register_tool(self, tool: Tool):
-        self.tools[tool.name] = tool
+        self.tools.register(tool)
+
+    def with_tools(self, tools: Optional[List[Tool] | ToolRegistry]) -> "LLM":
+        """A copy of this LLM offering `tools`; client, cache and rate limiter stay shared"""
+        clone = copy.copy(self)
+        clone.tools = tools if isinstance(tools, ToolRegistry) else ToolRegistry(tools)
+        return clone
 
     def _build_payload(self, messages: List[BaseMessage]) -> Dict[str, Any]:
         payload = {
@@ -39,7 +192,7 @@ class LLM:
         }
 
         if self.tools:
-            payload["tools"] = [tool.dict() for tool in self.tools.values()]
+            payload["tools"] = self.tools.payload()
             payload["tool_choice"] = "auto"
 
         return payload
@@ -54,6 +207,50 @@ class LLM:
         else:
             raise ValueError(f"Invalid input type {type(input)}.")
 
+    def _cache_key(self, payload: Dict[str, Any]) -> Optional[str]:
+        if self.cache is None or (self.temperature != 0 and not self.cache_nondeterministic):
+            return None
+        # The same model name behind another endpoint (a proxy, a local stub) may answer differently
+        return fingerprint({"base_url": str(self.client.base_url), **payload})
+
+    @staticmethod
+    def _from_cache(cached: AIMessage) -> AIMessage:
+        """A cached answer costs no tokens; zero its usage so callers don't count it again"""
+        return cached.model_copy(deep=True, update={"token_usage": TokenUsage()})
+
+    def _send(self, create: Callable, payload: Dict[str, Any], messages: List[BaseMessage]) -> Tuple[Any, int]:
+        """Send a request through the rate limiter, retrying transient errors.
+        Returns the response and the number of tokens reserved for it."""
+        estimated = 0
+        if self.rate_limiter is not None and self.rate_limiter.tokens is not None:
+            estimated = count_tokens(messages, self.model) + self.completion_tokens_estimate
+
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(estimated)
+            try:
+                return create(**payload), estimated
+            except (APIStatusError, APIConnectionError) as e:
+                if self.retry is None or attempt >= self.retry.max_retries or not _is_retryable(e):
+                    raise
+                retry_after = _retry_after(e) if isinstance(e, APIStatusError) else None
+                delay = self.retry.delay(attempt, retry_after)
+                attempt += 1
+                if self.rate_limiter is None:
+                    time.sleep(delay)
+                    continue
+                # The rejected request used nothing; a 429 holds back every agent on this limiter
+                self.rate_limiter.settle(estimated, 0)
+                if isinstance(e, RateLimitError):
+                    self.rate_limiter.pause(delay)
+                else:
+                    time.sleep(delay)
+
+    def _settle(self, estimated: int, token_usage: Optional[TokenUsage]):
+        if self.rate_limiter is not None and token_usage is not None:
+            self.rate_limiter.settle(estimated, token_usage.total_tokens)
+
     def invoke(self, 
                input: str | BaseMessage | List[BaseMessage],
                response_format: BaseModel = None,) -> AIMessage:
@@ -61,9 +258,18 @@ class LLM:
         payload = self._build_payload(messages)
         if response_format:
             payload.update({"response_format": response_format})
-            response = self.client.beta.chat.completions.parse(**payload)
+
+        cache_key = self._cache_key(payload)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not MISSING:
+                return self._from_cache(cached)
+
+        if response_format:
+            create = self.client.beta.chat.completions.parse
         else:
-            response = self.client.chat.completions.create(**payload)
+            create = self.client.chat.completions.create
+        response, estimated = self._send(create, payload, messages)
         choice = response.choices[0]
         message = choice.message
 
@@ -74,9 +280,207 @@ class LLM:
                 completion_tokens=response.usage.completion_tokens,
                 total_tokens=response.usage.total_tokens
             )
+        self._settle(estimated, token_usage)
 
-        return AIMessage(
+        ai_message = AIMessage(
             content=message.content,
             tool_calls=message.tool_calls,
             token_usage=token_usage
         )
+        if cache_key is not None:
+            self.cache.set(cache_key, ai_message)
+        return ai_message
+
+    def stream(self, input: str | BaseMessage | List[BaseMessage]) -> Iterator[Union[str, AIMessage]]:
+        """
+        Stream a completion as it is generated.
+
+        Yields each content delta as a string as soon as it arrives, then the
+        complete AIMessage as the last item. Tool call deltas are assembled into
+        ToolCall objects on that message, and its token usage is filled in when
+        the server reports it.
+
+        Example:
+            >>> for chunk in llm.stream("Tell me about Pokémon Gold"):
+            ...     if isinstance(chunk, str):
+            ...         print(chunk, end="", flush=True)
+            ...     else:
+            ...         message = chunk
+        """
+        messages = self._convert_input(input)
+        payload = self._build_payload(messages)
+
+        cache_key = self._cache_key(payload)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not MISSING:
+                if cached.content:
+                    yield cached.content
+                yield self._from_cache(cached)
+                return
+
+        payload.update({"stream": True, "stream_options": {"include_usage": True}})
+        response, estimated = self._send(self.client.chat.completions.create, payload, messages)
+
+        content_parts: List[str] = []
+        tool_call_parts: Dict[int, Dict[str, str]] = {}
+        token_usage = None
+        for chunk in response:
+            if chunk.usage:
+                token_usage = TokenUsage(
+                    prompt_tokens=chunk.usage.prompt_tokens,
+                    completion_tokens=chunk.usage.completion_tokens,
+                    total_tokens=chunk.usage.total_tokens
+                )
+            if not chunk.choices:
+                continue
+
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content_parts.append(delta.content)
+                yield delta.content
+            # Tool calls arrive in fragments: the id and name first, then the arguments
+            for fragment in delta.tool_calls or []:
+                parts = tool_call_parts.setdefault(fragment.index, {"id": "", "name": "", "arguments": ""})
+                if fragment.id:
+                    parts["id"] = fragment.id
+                if fragment.function:
+                    parts["name"] += fragment.function.name or ""
+                    parts["arguments"] += fragment.function.arguments or ""
+
+        tool_calls = [
+            ToolCall(
+                id=parts["id"],
+                type="function",
+                function=Function(name=parts["name"], arguments=parts["arguments"]),
+            )
+            for _, parts in sorted(tool_call_parts.items())
+        ]
+        self._settle(estimated, token_usage)
+
+        ai_message = AIMessage(
+            content="".join(content_parts) if content_parts else None,
+            tool_calls=tool_calls or None,
+            token_usage=token_usage
+        )
+        if cache_key is not None:
+            self.cache.set(cache_key, ai_message)
+        yield ai_message
+
+    def batch(self,
+              inputs: Sequence[str | BaseMessage | List[BaseMessage]],
+              max_concurrency: int = 8,
+              response_format: BaseModel = None) -> List[Union[AIMessage, Exception]]:
+        """
+        Invoke the model on many independent inputs concurrently.
+
+        Requests go through the same cache, rate limiter and retries as `invoke`.
+        For large offline jobs, see `write_batch_file`.
+
+        Args:
+            inputs: Prompts, each anything `invoke` accepts
+            max_concurrency: Maximum number of requests in flight
+            response_format: Optional structured output model used for every input
+
+        Returns:
+            One entry per input, in input order: the AIMessage, or the exception
+            raised for that input
+
+        Example:
+            >>> results = llm.batch([f"Classify: {review}" for review in reviews], max_concurrency=16)
+            >>> failed = [r for r in results if isinstance(r, Exception)]
+        """
+        def call(input):
+            try:
+                return self.invoke(input, response_format=response_format)
+            except Exception as e:
+                return e
+
+        if not inputs:
+            return []
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(inputs))) as executor:
+            return list(executor.map(call, inputs))
+
+    def write_batch_file(self,
+                         inputs: Sequence[str | BaseMessage | List[BaseMessage]],
+                         path: str,
+                         response_format: Type[BaseModel] = None,
+                         custom_id_prefix: str = "request") -> List[str]:
+        """
+        Write the requests for `inputs` as a JSONL file for the OpenAI Batch API.
+
+        Each line holds one chat completion request with the same model,
+        temperature and tools `invoke` would use. Upload the file with
+        `purpose="batch"` and read the output back with `read_batch_results`.
+
+        Returns:
+            The custom_id of each input, in input order
+        """
+        custom_ids = []
+        with open(path, "w", encoding="utf-8") as f:
+            for i, input in enumerate(inputs):
+                payload = self._build_payload(self._convert_input(input))
+                for message in payload["messages"]:
+                    message.pop("token_usage", None)
+                if response_format:
+                    payload["response_format"] = {
+                        "type": "json_schema",
+                        "json_schema": {
+                            "name": response_format.__name__,
+                            "schema": response_format.model_json_schema(),
+                        },
+                    }
+
+                custom_id = f"{custom_id_prefix}-{i}"
+                request = {
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": payload,
+                }
+                f.write(json.dumps(request, default=lambda o: o.model_dump(mode="json", exclude_none=True)) + "\n")
+                custom_ids.append(custom_id)
+        return custom_ids
+
+    @staticmethod
+    def read_batch_results(path: str, custom_ids: Sequence[str]) -> List[Union[AIMessage, Exception]]:
+        """
+        Read the output file of an OpenAI batch job.
+
+        Args:
+            path: Downloaded output (or error) file of the batch
+            custom_ids: Ids returned by `write_batch_file`, giving the result order
+
+        Returns:
+            One entry per custom_id: the AIMessage, or a RuntimeError for requests
+            that failed or are missing from the file
+        """
+        lines: Dict[str, dict] = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    lines[record["custom_id"]] = record
+
+        results: List[Union[AIMessage, Exception]] = []
+        for custom_id in custom_ids:
+            record = lines.get(custom_id)
+            response = (record or {}).get("response") or {}
+            if record is None or record.get("error") or response.get("status_code") != 200:
+                error = (record or {}).get("error") or response.get("body", {}).get("error") or "missing from batch output"
+                results.append(RuntimeError(f"Batch request '{custom_id}' failed: {error}"))
+                continue
+
+            body = response["body"]
+            message = body["choices"][0]["message"]
+            usage = body.get("usage")
+            results.append(AIMessage(
+                content=message.get("content"),
+                tool_calls=[ToolCall(**call) for call in message.get("tool_calls") or []] or None,
+                token_usage=TokenUsage(
+                    prompt_tokens=usage["prompt_tokens"],
+                    completion_tokens=usage["completion_tokens"],
+                    total_tokens=usage["total_tokens"]
+                ) if usage else None
+            ))
+        return results
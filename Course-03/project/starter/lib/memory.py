@@ -1,7 +1,15 @@
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Set
+from collections import OrderedDict
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 import copy
+import pickle
+import queue
+import sqlite3
+import threading
+import time
+import weakref
+import zlib
 
 from lib.documents import Document, Corpus
 from lib.vector_db import VectorStoreManager,QueryResult
@@ -73,8 +81,17 @@ class ShortTermMemory():
         if session_id not in self.sessions:
             raise SessionNotFoundError(f"Session '{session_id}' not found")
 
+    @staticmethod
+    def _share(object: Any) -> Any:
+        """Frozen objects are shared as is; anything else is copied so callers
+        can't change what is stored"""
+        return object if getattr(object, "frozen", False) else copy.deepcopy(object)
+
     def add(self, object: Any, session_id: Optional[str] = None):
         """Add a new object to the history
+
+        Objects with a `freeze()` method, like Run, are frozen and stored without
+        copying. Other objects are deep-copied.
         
         Args:
             object: Object to add to history
@@ -85,10 +102,15 @@ class ShortTermMemory():
         """
         session_id = session_id or "default"
         self._validate_session(session_id)
-        self.sessions[session_id].append(copy.deepcopy(object))
+        if callable(getattr(object, "freeze", None)):
+            object.freeze()
+        self.sessions[session_id].append(self._share(object))
 
     def get_all_objects(self, session_id: Optional[str] = None) -> List[Any]:
         """Get all objects for a session
+
+        Frozen objects are returned without copying; use `snapshot` for copies
+        that are fully isolated from the memory.
         
         Args:
             session_id: Optional session ID (uses default if None)
@@ -101,10 +123,10 @@ class ShortTermMemory():
         """
         session_id = session_id or "default"
         self._validate_session(session_id)
-        return [copy.deepcopy(obj) for obj in self.sessions[session_id]]
+        return [self._share(obj) for obj in self.sessions[session_id]]
 
     def get_last_object(self, session_id: Optional[str] = None) -> Optional[Any]:
-        """Get the most recent object for a session
+        """Get the most recent object for a session, in O(1) for frozen objects
         
         Args:
             session_id: Optional session ID (uses default if None)
@@ -115,8 +137,26 @@ class ShortTermMemory():
         Raises:
             SessionNotFoundError: If specified session doesn't exist
         """
-        objects = self.get_all_objects(session_id)
-        return objects[-1] if objects else None
+        session_id = session_id or "default"
+        self._validate_session(session_id)
+        objects = self.sessions[session_id]
+        return self._share(objects[-1]) if objects else None
+
+    def snapshot(self, session_id: Optional[str] = None) -> List[Any]:
+        """Get deep copies of all objects for a session, isolated from the memory
+        
+        Args:
+            session_id: Optional session ID (uses default if None)
+            
+        Returns:
+            List of copied objects in the session
+            
+        Raises:
+            SessionNotFoundError: If specified session doesn't exist
+        """
+        session_id = session_id or "default"
+        self._validate_session(session_id)
+        return copy.deepcopy(self.sessions[session_id])
 
     def get_all_sessions(self) -> List[str]:
         """Get all session IDs"""
@@ -158,6 +198,261 @@ class ShortTermMemory():
             return None
         return self.sessions[session_id].pop()
 
+class SQLiteShortTermMemory(ShortTermMemory):
+    """
+    ShortTermMemory persisted in a local SQLite file.
+
+    Objects are pickled and zlib-compressed, one row each, so conversations
+    survive restarts. Only recently used sessions are kept in memory: beyond
+    `max_loaded_sessions` the least recently used one is dropped from memory
+    (not from disk). Sessions load lazily; `get_last_object` reads just the
+    latest object, older ones load on `get_all_objects`. A session idle for
+    more than `ttl` seconds expires and is deleted.
+
+    Expiry runs as a sweep at most every `expire_interval` seconds, so a session
+    may outlive its TTL by up to that long. Reads don't write to the database:
+    access times are kept in memory and written back in one batch per sweep.
+
+    Stored objects must be picklable; for a Run this means its retention policy
+    must not spill to an open checkpoint store.
+
+    Example:
+        >>> agent.memory = SQLiteShortTermMemory("sessions.db", ttl=24 * 3600, max_loaded_sessions=256)
+    """
+
+    def __init__(self, path: str = "short_term_memory.db", ttl: Optional[float] = None,
+                 max_loaded_sessions: int = 128, compression_level: int = 6,
+                 expire_interval: Optional[float] = None):
+        """
+        Args:
+            path: SQLite file holding the sessions
+            ttl: Optional seconds of inactivity after which a session expires
+            max_loaded_sessions: Number of sessions kept in memory
+            compression_level: zlib level used for stored objects
+            expire_interval: Seconds between expiry sweeps and access time
+                write-backs (default: a tenth of the TTL, at most 60)
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_loaded_sessions = max_loaded_sessions
+        self.compression_level = compression_level
+        if expire_interval is None:
+            expire_interval = min(60.0, ttl / 10) if ttl else 60.0
+        self.expire_interval = expire_interval
+        # Access times not written to the database yet
+        self._pending_access: Dict[str, float] = {}
+        self._last_sweep = time.monotonic()
+        # `sessions` caches loaded sessions, most recently used last; a session
+        # not in `_complete` holds only its latest objects
+        self.sessions = OrderedDict()
+        self._complete: Set[str] = set()
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS objects (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    data BLOB NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_objects_session ON objects (session_id, seq)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_last_access ON sessions (last_access)")
+        self.create_session("default")
+
+    def __str__(self) -> str:
+        return f"SQLiteShortTermMemory('{self.path}', sessions={self.get_all_sessions()})"
+
+    def _dumps(self, object: Any) -> bytes:
+        return zlib.compress(pickle.dumps(object, protocol=pickle.HIGHEST_PROTOCOL), self.compression_level)
+
+    @staticmethod
+    def _loads(data: bytes) -> Any:
+        return pickle.loads(zlib.decompress(data))
+
+    def _expire(self, force: bool = False):
+        """Write back pending access times, then delete sessions idle for longer
+        than the TTL; the default session is emptied instead. Does nothing if the
+        last sweep was less than `expire_interval` seconds ago, unless forced."""
+        now = time.monotonic()
+        if not force and now - self._last_sweep < self.expire_interval:
+            return
+        self._last_sweep = now
+        self._flush_access()
+        if self.ttl is None:
+            return
+        cutoff = time.time() - self.ttl
+        with self._conn:
+            expired = [row[0] for row in self._conn.execute(
+                "SELECT session_id FROM sessions WHERE last_access < ?", (cutoff,)
+            )]
+            for session_id in expired:
+                self._conn.execute("DELETE FROM objects WHERE session_id = ?", (session_id,))
+                if session_id == "default":
+                    self._conn.execute("UPDATE sessions SET last_access = ? WHERE session_id = ?", (time.time(), session_id))
+                else:
+                    self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        for session_id in expired:
+            self._forget(session_id)
+
+    def _forget(self, session_id: str):
+        self.sessions.pop(session_id, None)
+        self._complete.discard(session_id)
+        self._pending_access.pop(session_id, None)
+
+    def _touch(self, session_id: str):
+        self._pending_access[session_id] = time.time()
+
+    def _flush_access(self):
+        if not self._pending_access:
+            return
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE sessions SET last_access = ? WHERE session_id = ?",
+                [(accessed, session_id) for session_id, accessed in self._pending_access.items()],
+            )
+        self._pending_access.clear()
+
+    def _cache(self, session_id: str, objects: List[Any], complete: bool):
+        self.sessions[session_id] = objects
+        self.sessions.move_to_end(session_id)
+        if complete:
+            self._complete.add(session_id)
+        while len(self.sessions) > self.max_loaded_sessions:
+            evicted, _ = self.sessions.popitem(last=False)
+            self._complete.discard(evicted)
+
+    def create_session(self, session_id: str) -> bool:
+        with self._lock:
+            self._expire()
+            if session_id in self.sessions:
+                # Called on every Agent turn; a loaded session exists already
+                return False
+            with self._conn:
+                created = self._conn.execute(
+                    "INSERT OR IGNORE INTO sessions (session_id, last_access) VALUES (?, ?)",
+                    (session_id, time.time()),
+                ).rowcount == 1
+            if created:
+                self._cache(session_id, [], complete=True)
+            return created
+
+    def delete_session(self, session_id: str) -> bool:
+        if session_id == "default":
+            raise ValueError("Cannot delete the default session")
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM objects WHERE session_id = ?", (session_id,))
+            deleted = self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,)).rowcount == 1
+            self._forget(session_id)
+            return deleted
+
+    def _validate_session(self, session_id: str):
+        self._expire()
+        if session_id in self.sessions:
+            return
+        row = self._conn.execute("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            raise SessionNotFoundError(f"Session '{session_id}' not found")
+
+    def add(self, object: Any, session_id: Optional[str] = None):
+        session_id = session_id or "default"
+        if callable(getattr(object, "freeze", None)):
+            object.freeze()
+        data = self._dumps(object)
+        with self._lock:
+            self._validate_session(session_id)
+            with self._conn:
+                self._conn.execute("INSERT INTO objects (session_id, data) VALUES (?, ?)", (session_id, data))
+                # Written with the object, in the same commit
+                self._conn.execute("UPDATE sessions SET last_access = ? WHERE session_id = ?", (time.time(), session_id))
+            self._pending_access.pop(session_id, None)
+            if session_id in self.sessions:
+                self.sessions[session_id].append(self._share(object))
+                self.sessions.move_to_end(session_id)
+            else:
+                self._cache(session_id, [self._share(object)], complete=False)
+
+    def get_all_objects(self, session_id: Optional[str] = None) -> List[Any]:
+        session_id = session_id or "default"
+        with self._lock:
+            self._validate_session(session_id)
+            if session_id not in self._complete:
+                rows = self._conn.execute(
+                    "SELECT data FROM objects WHERE session_id = ? ORDER BY seq", (session_id,)
+                ).fetchall()
+                self._cache(session_id, [self._loads(row[0]) for row in rows], complete=True)
+            self._touch(session_id)
+            self.sessions.move_to_end(session_id)
+            return [self._share(obj) for obj in self.sessions[session_id]]
+
+    def get_last_object(self, session_id: Optional[str] = None) -> Optional[Any]:
+        session_id = session_id or "default"
+        with self._lock:
+            self._validate_session(session_id)
+            if session_id not in self.sessions:
+                row = self._conn.execute(
+                    "SELECT data FROM objects WHERE session_id = ? ORDER BY seq DESC LIMIT 1", (session_id,)
+                ).fetchone()
+                if row is None:
+                    self._cache(session_id, [], complete=True)
+                else:
+                    self._cache(session_id, [self._loads(row[0])], complete=False)
+            self._touch(session_id)
+            self.sessions.move_to_end(session_id)
+            objects = self.sessions[session_id]
+            return self._share(objects[-1]) if objects else None
+
+    def snapshot(self, session_id: Optional[str] = None) -> List[Any]:
+        return copy.deepcopy(self.get_all_objects(session_id))
+
+    def get_all_sessions(self) -> List[str]:
+        with self._lock:
+            self._expire()
+            return [row[0] for row in self._conn.execute("SELECT session_id FROM sessions ORDER BY rowid")]
+
+    def reset(self, session_id: Optional[str] = None):
+        with self._lock:
+            if session_id is None:
+                with self._conn:
+                    self._conn.execute("DELETE FROM objects")
+                for sid in self.get_all_sessions():
+                    self._cache(sid, [], complete=True)
+            else:
+                self._validate_session(session_id)
+                with self._conn:
+                    self._conn.execute("DELETE FROM objects WHERE session_id = ?", (session_id,))
+                self._cache(session_id, [], complete=True)
+
+    def pop(self, session_id: Optional[str] = None) -> Optional[Any]:
+        session_id = session_id or "default"
+        with self._lock:
+            self._validate_session(session_id)
+            row = self._conn.execute(
+                "SELECT seq, data FROM objects WHERE session_id = ? ORDER BY seq DESC LIMIT 1", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            with self._conn:
+                self._conn.execute("DELETE FROM objects WHERE seq = ?", (row[0],))
+            if session_id in self._complete:
+                return self.sessions[session_id].pop()
+            # Only the tail was loaded; load again lazily next time
+            self._forget(session_id)
+            return self._loads(row[1])
+
+    def close(self):
+        with self._lock:
+            self._flush_access()
+            self._conn.close()
+
+
 @dataclass
 class MemoryFragment:
     """
@@ -178,6 +473,31 @@ class MemoryFragment:
     timestamp: int = field(default_factory=lambda: int(datetime.now().timestamp()))
 
 
+@dataclass
+class NamespaceStats:
+    """
+    Index entry summarizing the memories of one owner in one namespace.
+    
+    Attributes:
+        owner (str): User identifier
+        namespace (str): Namespace identifier
+        count (int): Number of memory fragments stored
+        first_timestamp (int): Oldest fragment timestamp
+        last_timestamp (int): Newest fragment timestamp
+    """
+    owner: str
+    namespace: str
+    count: int = 0
+    first_timestamp: Optional[int] = None
+    last_timestamp: Optional[int] = None
+
+    def add(self, timestamp: Optional[int]):
+        self.count += 1
+        if timestamp is not None:
+            self.first_timestamp = timestamp if self.first_timestamp is None else min(self.first_timestamp, timestamp)
+            self.last_timestamp = timestamp if self.last_timestamp is None else max(self.last_timestamp, timestamp)
+
+
 @dataclass
 class MemorySearchResult:
     """
@@ -208,6 +528,15 @@ class TimestampFilter:
     greater_than_value: int = None
     lower_than_value: int = None
 
+_STOP = object()
+
+
+def _stop_write_worker(documents_queue:queue.Queue, worker:threading.Thread):
+    """Let the worker drain the queue, then end it"""
+    documents_queue.put(_STOP)
+    worker.join()
+
+
 class LongTermMemory:
     """
     Manages persistent memory storage and retrieval using vector embeddings.
@@ -221,23 +550,97 @@ class LongTermMemory:
     - Namespace-based organization
     - Time-based filtering
     - Semantic similarity search
+    - Batched writes, optionally flushed by a background thread
+
+    With `background_writes=True`, `register_many` only queues the fragments and
+    returns; a worker thread embeds and stores them, and `flush` waits until
+    everything queued so far is searchable. `close` stops the worker after the
+    queue is drained; use the memory as a context manager to close it reliably.
+    Writes still queued at interpreter exit are drained then as well.
+
+    Example:
+        >>> with LongTermMemory(db, background_writes=True) as memory:
+        ...     memory.register_many(fragments)
     """
-    def __init__(self, db:VectorStoreManager):
+    def __init__(self, db:VectorStoreManager, batch_size:int=100,
+                 max_batch_tokens:int=100_000, background_writes:bool=False):
         self.vector_store = db.create_store("long_term_memory", force=True)
-
-    def get_namespaces(self) -> List[str]:
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self._queue: Optional[queue.Queue] = None
+        self._errors: List[Exception] = []
+        self._errors_lock = threading.Lock()
+        # Owner/namespace index kept in step with the writes, so listing never
+        # scans the collection. The store is recreated empty above, so the
+        # index starts empty too.
+        self._index: Dict[tuple, NamespaceStats] = {}
+        self._index_lock = threading.Lock()
+        self._stop_worker = None
+        if background_writes:
+            self._queue = queue.Queue()
+            worker = threading.Thread(target=self._write_worker, args=(self._queue,),
+                                      name="long-term-memory-writer", daemon=True)
+            worker.start()
+            # Also runs at exit, before daemon threads are killed, so queued writes aren't lost
+            self._stop_worker = weakref.finalize(self, _stop_write_worker, self._queue, worker)
+
+    def __enter__(self) -> "LongTermMemory":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.close()
+        except Exception:
+            # Don't hide the error that ended the block
+            if exc_type is None:
+                raise
+
+    def get_namespaces(self, owner:Optional[str]=None) -> List[str]:
         """
         Retrieve all unique namespaces currently stored in memory.
         
         Useful for understanding how memories are organized and for
-        administrative purposes.
+        administrative purposes. Served from the in-memory index, so the cost
+        depends on the number of namespaces, not on the number of memories.
+        
+        Args:
+            owner (Optional[str]): Only list namespaces holding memories of this owner
         
         Returns:
             List[str]: List of unique namespace identifiers
         """
-        results = self.vector_store.get()
-        namespaces = [r["metadatas"][0]["namespace"] for r in results]
-        return namespaces
+        return sorted({stats.namespace for stats in self.get_namespace_stats(owner=owner)})
+
+    def get_owners(self, namespace:Optional[str]=None) -> List[str]:
+        """
+        Retrieve all owners that have memories stored.
+        
+        Args:
+            namespace (Optional[str]): Only list owners with memories in this namespace
+        
+        Returns:
+            List[str]: List of unique owner identifiers
+        """
+        return sorted({stats.owner for stats in self.get_namespace_stats(namespace=namespace)})
+
+    def get_namespace_stats(self, owner:Optional[str]=None,
+                            namespace:Optional[str]=None) -> List[NamespaceStats]:
+        """
+        Fragment counts and time ranges per owner and namespace.
+        
+        Args:
+            owner (Optional[str]): Only include this owner
+            namespace (Optional[str]): Only include this namespace
+        
+        Returns:
+            List[NamespaceStats]: Copies of the matching index entries
+        """
+        with self._index_lock:
+            return [
+                copy.copy(stats) for stats in self._index.values()
+                if (owner is None or stats.owner == owner)
+                and (namespace is None or stats.namespace == namespace)
+            ]
 
     def register(self, memory_fragment:MemoryFragment, metadata:Optional[Dict[str, str]]=None):
         """
@@ -251,6 +654,64 @@ class LongTermMemory:
             memory_fragment (MemoryFragment): The memory content to store
             metadata (Optional[Dict[str, str]]): Additional metadata to associate with the memory
         """
+        document = self._to_document(memory_fragment, metadata)
+        self.vector_store.add(document)
+        self._update_index([document])
+
+    def register_many(self, memory_fragments:List[MemoryFragment],
+                      metadata:Optional[Dict[str, str]]=None):
+        """
+        Store several memory fragments with one embedding request and one write
+        per batch instead of one per fragment.
+        
+        Batches hold at most `batch_size` fragments and about `max_batch_tokens`
+        tokens. With background writes enabled the fragments are queued and this
+        returns immediately; call `flush` to wait for them.
+        
+        Args:
+            memory_fragments (List[MemoryFragment]): The memory contents to store
+            metadata (Optional[Dict[str, str]]): Additional metadata applied to every fragment
+        """
+        documents = [self._to_document(fragment, metadata) for fragment in memory_fragments]
+        if not documents:
+            return
+        if self._queue is not None:
+            self._queue.put(documents)
+        else:
+            self._write(documents)
+
+    def flush(self):
+        """
+        Block until every queued fragment has been stored.
+        
+        Raises:
+            Exception: The first error raised by a background write since the last flush
+        """
+        if self._queue is not None:
+            self._queue.join()
+        self._raise_write_errors()
+
+    def close(self):
+        """
+        Flush queued fragments and stop the background worker. Later calls to
+        `register_many` write synchronously. Closing twice is harmless.
+        
+        Raises:
+            Exception: The first error raised by a background write since the last flush
+        """
+        if self._stop_worker is not None:
+            self._stop_worker()
+            self._queue = None
+        self._raise_write_errors()
+
+    def _raise_write_errors(self):
+        with self._errors_lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            raise errors[0]
+
+    def _to_document(self, memory_fragment:MemoryFragment,
+                     metadata:Optional[Dict[str, str]]=None) -> Document:
         complete_metadata = {
             "owner": memory_fragment.owner,
             "namespace": memory_fragment.namespace,
@@ -258,13 +719,48 @@ class LongTermMemory:
         }
         if metadata:
             complete_metadata.update(metadata)
-
-        self.vector_store.add(
-            Document(
-                content=memory_fragment.content,
-                metadata=complete_metadata,
-            )
-        )
+        return Document(content=memory_fragment.content, metadata=complete_metadata)
+
+    def _batches(self, documents:List[Document]):
+        batch, tokens = [], 0
+        for document in documents:
+            # Rough estimate (about four characters per token) is enough to stay under the limit
+            size = len(document.content) // 4 + 1
+            if batch and (len(batch) >= self.batch_size or tokens + size > self.max_batch_tokens):
+                yield batch
+                batch, tokens = [], 0
+            batch.append(document)
+            tokens += size
+        if batch:
+            yield batch
+
+    def _write(self, documents:List[Document]):
+        for batch in self._batches(documents):
+            self.vector_store.add(batch)
+            self._update_index(batch)
+
+    def _update_index(self, documents:List[Document]):
+        with self._index_lock:
+            for document in documents:
+                owner = document.metadata["owner"]
+                namespace = document.metadata["namespace"]
+                stats = self._index.get((owner, namespace))
+                if stats is None:
+                    stats = self._index[(owner, namespace)] = NamespaceStats(owner=owner, namespace=namespace)
+                stats.add(document.metadata.get("timestamp"))
+
+    def _write_worker(self, documents_queue:queue.Queue):
+        while True:
+            documents = documents_queue.get()
+            try:
+                if documents is _STOP:
+                    return
+                self._write(documents)
+            except Exception as e:
+                with self._errors_lock:
+                    self._errors.append(e)
+            finally:
+                documents_queue.task_done()
 
     def search(self, query_text:str, owner:str, limit:int=3,
                timestamp_filter:Optional[TimestampFilter]=None, 
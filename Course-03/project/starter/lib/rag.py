@@ -85,7 +85,8 @@ class RAG:
         # Create steps
         entry = EntryPoint[RAGState]()
         retrieve = Step[RAGState]("retrieve", self._retrieve)
-        augment = Step[RAGState]("augment", self._augment)
+        # Prompt building only depends on the question and the retrieved documents
+        augment = Step[RAGState]("augment", self._augment, pure=True, reads=["question", "documents"])
         generate = Step[RAGState]("generate", self._generate)
         termination = Termination[RAGState]()
 
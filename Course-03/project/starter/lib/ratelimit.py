@@ -0,0 +1,134 @@
+from typing import Optional
+from dataclasses import dataclass
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket holding up to `capacity` tokens, refilled
+    continuously at `capacity` per `period` seconds.
+
+    `acquire` blocks until enough tokens are available. A request larger than the
+    whole bucket waits for a full bucket and then drives it negative, so it is
+    never starved. `adjust` settles the difference once the real cost of a
+    request is known.
+    """
+
+    def __init__(self, capacity: float, period: float = 60.0):
+        if capacity <= 0:
+            raise ValueError("TokenBucket capacity must be positive")
+        self.capacity = capacity
+        self.rate = capacity / period
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"TokenBucket(capacity={self.capacity}, available={self.available:.1f})"
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens could be taken (0 if available now)"""
+        with self._lock:
+            self._refill()
+            needed = min(amount, self.capacity) - self._tokens
+            return max(0.0, needed / self.rate)
+
+    def try_acquire(self, amount: float) -> bool:
+        with self._lock:
+            self._refill()
+            if self._tokens >= min(amount, self.capacity):
+                self._tokens -= amount
+                return True
+            return False
+
+    def acquire(self, amount: float = 1):
+        while not self.try_acquire(amount):
+            time.sleep(self.wait_time(amount))
+
+    def adjust(self, amount: float):
+        """Take (or, when negative, return) tokens without waiting"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens - amount)
+
+
+class RateLimiter:
+    """
+    Client-side limit on requests per minute and tokens per minute.
+
+    Share one instance between every LLM that draws on the same provider quota,
+    e.g. all agents of a process, so a burst of parallel agents stays within one
+    budget. When the provider still answers 429, `pause` holds every caller
+    until the given time has passed.
+
+    Example:
+        >>> limiter = RateLimiter(requests_per_minute=500, tokens_per_minute=200_000)
+        >>> agents = [Agent(..., rate_limiter=limiter) for _ in range(8)]
+    """
+
+    def __init__(self, requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"RateLimiter(requests={self.requests}, tokens={self.tokens})"
+
+    def acquire(self, tokens: int = 0):
+        """Block until one request using about `tokens` tokens may be sent"""
+        while True:
+            with self._lock:
+                paused = self._paused_until - time.monotonic()
+            if paused > 0:
+                time.sleep(paused)
+                continue
+            # Take the tokens first: a request slot is only spent once the tokens are there
+            if self.tokens is not None and tokens:
+                self.tokens.acquire(tokens)
+            if self.requests is not None:
+                self.requests.acquire(1)
+            return
+
+    def settle(self, estimated: int, actual: int):
+        """Correct the token budget once the real usage of a request is known"""
+        if self.tokens is not None:
+            self.tokens.adjust(actual - estimated)
+
+    def pause(self, seconds: float):
+        """Stop every caller from sending requests for `seconds`"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter.
+
+    The n-th retry waits a random time between 0 and
+    min(max_delay, base_delay * 2**n) seconds, unless the server said how long to
+    wait in a Retry-After header.
+    """
+    max_retries: int = 5
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            # Small jitter so callers released together don't collide again
+            return retry_after + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
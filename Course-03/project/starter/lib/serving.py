@@ -0,0 +1,167 @@
+from typing import Any, Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+import asyncio
+import json
+
+from lib.agents import Agent
+
+
+class AgentServer:
+    """
+    Minimal asyncio HTTP/JSON server running many sessions against one Agent.
+
+    Every request is handled on the event loop with `Agent.ainvoke`; each turn
+    runs on the server's own thread pool sized by `max_workers`, which `stop`
+    shuts down. Requests for the same session are
+    processed one at a time (the Agent locks per session), different sessions
+    run concurrently up to `max_concurrency`.
+
+    Endpoints:
+        POST /invoke   {"query": "...", "session_id": "..."} ->
+                       {"session_id", "run_id", "answer", "total_tokens"}
+        GET  /health   {"status": "ok", "in_flight": n}
+
+    Example:
+        >>> server = AgentServer(agent, port=8080, max_concurrency=256)
+        >>> server.run()  # blocks; or `await server.serve()` inside a running loop
+    """
+
+    def __init__(self, agent: Agent, host: str = "127.0.0.1", port: int = 8080,
+                 max_concurrency: int = 256, max_workers: int = 64,
+                 max_body_bytes: int = 1 << 20):
+        self.agent = agent
+        self.host = host
+        self.port = port
+        self.max_workers = max_workers
+        self.max_body_bytes = max_body_bytes
+        self.in_flight = 0
+        self._limit = asyncio.Semaphore(max_concurrency)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def __repr__(self):
+        return f"AgentServer(http://{self.host}:{self.port}, in_flight={self.in_flight})"
+
+    async def start(self) -> asyncio.AbstractServer:
+        """Start listening; returns the asyncio server"""
+        # Turns run here rather than on the loop's default executor, which
+        # belongs to whoever owns the loop
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="agent-server")
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self._server
+
+    async def serve(self):
+        """Start and serve until cancelled"""
+        server = await self.start()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        """Stop listening and shut down the thread pool; running turns finish first"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown)
+
+    def run(self):
+        """Serve from a new event loop until interrupted"""
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, payload = await self._dispatch(method, path, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                self._write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except ValueError as e:
+            self._write_response(writer, HTTPStatus.BAD_REQUEST, {"error": str(e)}, keep_alive=False)
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+        try:
+            method, path, _ = request_line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise ValueError("Malformed request line")
+
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length") or 0)
+        if length > self.max_body_bytes:
+            raise ValueError(f"Body larger than {self.max_body_bytes} bytes")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), path.split("?", 1)[0], headers, body
+
+    async def _dispatch(self, method: str, path: str, body: bytes) -> Tuple[HTTPStatus, Dict[str, Any]]:
+        if path == "/health" and method == "GET":
+            return HTTPStatus.OK, {"status": "ok", "in_flight": self.in_flight}
+        if path != "/invoke":
+            return HTTPStatus.NOT_FOUND, {"error": f"Unknown path {path}"}
+        if method != "POST":
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "Use POST"}
+
+        try:
+            data = json.loads(body or b"{}")
+        except json.JSONDecodeError as e:
+            return HTTPStatus.BAD_REQUEST, {"error": f"Invalid JSON: {e}"}
+        if not isinstance(data, dict) or not isinstance(data.get("query"), str):
+            return HTTPStatus.BAD_REQUEST, {"error": "Body must be an object with a string 'query'"}
+        session_id = data.get("session_id") or "default"
+
+        async with self._limit:
+            self.in_flight += 1
+            try:
+                run = await self.agent.ainvoke(data["query"], session_id, executor=self._executor)
+            except Exception as e:
+                return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"{type(e).__name__}: {e}"}
+            finally:
+                self.in_flight -= 1
+
+        state = run.get_final_state() or {}
+        messages = state.get("messages") or []
+        return HTTPStatus.OK, {
+            "session_id": session_id,
+            "run_id": run.run_id,
+            "answer": messages[-1].content if messages else None,
+            "total_tokens": state.get("total_tokens", 0),
+        }
+
+    @staticmethod
+    def _write_response(writer: asyncio.StreamWriter, status: HTTPStatus, payload: Dict[str, Any], keep_alive: bool):
+        body = json.dumps(payload).encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            "\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
@@ -1,23 +1,125 @@
-from typing import Any, Callable, Dict, List, Optional, Union, TypeVar, Generic, cast, Type, TypedDict, get_type_hints
-from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, ClassVar, Dict, FrozenSet, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union, TypeVar, Generic, cast, Type, TypedDict, get_type_hints
+from concurrent.futures import Executor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field, replace
 from datetime import datetime
+from types import MappingProxyType
+import asyncio
+import queue
+import threading
 import uuid
-import copy
 import inspect
 
+from lib.caching import Cache, LRUCache, MISSING, fingerprint
+
+if TYPE_CHECKING:
+    from lib.checkpoints import CheckpointStore
+
 
 StateSchema = TypeVar("StateSchema")
 
+Reducer = Callable[[Any, Any], Any]
+
+
+def get_reducers(state_schema: Type[StateSchema]) -> Dict[str, Reducer]:
+    """Collect the per-field reducers declared on a TypedDict schema.
+
+    A reducer is declared by annotating a field with a callable, e.g.
+    `documents: Annotated[List[str], operator.add]`. It receives the current
+    value and the update and returns the merged value.
+    """
+    reducers = {}
+    for name, hint in get_type_hints(state_schema, include_extras=True).items():
+        for meta in getattr(hint, "__metadata__", ()):
+            if callable(meta):
+                reducers[name] = meta
+                break
+    return reducers
+
+
+@dataclass(frozen=True)
+class Overwrite:
+    """Update that replaces the value of a field with a reducer instead of being
+    merged into it, e.g. `{"messages": Overwrite(trimmed_messages)}`"""
+    value: Any
+
+
+@dataclass(frozen=True)
+class ReducedUpdate:
+    """Snapshot delta entry of a field with a reducer: the step's own update,
+    merged into the previous value again when the state is rebuilt"""
+    reducer: Reducer
+    update: Any
+
+
+def merge_state(state: Dict, update: Dict, fields, reducers: Dict[str, Reducer],
+                delta: Optional[Dict] = None) -> Dict:
+    """Return a new state with `update` applied, using reducers where declared.
+    Fields that are not part of the schema are ignored.
+
+    If `delta` is given, the changed fields are recorded in it the way a
+    Snapshot stores them: reduced fields as a ReducedUpdate, others as their
+    new value."""
+    merged = {**state}
+    for name, value in update.items():
+        if name not in fields:
+            continue
+        if isinstance(value, Overwrite):
+            merged[name] = value.value
+        elif name in reducers and name in merged:
+            merged[name] = reducers[name](merged[name], value)
+            if delta is not None:
+                delta[name] = ReducedUpdate(reducers[name], value)
+            continue
+        else:
+            merged[name] = value
+        if delta is not None:
+            delta[name] = merged[name]
+    return merged
+
+
+def accumulate_updates(updates: Dict, update: Dict, fields, reducers: Dict[str, Reducer]) -> Dict:
+    """Like `merge_state`, for the updates a parallel branch collects for its
+    Join: an Overwrite is kept, so the Join replaces the value as well."""
+    merged = {**updates}
+    for name, value in update.items():
+        if name not in fields:
+            continue
+        current = merged.get(name)
+        if isinstance(value, Overwrite) or name not in merged or name not in reducers:
+            merged[name] = value
+        elif isinstance(current, Overwrite):
+            merged[name] = Overwrite(reducers[name](current.value, value))
+        else:
+            merged[name] = reducers[name](current, value)
+    return merged
+
 @dataclass
 class Resource:
     vars: Dict[str, Any]
 
 class Step(Generic[StateSchema]):
-    def __init__(self, step_id: str, logic: Callable[[StateSchema], Dict]):
+    def __init__(self, step_id: str, logic: Callable[[StateSchema], Dict],
+                 pure: bool = False, reads: Optional[List[str]] = None,
+                 cache: Optional[Cache] = None):
+        """
+        Args:
+            step_id: Unique id of the step within its StateMachine
+            logic: Function taking (state) or (state, resource) and returning a dict of updates
+            pure: Declare that the update depends only on the state fields in `reads`
+                (the whole state if None). Results are then memoized in `cache`;
+                the resource is not part of the cache key.
+            reads: State fields the logic reads, used as the cache key; their
+                values must be supported by `lib.caching.fingerprint`
+            cache: Cache for pure steps (default: an in-memory LRUCache). Use a
+                SQLiteCache to keep results across processes.
+        """
         self.step_id = step_id
         self.logic = logic
         # Store the number of parameters the logic function expects
         self.logic_params_count = self._calculate_params_count()
+        self.pure = pure
+        self.reads = reads
+        self.cache = (cache or LRUCache()) if pure else None
 
     def __str__(self) -> str:
         return f"Step('{self.step_id}')"
@@ -34,42 +136,100 @@ class Step(Generic[StateSchema]):
             # For regular functions
             return self.logic.__code__.co_argcount
 
-    def run(self, state: StateSchema, state_schema: Type[StateSchema], resource: Resource=None) -> StateSchema:
+    @property
+    def is_async(self) -> bool:
+        return inspect.iscoroutinefunction(self.logic)
+
+    def cache_key(self, state: StateSchema) -> str:
+        """Fingerprint of the fields a pure step reads"""
+        fields = self.reads if self.reads is not None else sorted(state)
+        return fingerprint({"step": self.step_id, "reads": {name: state.get(name) for name in fields}})
+
+    def invoke(self, state: StateSchema, resource: Resource=None) -> Dict:
+        """Call the logic function and return its raw update"""
+        if self.is_async:
+            raise TypeError(f"Step '{self.step_id}' has async logic; run the workflow with `arun`")
+        if self.cache is None:
+            return self._call(state, resource)
+
+        key = self.cache_key(state)
+        result = self.cache.get(key)
+        if result is MISSING:
+            result = self._call(state, resource)
+            self.cache.set(key, result)
+        return result
+
+    async def ainvoke(self, state: StateSchema, resource: Resource=None) -> Dict:
+        """Await async logic; sync logic runs in a worker thread so it does not block the event loop"""
+        if not self.is_async:
+            return await asyncio.to_thread(self.invoke, state, resource)
+        if self.cache is None:
+            return await self._call(state, resource)
+
+        key = self.cache_key(state)
+        result = self.cache.get(key)
+        if result is MISSING:
+            result = await self._call(state, resource)
+            self.cache.set(key, result)
+        return result
+
+    def _call(self, state: StateSchema, resource: Resource=None):
         # Call logic function with appropriate number of arguments
         if self.logic_params_count == 1:
-            result = self.logic(state)
+            return self.logic(state)
         elif self.logic_params_count == 2:
-            result = self.logic(state, resource)
+            return self.logic(state, resource)
         else:
             raise ValueError(
                 f"Step '{self.step_id}' logic function must accept either 1 argument (state) "
                 f"or 2 arguments (state, resource). Found {self.logic_params_count} arguments."
             ) 
-        # Get expected fields from the TypedDict
-        expected_fields = get_type_hints(state_schema)
-        
-        # Create new state with all fields from state_schema
+
+    def run(self, state: StateSchema, state_schema: Type[StateSchema], resource: Resource=None,
+            plan: Optional["ExecutionPlan[StateSchema]"] = None) -> StateSchema:
+        """Invoke the step and apply its update to `state`.
+
+        Pass the StateMachine's compiled `plan` to reuse its schema fields and
+        reducers; without it they are read from `state_schema` on every call.
+        """
+        result = self.invoke(state, resource)
+        if plan is not None:
+            fields, reducers = plan.fields, plan.reducers
+        else:
+            fields, reducers = get_type_hints(state_schema), get_reducers(state_schema)
+
         # Only copy fields that are defined in state_schema
-        updated = {**state}
-        for field, value in result.items():
-            if field in expected_fields:
-                updated[field] = value
+        updated = merge_state(state, result, fields, reducers)
         
         return cast(StateSchema, updated)
 
 
+def _no_update(state) -> Dict:
+    """Logic of the special steps; module level so state machines can be pickled"""
+    return {}
+
+
 class EntryPoint(Step[StateSchema]):
     """Special step that marks the beginning of the workflow.
     Users should connect this step to their first business logic step."""
     def __init__(self):
-        super().__init__("__entry__", lambda x: {})
+        super().__init__("__entry__", _no_update)
 
 
 class Termination(Step[StateSchema]):
     """Special step that marks the end of the workflow.
     Users should connect their final business logic step(s) to this step."""
     def __init__(self):
-        super().__init__("__termination__", lambda x: {})
+        super().__init__("__termination__", _no_update)
+
+
+class Join(Step[StateSchema]):
+    """Special step that merges parallel branches back into a single state.
+    When a transition resolves to several targets, each target starts a branch
+    that runs on its own thread until it reaches a Join. Branch updates are then
+    merged through the schema reducers before the Join's own logic runs."""
+    def __init__(self, step_id: str, logic: Optional[Callable[[StateSchema], Dict]] = None):
+        super().__init__(step_id, logic or _no_update)
 
 
 @dataclass
@@ -87,24 +247,52 @@ class Transition(Generic[StateSchema]):
     def resolve(self, state: StateSchema) -> List[str]:
         if self.condition:
             result = self.condition(state)
-            if isinstance(result, Step):
-                return [result.step_id]
-            elif isinstance(result, list) and all(isinstance(x, Step) for x in result):
-                return [step.step_id for step in result]
-            elif isinstance(result, str):
-                return [result]
-            return result
+            if inspect.isawaitable(result):
+                result.close()
+                raise TypeError(f"{self} has an async condition; run the workflow with `arun`")
+            return self._normalize(result)
+        return self.targets
+
+    async def aresolve(self, state: StateSchema) -> List[str]:
+        """Like `resolve`, but also accepts an async condition"""
+        if self.condition:
+            result = self.condition(state)
+            if inspect.isawaitable(result):
+                result = await result
+            return self._normalize(result)
         return self.targets
 
+    @staticmethod
+    def _normalize(result) -> List[str]:
+        if isinstance(result, Step):
+            return [result.step_id]
+        elif isinstance(result, list) and all(isinstance(x, Step) for x in result):
+            return [step.step_id for step in result]
+        elif isinstance(result, str):
+            return [result]
+        return result
+
 
 @dataclass
 class Snapshot(Generic[StateSchema]):
-    """Represents a single state snapshot in time"""
+    """Represents a single state snapshot in time.
+
+    A snapshot only stores the fields its step changed (`delta`) and shares
+    everything else with its parent, so values are never copied between steps.
+    A field with a reducer stores just the step's update as a ReducedUpdate,
+    e.g. the new messages rather than the whole conversation. Every
+    KEYFRAME_INTERVAL snapshots the full state is stored again, which
+    keeps rebuilding `state_data` cheap. Step logic must therefore return new
+    values instead of mutating the state it receives in place."""
     snapshot_id: str
     timestamp: datetime
-    state_data: StateSchema
     state_schema: Type[StateSchema]
     step_id: str
+    delta: Dict[str, Any] = field(default_factory=dict)
+    parent: Optional['Snapshot[StateSchema]'] = None
+    depth: int = 0
+
+    KEYFRAME_INTERVAL: ClassVar[int] = 16
 
     def __str__(self) -> str:
         return f"Snapshot('{self.snapshot_id}') @ [{self.timestamp.strftime('%Y-%m-%d %H:%M:%S.%f')}]: {self.step_id}.State({self.state_data})"
@@ -112,18 +300,131 @@ class Snapshot(Generic[StateSchema]):
     def __repr__(self) -> str:
         return self.__str__()
 
+    @property
+    def state_data(self) -> StateSchema:
+        """The full state after this step, rebuilt from the deltas up to the last keyframe"""
+        deltas = []
+        node = self
+        while node is not None:
+            deltas.append(node.delta)
+            node = node.parent
+        state = {}
+        for delta in reversed(deltas):
+            for key, value in delta.items():
+                if isinstance(value, ReducedUpdate):
+                    value = value.reducer(state[key], value.update)
+                state[key] = value
+        return cast(StateSchema, state)
+
+    def detach(self):
+        """Turn this snapshot into a keyframe so it no longer depends on its parents"""
+        if self.parent is not None:
+            self.delta = dict(self.state_data)
+            self.parent = None
+            self.depth = 0
+
     @classmethod
     def create(cls, state_data: StateSchema, state_schema: Type[StateSchema],
-               step_id:str) -> 'Snapshot[StateSchema]':
+               step_id:str, parent: Optional['Snapshot[StateSchema]'] = None,
+               delta: Optional[Dict[str, Any]] = None) -> 'Snapshot[StateSchema]':
+        """`delta` is the change recorded by `merge_state` when `state_data` is
+        the parent's state plus one step's update. Without it the change is
+        found by comparing against the parent's state."""
+        if parent is None or parent.depth + 1 >= cls.KEYFRAME_INTERVAL:
+            # Keyframe: store the full state
+            delta, parent, depth = dict(state_data), None, 0
+        elif delta is not None:
+            depth = parent.depth + 1
+        else:
+            base = parent.state_data
+            if base.keys() - state_data.keys():
+                delta, parent, depth = dict(state_data), None, 0
+            else:
+                delta = {
+                    key: value for key, value in state_data.items()
+                    if key not in base or base[key] is not value
+                }
+                depth = parent.depth + 1
         return cls(
             snapshot_id=str(uuid.uuid4()),
             timestamp=datetime.now(),
-            state_data=state_data,
             state_schema=state_schema,
             step_id=step_id,
+            delta=delta,
+            parent=parent,
+            depth=depth,
         )
 
 
+class RetentionPolicy:
+    """Decides which snapshots a Run keeps in memory.
+
+    The most recent snapshot is always kept so `Run.get_final_state` keeps
+    working. Evicted snapshots are dropped, or written to `spill` as full-state
+    snapshots when a checkpoint store is given (don't combine a spill store with
+    a StateMachine that already checkpoints to it)."""
+
+    def __init__(self, spill: Optional["CheckpointStore"] = None):
+        self.spill = spill
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}()"
+
+    def evictions(self, retained: List[int]) -> List[int]:
+        """Given the sequence numbers of the retained snapshots, oldest first and
+        the newly added one last, return the sequence numbers to evict"""
+        return []
+
+
+class KeepAllSnapshots(RetentionPolicy):
+    """Keep every snapshot (the default)"""
+
+
+class KeepLastSnapshots(RetentionPolicy):
+    """Keep only the last `n` snapshots"""
+
+    def __init__(self, n: int, spill: Optional["CheckpointStore"] = None):
+        if n < 1:
+            raise ValueError("KeepLastSnapshots needs n >= 1")
+        super().__init__(spill)
+        self.n = n
+
+    def __repr__(self) -> str:
+        return f"KeepLastSnapshots(n={self.n})"
+
+    def evictions(self, retained: List[int]) -> List[int]:
+        return retained[:-self.n]
+
+
+class KeepFinalSnapshot(KeepLastSnapshots):
+    """Keep only the snapshot holding the final state"""
+
+    def __init__(self, spill: Optional["CheckpointStore"] = None):
+        super().__init__(1, spill)
+
+    def __repr__(self) -> str:
+        return "KeepFinalSnapshot()"
+
+
+class SampleSnapshots(RetentionPolicy):
+    """Keep every `every`-th snapshot, plus the most recent one"""
+
+    def __init__(self, every: int, spill: Optional["CheckpointStore"] = None):
+        if every < 1:
+            raise ValueError("SampleSnapshots needs every >= 1")
+        super().__init__(spill)
+        self.every = every
+
+    def __repr__(self) -> str:
+        return f"SampleSnapshots(every={self.every})"
+
+    def evictions(self, retained: List[int]) -> List[int]:
+        # Only the previous "most recent" snapshot can have become evictable
+        if len(retained) > 1 and retained[-2] % self.every:
+            return [retained[-2]]
+        return []
+
+
 @dataclass
 class Run(Generic[StateSchema]):
     """Represents a single execution run of the state machine"""
@@ -131,6 +432,19 @@ class Run(Generic[StateSchema]):
     start_timestamp: datetime
     snapshots: List[Snapshot[StateSchema]] = field(default_factory=list)
     end_timestamp: Optional[datetime] = None
+    # Filled in by observers such as `lib.instrumentation.MetricsCollector`
+    metrics: Dict[str, Any] = field(default_factory=dict)
+    # Set when the run failed, e.g. by `StateMachine.run_many(..., fail_fast=False)`
+    error: Optional[BaseException] = None
+    retention: RetentionPolicy = field(default_factory=KeepAllSnapshots)
+    # Sequence number of each retained snapshot, counting evicted ones too
+    snapshot_seqs: List[int] = field(default_factory=list)
+    snapshot_total: int = 0
+    # Set by `freeze`; a frozen run can be shared without copying
+    frozen: bool = False
+
+    # Serializes eviction when parallel branches of this run add snapshots concurrently
+    _retention_lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False, compare=False)
 
     def __str__(self) -> str:
         return f"Run('{self.run_id}')"
@@ -138,11 +452,22 @@ class Run(Generic[StateSchema]):
     def __repr__(self) -> str:
         return self.__str__()
 
+    def __getstate__(self) -> Dict[str, Any]:
+        # Runs are pickled by SQLiteShortTermMemory and returned from process pools
+        state = self.__dict__.copy()
+        state.pop("_retention_lock", None)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.update(state)
+        self._retention_lock = threading.Lock()
+
     @classmethod
-    def create(cls) -> 'Run[StateSchema]':
+    def create(cls, retention: Optional[RetentionPolicy] = None) -> 'Run[StateSchema]':
         return cls(
             run_id=str(uuid.uuid4()),
-            start_timestamp=datetime.now()
+            start_timestamp=datetime.now(),
+            retention=retention or KeepAllSnapshots(),
         )
 
     @property
@@ -150,18 +475,76 @@ class Run(Generic[StateSchema]):
         return {
             "run_id": self.run_id,
             "start_timestamp": self.start_timestamp.strftime("%Y-%m-%d %H:%M:%S.%f"),
-            "end_timestamp": self.end_timestamp.strftime("%Y-%m-%d %H:%M:%S.%f"),
-            "snapshot_counts": len(self.snapshots)
+            # None while running, and for runs that failed
+            "end_timestamp": self.end_timestamp.strftime("%Y-%m-%d %H:%M:%S.%f") if self.end_timestamp else None,
+            "snapshot_counts": len(self.snapshots),
+            "snapshot_total": self.snapshot_total,
+            "metrics": self.metrics,
         }
 
     def add_snapshot(self, snapshot: Snapshot[StateSchema]):
-        """Add a new snapshot to this run"""
-        self.snapshots.append(snapshot)
+        """Add a new snapshot to this run, evicting older ones as the retention policy asks"""
+        if self.frozen:
+            raise RuntimeError(f"{self} is frozen and cannot take new snapshots")
+        dropped: List[Snapshot[StateSchema]] = []
+        with self._retention_lock:
+            self.snapshots.append(snapshot)
+            self.snapshot_seqs.append(self.snapshot_total)
+            self.snapshot_total += 1
+
+            evicted = set(self.retention.evictions(self.snapshot_seqs))
+            if evicted:
+                dropped = self._evict(evicted)
+            elif snapshot.parent is not None and type(self.retention) is not KeepAllSnapshots:
+                # A parallel branch may build on a snapshot that another branch evicted
+                if all(kept is not snapshot.parent for kept in self.snapshots):
+                    snapshot.detach()
+
+        # Spill outside the lock so store I/O doesn't hold up the other branches
+        if self.retention.spill is not None:
+            for snapshot in dropped:
+                self.retention.spill.save_snapshot(self.run_id, snapshot)
+
+    def _evict(self, evicted: set) -> List[Snapshot[StateSchema]]:
+        """Drop the evicted snapshots; returns them as standalone full-state copies
+        when they are to be spilled"""
+        retained, retained_seqs, dropped = [], [], []
+        for seq, snapshot in zip(self.snapshot_seqs, self.snapshots):
+            if seq in evicted:
+                dropped.append(snapshot)
+            else:
+                retained.append(snapshot)
+                retained_seqs.append(seq)
+
+        # Cut delta chains that run through evicted snapshots, oldest first,
+        # so evicted snapshots can actually be freed
+        kept_ids = {id(snapshot) for snapshot in retained}
+        for snapshot in retained:
+            if snapshot.parent is not None and id(snapshot.parent) not in kept_ids:
+                snapshot.detach()
+
+        self.snapshots, self.snapshot_seqs = retained, retained_seqs
+
+        if self.retention.spill is None:
+            return []
+        return [replace(snapshot, delta=dict(snapshot.state_data), parent=None, depth=0) for snapshot in dropped]
 
     def complete(self):
         """Mark this run as complete"""
         self.end_timestamp = datetime.now()
 
+    def freeze(self) -> 'Run[StateSchema]':
+        """Make this run read-only and return it.
+
+        Snapshots become a tuple and no more can be added. Together with
+        snapshots never mutating their state (steps return new values), this lets
+        a finished run be stored and handed out without deep copies.
+        """
+        self.snapshots = tuple(self.snapshots)
+        self.snapshot_seqs = tuple(self.snapshot_seqs)
+        self.frozen = True
+        return self
+
     def get_final_state(self) -> Optional[StateSchema]:
         """Get the final state of this run"""
         if not self.snapshots:
@@ -169,16 +552,101 @@ class Run(Generic[StateSchema]):
         return self.snapshots[-1].state_data
 
 
+class StateMachineObserver(Generic[StateSchema]):
+    """Lifecycle hooks called by the StateMachine while it executes a run.
+    Subclass and override the hooks you need; the defaults do nothing.
+
+    Hooks are called synchronously on the thread executing the step, so for
+    parallel branches they may be called concurrently."""
+
+    def on_run_start(self, run: Run[StateSchema], state: StateSchema):
+        """Called once before the entry step runs (or when a run is resumed)"""
+
+    def on_step_start(self, run: Run[StateSchema], step: Step[StateSchema], state: StateSchema):
+        """Called right before a step's logic runs"""
+
+    def on_step_end(self, run: Run[StateSchema], step: Step[StateSchema],
+                    snapshot: Optional[Snapshot[StateSchema]], error: Optional[BaseException]):
+        """Called after a step finished; `snapshot` is None if the step raised `error`"""
+
+    def on_transition(self, run: Run[StateSchema], source: str, targets: List[str]):
+        """Called after transitions resolved; several targets mean a parallel fan-out"""
+
+    def on_run_end(self, run: Run[StateSchema], error: Optional[BaseException]):
+        """Called once when the run completes or fails with `error`"""
+
+
+class RunCancelled(Exception):
+    """Error of a run stopped early, e.g. because its stream was closed"""
+
+
+class _QueueObserver(StateMachineObserver[StateSchema]):
+    """Forwards snapshots, then the finished Run, to a queue's put function.
+    Once `cancelled` is set, the run fails with RunCancelled before its next step."""
+
+    def __init__(self, put: Callable[[Any], None]):
+        self.put = put
+        self.cancelled = threading.Event()
+
+    def on_step_start(self, run, step, state):
+        if self.cancelled.is_set():
+            raise RunCancelled(f"{run} was cancelled before step '{step.step_id}'")
+
+    def on_step_end(self, run, step, snapshot, error):
+        if snapshot is not None:
+            self.put(snapshot)
+
+    def on_run_end(self, run, error):
+        self.put(run)
+
+
+@dataclass(frozen=True)
+class ExecutionPlan(Generic[StateSchema]):
+    """Validated, precomputed view of a StateMachine graph, built by `StateMachine.compile`"""
+    entry_id: str
+    steps: FrozenSet[str]
+    fields: FrozenSet[str]
+    reducers: Mapping[str, Reducer]
+    dispatch: Mapping[str, Tuple[Transition[StateSchema], ...]]
+
+    def __str__(self) -> str:
+        return f"ExecutionPlan(entry='{self.entry_id}', steps={sorted(self.steps)})"
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
 class StateMachine(Generic[StateSchema]):
-    def __init__(self, state_schema: Type[StateSchema]):
+    def __init__(self, state_schema: Type[StateSchema], max_workers: Optional[int] = None,
+                 checkpointer: Optional["CheckpointStore"] = None,
+                 observers: Optional[List[StateMachineObserver[StateSchema]]] = None,
+                 retention: Optional[RetentionPolicy] = None):
         self.state_schema = state_schema
         self.steps: Dict[str, Step[StateSchema]] = {}
         self.transitions: Dict[str, List[Transition[StateSchema]]] = {}
+        # Upper bound for threads used by a single fan-out (None: one per branch)
+        self.max_workers = max_workers
+        # Optional durable store every snapshot is written to as it is produced
+        self.checkpointer = checkpointer
+        self.observers: List[StateMachineObserver[StateSchema]] = list(observers or [])
+        # Which snapshots each Run keeps in memory (default: all of them)
+        self.retention = retention
+        # Observers that only follow a single run, e.g. for `stream`
+        self._run_observers: Dict[str, List[StateMachineObserver[StateSchema]]] = {}
+        self._plan: Optional[ExecutionPlan[StateSchema]] = None
 
     def __str__(self) -> str:
         schema_keys = list(get_type_hints(self.state_schema).keys())
         return f"StateMachine(schema={schema_keys})"
 
+    def __getstate__(self) -> Dict[str, Any]:
+        # Sent to process pool workers by `run_many`: the plan is rebuilt there,
+        # and observers of in-flight runs stay in this process
+        state = self.__dict__.copy()
+        state["_plan"] = None
+        state["_run_observers"] = {}
+        return state
+
     def __repr__(self) -> str:
         return self.__str__()
 
@@ -186,6 +654,7 @@ class StateMachine(Generic[StateSchema]):
         """Add steps to the workflow"""
         for step in steps:
             self.steps[step.step_id] = step
+        self._plan = None
 
     def connect(
         self,
@@ -193,6 +662,13 @@ class StateMachine(Generic[StateSchema]):
         targets: Union[Step[StateSchema], str, List[Union[Step[StateSchema], str]]],
         condition: Optional[Callable[[StateSchema], Union[str, List[str]]]] = None
     ):
+        """Add a transition from `source`.
+
+        Without a condition every target is taken, in parallel when there are
+        several. With a condition, `targets` lists the steps it may return and
+        returning any other step fails the run. Pass `targets=[]` to let the
+        condition return any step; `compile` then assumes it may go anywhere.
+        """
         src_id = source.step_id if isinstance(source, Step) else source
         target_list = targets if isinstance(targets, list) else [targets]
         target_ids = [t.step_id if isinstance(t, Step) else t for t in target_list]
@@ -200,58 +676,555 @@ class StateMachine(Generic[StateSchema]):
         if src_id not in self.transitions:
             self.transitions[src_id] = []
         self.transitions[src_id].append(transition)
+        self._plan = None
 
-    def run(self, state: StateSchema, resource: Resource = None):
-        # Validate that state has at least one field from the schema
-        expected_fields = get_type_hints(self.state_schema)
-        state_fields = set(state.keys())
-        common_fields = state_fields.intersection(expected_fields)
-        
-        if not common_fields:
-            raise ValueError(f"Initial state must have at least one field from the schema. Expected fields: {list(expected_fields.keys())}")
+    def compile(self) -> ExecutionPlan[StateSchema]:
+        """Validate the graph and freeze everything a run needs to look up.
+
+        The plan is cached until steps or transitions change, so repeated runs
+        skip schema introspection and graph scans.
+
+        Raises:
+            Exception: If there is no EntryPoint or more than one
+            ValueError: If a transition references an unknown step, a step has an
+                unsupported signature, a step is unreachable, or the graph
+                cannot reach a Termination step
+
+        A conditional transition without declared targets counts as an edge to
+        every step, so the checks can't rule out paths it may take.
+        """
+        if self._plan is not None:
+            return self._plan
 
         entry_points = [s for s in self.steps.values() if isinstance(s, EntryPoint)]
         if not entry_points:
             raise Exception("No EntryPoint step found in workflow")
         if len(entry_points) > 1:
             raise Exception("Multiple EntryPoint steps found in workflow")
+        entry_id = entry_points[0].step_id
+
+        for source, transitions in self.transitions.items():
+            if source not in self.steps:
+                raise ValueError(f"[StateMachine] Transition from unknown step: {source}")
+            for t in transitions:
+                dangling = [target for target in t.targets if target not in self.steps]
+                if dangling:
+                    raise ValueError(f"[StateMachine] {t} points to unknown steps: {dangling}")
+
+        for step in self.steps.values():
+            if step.logic_params_count not in (1, 2):
+                raise ValueError(
+                    f"Step '{step.step_id}' logic function must accept either 1 argument (state) "
+                    f"or 2 arguments (state, resource). Found {step.logic_params_count} arguments."
+                )
+
+        successors = {
+            step_id: {
+                target
+                for t in self.transitions.get(step_id, [])
+                for target in (t.targets if t.targets or not t.condition else self.steps)
+            }
+            for step_id in self.steps
+        }
+
+        reachable = {entry_id}
+        pending = [entry_id]
+        while pending:
+            for target in successors[pending.pop()] - reachable:
+                reachable.add(target)
+                pending.append(target)
+        unreachable = set(self.steps) - reachable
+        if unreachable:
+            raise ValueError(f"[StateMachine] Steps not reachable from {entry_id}: {sorted(unreachable)}")
+
+        for step_id in reachable:
+            if not isinstance(self.steps[step_id], Termination) and not successors[step_id]:
+                raise ValueError(f"[StateMachine] No transitions found from step: {step_id}")
+
+        # Walk backwards from the Termination steps to find steps that can finish
+        terminating = {step_id for step_id, step in self.steps.items() if isinstance(step, Termination)}
+        if not terminating:
+            raise ValueError("[StateMachine] No Termination step found in workflow")
+        changed = True
+        while changed:
+            changed = False
+            for step_id, targets in successors.items():
+                if step_id not in terminating and targets & terminating:
+                    terminating.add(step_id)
+                    changed = True
+        stuck = reachable - terminating
+        if stuck:
+            raise ValueError(f"[StateMachine] Steps that can never reach a Termination step: {sorted(stuck)}")
+
+        self._plan = ExecutionPlan(
+            entry_id=entry_id,
+            steps=frozenset(self.steps),
+            fields=frozenset(get_type_hints(self.state_schema)),
+            reducers=MappingProxyType(get_reducers(self.state_schema)),
+            dispatch=MappingProxyType({
+                source: tuple(transitions) for source, transitions in self.transitions.items()
+            }),
+        )
+        return self._plan
+
+    def _get_entry_point(self, state: StateSchema) -> str:
+        plan = self.compile()
+
+        # Validate that state has at least one field from the schema
+        if not plan.fields.intersection(state.keys()):
+            raise ValueError(f"Initial state must have at least one field from the schema. Expected fields: {list(get_type_hints(self.state_schema).keys())}")
+
+        return plan.entry_id
+
+    def run(self, state: StateSchema, resource: Resource = None):
+        current_run = self._run(state, resource)
+        if current_run.error is not None:
+            raise current_run.error
+        return current_run
+
+    def _run(self, state: StateSchema, resource: Resource = None,
+             observers: Sequence[StateMachineObserver[StateSchema]] = ()) -> Run:
+        """Execute a run; failures are stored on `run.error` instead of raised.
+        `observers` only receive the hooks of this run."""
+        entry_id = self._get_entry_point(state)
         
         # Create a new run for this execution
-        current_run = Run.create()
-        
-        current_step_id = entry_points[0].step_id        
+        current_run = self._start(state, observers)
+        try:
+            self._execute(state, entry_id, resource, current_run)
+        except Exception as e:
+            self._fail(current_run, e)
+            return current_run
+
+        self._complete(current_run)
+        return current_run
+
+    def stream(self, state: StateSchema, resource: Resource = None) -> Iterator[Snapshot[StateSchema]]:
+        """Run the workflow and yield each Snapshot as soon as its step finishes.
+
+        The run executes on a background thread. Snapshots of parallel branches
+        are yielded in the order the branches produce them; `snapshot.delta`
+        holds just the fields the step changed. The finished Run is the
+        generator's return value, and a failed run re-raises its error.
+        Fields with a reducer appear in the delta as a ReducedUpdate holding
+        the step's own update.
+
+        Closing the generator early stops the run, as with `astream`: the step
+        in progress finishes in the background, then the run ends with a
+        RunCancelled error instead of starting the next step.
+
+        Example:
+            >>> for snapshot in machine.stream({"user_query": "Hi"}):
+            ...     print(snapshot.step_id, list(snapshot.delta))
+        """
+        self._get_entry_point(state)
+
+        events: queue.Queue = queue.Queue()
+        observer = _QueueObserver(events.put)
+
+        def work():
+            try:
+                self._run(state, resource, [observer])
+            except BaseException as e:
+                # Raised outside the run, e.g. by the checkpointer or an observer;
+                # there is no Run to hand back, so hand back the error
+                events.put(e)
+
+        worker = threading.Thread(target=work, daemon=True)
+        worker.start()
+
+        try:
+            while True:
+                item = events.get()
+                if isinstance(item, BaseException):
+                    worker.join()
+                    raise item
+                if isinstance(item, Run):
+                    break
+                yield item
+        finally:
+            # Only takes effect when the consumer stopped reading early
+            observer.cancelled.set()
+        worker.join()
+
+        if item.error is not None:
+            raise item.error
+        return item
+
+    async def astream(self, state: StateSchema, resource: Resource = None) -> AsyncIterator[Snapshot[StateSchema]]:
+        """Async counterpart of `stream`, built on `arun`.
+
+        Closing the generator early stops the run, as with `stream`: the
+        run's task is cancelled, including the step in progress, and the run
+        ends with a RunCancelled error.
+
+        Example:
+            >>> async for snapshot in machine.astream({"user_query": "Hi"}):
+            ...     print(snapshot.step_id)
+        """
+        self._get_entry_point(state)
+
+        events: asyncio.Queue = asyncio.Queue()
+
+        async def work():
+            try:
+                return await self._arun(state, resource, [_QueueObserver(events.put_nowait)])
+            except Exception as e:
+                events.put_nowait(e)
+                raise
+
+        task = asyncio.ensure_future(work())
+        try:
+            while True:
+                item = await events.get()
+                if isinstance(item, (Run, BaseException)):
+                    # On an error, awaiting the task below raises it
+                    break
+                yield item
+        finally:
+            if not task.done():
+                task.cancel()
+
+        current_run = await task
+        if current_run.error is not None:
+            raise current_run.error
+
+    def run_many(
+        self,
+        initial_states: Iterable[StateSchema],
+        resource: Resource = None,
+        max_workers: int = 8,
+        executor: Optional[Executor] = None,
+        fail_fast: bool = True,
+        on_progress: Optional[Callable[[int, int, Run], None]] = None,
+    ) -> Iterator[Run]:
+        """Run the workflow over many initial states on a worker pool.
 
-        while current_step_id:
-            step = self.steps[current_step_id]
+        Runs are yielded in completion order, not input order. Work starts when
+        iteration starts; closing the iterator early cancels pending runs.
+
+        Args:
+            initial_states: One initial state per run
+            resource: Resource shared by all runs
+            max_workers: Size of the thread pool created when no executor is given
+            executor: Optional executor to use instead, e.g. a ProcessPoolExecutor.
+                A process pool requires the state machine, its step logic and the
+                resource to be picklable. It is not shut down by this method.
+            fail_fast: If True, the first failing run cancels pending runs and its
+                error is raised. If False, failed runs are yielded with `run.error` set,
+                including runs whose initial state was rejected before they started.
+            on_progress: Called as `on_progress(completed, total, run)` after each run
+
+        Returns:
+            Iterator over the finished Run objects
+        """
+        states = list(initial_states)
+        own_executor = executor is None
+        executor = executor or ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = [executor.submit(self._run, state, resource) for state in states]
+            for completed, future in enumerate(as_completed(futures), start=1):
+                try:
+                    current_run = future.result()
+                except Exception as e:
+                    # E.g. an invalid initial state, rejected before a Run existed
+                    current_run = Run.create(self.retention)
+                    current_run.error = e
+                if on_progress:
+                    on_progress(completed, len(futures), current_run)
+                if current_run.error is not None and fail_fast:
+                    for pending in futures:
+                        pending.cancel()
+                    raise current_run.error
+                yield current_run
+        finally:
+            if own_executor:
+                executor.shutdown(wait=True, cancel_futures=True)
+
+    def resume(self, run_id: str, resource: Resource = None):
+        """Continue a checkpointed run after the last step it completed.
+
+        Completed runs are returned as stored. Parallel branches that were still
+        running when the run was interrupted are started again from their fan-out.
+
+        Raises:
+            ValueError: If the state machine has no checkpointer
+            KeyError: If the run is unknown to the checkpointer
+        """
+        if not self.checkpointer:
+            raise ValueError("StateMachine has no checkpointer; pass `checkpointer=` to resume runs")
+
+        current_run, initial_state = self.checkpointer.load_run(run_id, self.state_schema)
+        if current_run.end_timestamp:
+            return current_run
+        # Branch snapshots left out of the loaded run would mix with the rerun's
+        self.checkpointer.prune(run_id)
+        current_run.retention = self.retention or KeepAllSnapshots()
+
+        self._notify("on_run_start", current_run, initial_state)
+        try:
+            if not current_run.snapshots:
+                # Interrupted before the entry step finished: start over within the same run
+                self._execute(initial_state, self._get_entry_point(initial_state), resource, current_run)
+            else:
+                last = current_run.snapshots[-1]
+                state = last.state_data
+
+                next_steps = self._next_steps(last.step_id, state)
+                self._notify("on_transition", current_run, last.step_id, next_steps)
+                if len(next_steps) > 1:
+                    join_id, branch_updates = self._fan_out(state, next_steps, resource, current_run, last)
+                    plan = self.compile()
+                    for branch_update in branch_updates:
+                        state = merge_state(state, branch_update, plan.fields, plan.reducers)
+                    self._execute(state, join_id, resource, current_run, parent=last, joining=True)
+                else:
+                    self._execute(state, next_steps[0], resource, current_run, parent=last)
+        except Exception as e:
+            self._fail(current_run, e)
+            raise
+
+        self._complete(current_run)
+        return current_run
+
+    async def arun(self, state: StateSchema, resource: Resource = None):
+        """Async counterpart of `run`.
+
+        Async step logic and transition conditions are awaited, sync logic runs
+        in a worker thread, and parallel branches are gathered on the event loop.
+        Many runs can share one loop, e.g. `await asyncio.gather(*(m.arun(s) for s in states))`.
+        """
+        current_run = await self._arun(state, resource)
+        if current_run.error is not None:
+            raise current_run.error
+        return current_run
+
+    async def _arun(self, state: StateSchema, resource: Resource = None,
+                    observers: Sequence[StateMachineObserver[StateSchema]] = ()) -> Run:
+        """Async counterpart of `_run`"""
+        entry_id = self._get_entry_point(state)
+
+        current_run = self._start(state, observers)
+        try:
+            await self._aexecute(state, entry_id, resource, current_run)
+        except asyncio.CancelledError:
+            # Observers and checkpointers still learn that the run ended
+            self._fail(current_run, RunCancelled(f"{current_run} was cancelled"))
+            raise
+        except Exception as e:
+            self._fail(current_run, e)
+            return current_run
+
+        self._complete(current_run)
+        return current_run
+
+    def add_observer(self, observer: StateMachineObserver[StateSchema]):
+        """Register an observer for the lifecycle hooks of every run"""
+        self.observers.append(observer)
+
+    def _notify(self, hook: str, current_run: Run, *args):
+        for observer in self.observers:
+            getattr(observer, hook)(current_run, *args)
+        for observer in self._run_observers.get(current_run.run_id, ()):
+            getattr(observer, hook)(current_run, *args)
+
+    def _start(self, state: StateSchema, observers: Sequence[StateMachineObserver[StateSchema]] = ()) -> Run:
+        current_run = Run.create(self.retention)
+        if observers:
+            self._run_observers[current_run.run_id] = list(observers)
+        try:
+            if self.checkpointer:
+                self.checkpointer.start_run(current_run, state)
+            self._notify("on_run_start", current_run, state)
+        except BaseException:
+            self._run_observers.pop(current_run.run_id, None)
+            raise
+        return current_run
+
+    def _complete(self, current_run: Run):
+        current_run.complete()
+        if self.checkpointer:
+            self.checkpointer.complete_run(current_run)
+        self._notify("on_run_end", current_run, None)
+        self._run_observers.pop(current_run.run_id, None)
+
+    def _fail(self, current_run: Run, error: Exception):
+        # The run stays incomplete so a checkpointed run can still be resumed
+        current_run.error = error
+        self._notify("on_run_end", current_run, error)
+        self._run_observers.pop(current_run.run_id, None)
+
+    def _record(self, current_run: Run, snapshot: Snapshot, branch: bool):
+        current_run.add_snapshot(snapshot)
+        if self.checkpointer:
+            self.checkpointer.save_snapshot(current_run.run_id, snapshot, branch)
+
+    @staticmethod
+    def _check_targets(plan: ExecutionPlan[StateSchema], t: Transition[StateSchema], targets: List[str]) -> List[str]:
+        """Reject steps a condition returned that `compile` did not account for"""
+        if t.condition:
+            allowed = t.targets or plan.steps
+            unexpected = [target for target in targets if target not in allowed]
+            if unexpected:
+                raise ValueError(f"[StateMachine] Condition of {t} returned undeclared steps: {unexpected}")
+        return targets
+
+    def _next_steps(self, step_id: str, state: StateSchema) -> List[str]:
+        plan = self.compile()
+        next_steps: List[str] = []
+        for t in plan.dispatch.get(step_id, ()):
+            next_steps += self._check_targets(plan, t, t.resolve(state))
+
+        if not next_steps:
+            raise Exception(f"[StateMachine] No transitions found from step: {step_id}")
+        return next_steps
+
+    async def _anext_steps(self, step_id: str, state: StateSchema) -> List[str]:
+        plan = self.compile()
+        next_steps: List[str] = []
+        for t in plan.dispatch.get(step_id, ()):
+            next_steps += self._check_targets(plan, t, await t.aresolve(state))
+
+        if not next_steps:
+            raise Exception(f"[StateMachine] No transitions found from step: {step_id}")
+        return next_steps
+
+    def _execute(self, state: StateSchema, step_id: str, resource: Resource,
+                 current_run: Run, branch: bool = False,
+                 parent: Optional[Snapshot] = None, joining: bool = False) -> Tuple[StateSchema, Dict, str]:
+        """Run steps starting at `step_id` until Termination or, inside a
+        parallel branch, until a Join is reached.
+
+        Returns the final state, the updates accumulated along the way and the
+        id of the step that stopped execution."""
+        plan = self.compile()
+        fields, reducers = plan.fields, plan.reducers
+        updates: Dict = {}
+        snapshot = parent
+
+        while True:
+            step = self.steps[step_id]
             if isinstance(step, Termination):
-                print(f"[StateMachine] Terminating: {current_step_id}")
-                break
-            
+                if branch:
+                    raise ValueError(f"[StateMachine] Parallel branch reached {step_id} before a Join step")
+                return state, updates, step_id
+            if branch and isinstance(step, Join) and not joining:
+                return state, updates, step_id
+            # After a fan-out the state holds branch updates no snapshot recorded
+            merged_branches, joining = joining, False
+
+            self._notify("on_step_start", current_run, step, state)
+            try:
+                result = step.invoke(state, resource)
+            except BaseException as e:
+                self._notify("on_step_end", current_run, step, None, e)
+                raise
             # Replace state entirely
-            state = step.run(state, self.state_schema, resource)  
+            delta = None if merged_branches else {}
+            state = merge_state(state, result, fields, reducers, delta)
+            updates = accumulate_updates(updates, result, fields, reducers)
 
-            if isinstance(step, EntryPoint):
-                print(f"[StateMachine] Starting: {current_step_id}")
-            else:
-                print(f"[StateMachine] Executing step: {current_step_id}")
+            # Create and add snapshot to the current run; unchanged values are shared, not copied
+            snapshot = Snapshot.create(state, self.state_schema, step_id, parent=snapshot, delta=delta)
+            self._record(current_run, snapshot, branch)
+            self._notify("on_step_end", current_run, step, snapshot, None)
 
-            # Create and add snapshot to the current run
-            snapshot = Snapshot.create(copy.deepcopy(state), self.state_schema, current_step_id)
-            current_run.add_snapshot(snapshot)
+            next_steps = self._next_steps(step_id, state)
+            self._notify("on_transition", current_run, step_id, next_steps)
 
-            transitions = self.transitions.get(current_step_id, [])
-            next_steps: List[str] = []
+            if len(next_steps) > 1:
+                step_id, branch_updates = self._fan_out(state, next_steps, resource, current_run, snapshot)
+                for branch_update in branch_updates:
+                    state = merge_state(state, branch_update, fields, reducers)
+                    updates = accumulate_updates(updates, branch_update, fields, reducers)
+                joining = True
+                continue
 
-            for t in transitions:
-                next_steps += t.resolve(state)
+            step_id = next_steps[0]
 
-            if not next_steps:
-                raise Exception(f"[StateMachine] No transitions found from step: {current_step_id}")
+    def _fan_out(self, state: StateSchema, targets: List[str], resource: Resource,
+                 current_run: Run, parent: Snapshot) -> Tuple[str, List[Dict]]:
+        """Run each target as a parallel branch and wait for all of them to
+        reach the same Join step. Returns the Join id and the branch updates
+        in target order."""
+        max_workers = self.max_workers or len(targets)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(self._execute, {**state}, target, resource, current_run, True, parent)
+                for target in targets
+            ]
+            results = [f.result() for f in futures]
+
+        return self._join(targets, results)
+
+    def _join(self, targets: List[str], results: List[Tuple[StateSchema, Dict, str]]) -> Tuple[str, List[Dict]]:
+        join_ids = {join_id for _, _, join_id in results}
+        if len(join_ids) > 1:
+            raise ValueError(f"[StateMachine] Parallel branches {targets} must converge on a single Join step, got {sorted(join_ids)}")
+
+        # Without a reducer there is no sensible way to combine two writes
+        reducers = self.compile().reducers
+        written = set()
+        for _, branch_updates, _ in results:
+            conflicts = (written & branch_updates.keys()) - reducers.keys()
+            if conflicts:
+                raise ValueError(f"[StateMachine] Parallel branches {targets} both update {sorted(conflicts)}; declare a reducer for these fields")
+            written |= branch_updates.keys()
+
+        return join_ids.pop(), [branch_updates for _, branch_updates, _ in results]
+
+    async def _aexecute(self, state: StateSchema, step_id: str, resource: Resource,
+                        current_run: Run, branch: bool = False,
+                        parent: Optional[Snapshot] = None, joining: bool = False) -> Tuple[StateSchema, Dict, str]:
+        """Async counterpart of `_execute`"""
+        plan = self.compile()
+        fields, reducers = plan.fields, plan.reducers
+        updates: Dict = {}
+        snapshot = parent
+
+        while True:
+            step = self.steps[step_id]
+            if isinstance(step, Termination):
+                if branch:
+                    raise ValueError(f"[StateMachine] Parallel branch reached {step_id} before a Join step")
+                return state, updates, step_id
+            if branch and isinstance(step, Join) and not joining:
+                return state, updates, step_id
+            # After a fan-out the state holds branch updates no snapshot recorded
+            merged_branches, joining = joining, False
+
+            self._notify("on_step_start", current_run, step, state)
+            try:
+                result = await step.ainvoke(state, resource)
+            except BaseException as e:
+                self._notify("on_step_end", current_run, step, None, e)
+                raise
+            delta = None if merged_branches else {}
+            state = merge_state(state, result, fields, reducers, delta)
+            updates = accumulate_updates(updates, result, fields, reducers)
+
+            snapshot = Snapshot.create(state, self.state_schema, step_id, parent=snapshot, delta=delta)
+            self._record(current_run, snapshot, branch)
+            self._notify("on_step_end", current_run, step, snapshot, None)
+
+            next_steps = await self._anext_steps(step_id, state)
+            self._notify("on_transition", current_run, step_id, next_steps)
 
             if len(next_steps) > 1:
-                raise NotImplementedError("Parallel execution not implemented yet.")
+                step_id, branch_updates = await self._afan_out(state, next_steps, resource, current_run, snapshot)
+                for branch_update in branch_updates:
+                    state = merge_state(state, branch_update, fields, reducers)
+                    updates = accumulate_updates(updates, branch_update, fields, reducers)
+                joining = True
+                continue
 
-            current_step_id = next_steps[0]
+            step_id = next_steps[0]
 
-        current_run.complete()
-        return current_run
+    async def _afan_out(self, state: StateSchema, targets: List[str], resource: Resource,
+                        current_run: Run, parent: Snapshot) -> Tuple[str, List[Dict]]:
+        """Async counterpart of `_fan_out`; branches are gathered on the running loop"""
+        results = await asyncio.gather(*(
+            self._aexecute({**state}, target, resource, current_run, True, parent)
+            for target in targets
+        ))
+        return self._join(targets, list(results))
@@ -1,7 +1,8 @@
 import inspect
 import datetime
+import json
 from typing import (
-    Any, Callable, 
+    Any, Callable, Dict, Iterable, Iterator, List,
     Literal, Optional, Union, TypeAlias,
     get_type_hints, get_origin, get_args,
 )
@@ -29,6 +30,12 @@ class Tool:
             self._build_param_schema(key, param)
             for key, param in self.signature.parameters.items()
         ]
+        # The same schemas without the "string" fallback, used to validate the
+        # model's arguments: values of types we could not map pass through as is
+        self.argument_schemas = {
+            key: self._infer_json_schema_type(self.type_hints.get(key, Any), fallback={})
+            for key in self.signature.parameters
+        }
 
     def _build_param_schema(self, name: str, param: inspect.Parameter):
         param_type = self.type_hints.get(name, str)
@@ -39,7 +46,10 @@ class Tool:
             "required": param.default == inspect.Parameter.empty
         }
 
-    def _infer_json_schema_type(self, typ: Any) -> dict:
+    def _infer_json_schema_type(self, typ: Any, fallback: Optional[dict] = None) -> dict:
+        """JSON schema of a type hint; `fallback` (default: string) is used for
+        types without a mapping, e.g. Any, bare dict/list, multi-type unions or models"""
+        fallback = dict(fallback) if fallback is not None else {"type": "string"}
         origin = get_origin(typ)
 
         # Handle Literal (enums)
@@ -54,20 +64,20 @@ class Tool:
             args = get_args(typ)
             non_none = [arg for arg in args if arg is not type(None)]
             if len(non_none) == 1:
-                return self._infer_json_schema_type(non_none[0])
-            return {"type": "string"}  # fallback
+                return self._infer_json_schema_type(non_none[0], fallback)
+            return fallback
 
         # Handle collections
         if origin is list:
             return {
                 "type": "array",
-                "items": self._infer_json_schema_type(get_args(typ)[0] if get_args(typ) else str)
+                "items": self._infer_json_schema_type(get_args(typ)[0] if get_args(typ) else Any, fallback)
             }
 
         if origin is dict:
             return {
                 "type": "object",
-                "additionalProperties": self._infer_json_schema_type(get_args(typ)[1] if get_args(typ) else str)
+                "additionalProperties": self._infer_json_schema_type(get_args(typ)[1] if get_args(typ) else Any, fallback)
             }
 
         # Primitive mappings
@@ -80,7 +90,9 @@ class Tool:
             datetime.datetime: "string",
         }
 
-        return {"type": mapping.get(typ, "string")}
+        if typ in mapping:
+            return {"type": mapping[typ]}
+        return fallback
 
     def dict(self) -> dict:
         return {
@@ -113,6 +125,181 @@ class Tool:
         return cls(func)
 
 
+class ToolArgumentError(ValueError):
+    """Raised when the arguments of a tool call don't match the tool's schema"""
+
+
+class ToolRegistry:
+    """
+    Tools indexed by name, with their schemas compiled once.
+
+    The JSON schema of every tool is built when it is registered and the list
+    sent to the model is cached, so neither is rebuilt on every LLM call.
+    Arguments coming from the model are validated and coerced against the
+    schema before dispatch.
+
+    Example:
+        >>> registry = ToolRegistry([retrieve_game, evaluate_retrieval])
+        >>> registry.payload()
+        >>> registry.call("retrieve_game", '{"query": "Pokémon"}')
+    """
+
+    def __init__(self, tools: Optional[Iterable[Tool]] = None):
+        self._tools: Dict[str, Tool] = {}
+        self._schemas: Dict[str, dict] = {}
+        self._payload: Optional[List[dict]] = None
+        for t in tools or []:
+            self.register(t)
+
+    def __repr__(self):
+        return f"<ToolRegistry tools={list(self._tools)}>"
+
+    def __len__(self):
+        return len(self._tools)
+
+    def __iter__(self) -> Iterator[Tool]:
+        return iter(list(self._tools.values()))
+
+    def __contains__(self, item: Union[str, Tool]) -> bool:
+        """Look up a tool by name or check that this Tool is the one registered"""
+        if isinstance(item, Tool):
+            return self._tools.get(item.name) == item
+        return item in self._tools
+
+    def __getitem__(self, name: str) -> Tool:
+        return self._tools[name]
+
+    def register(self, tool: Tool):
+        """Add a tool, replacing any tool with the same name"""
+        self._tools[tool.name] = tool
+        self._schemas[tool.name] = tool.dict()
+        self._payload = None
+
+    def get(self, name: str) -> Optional[Tool]:
+        return self._tools.get(name)
+
+    def names(self) -> List[str]:
+        return list(self._tools)
+
+    def values(self) -> List[Tool]:
+        return list(self._tools.values())
+
+    def schema(self, name: str) -> dict:
+        """The compiled schema of a tool, as sent to the model"""
+        return self._schemas[name]
+
+    def payload(self) -> List[dict]:
+        """The `tools` entry of a chat completion request"""
+        if self._payload is None:
+            self._payload = list(self._schemas.values())
+        return self._payload
+
+    def validate(self, name: str, arguments: Union[str, Dict[str, Any], None]) -> Dict[str, Any]:
+        """
+        Check tool call arguments against the tool's schema.
+
+        Args:
+            name: Name of the tool
+            arguments: Arguments as a JSON string (as returned by the model) or dict
+
+        Returns:
+            The arguments coerced to the declared types, e.g. "3" to 3 for an
+            integer parameter or an ISO string to a date. Parameters whose type
+            has no JSON schema mapping (Any, unions, models, ...) are passed as is.
+
+        Raises:
+            ToolArgumentError: If the tool is unknown or the arguments don't match
+        """
+        tool = self._tools.get(name)
+        if tool is None:
+            raise ToolArgumentError(f"Unknown tool '{name}'")
+
+        if isinstance(arguments, str):
+            try:
+                arguments = json.loads(arguments) if arguments.strip() else {}
+            except json.JSONDecodeError as e:
+                raise ToolArgumentError(f"Arguments of '{name}' are not valid JSON: {e}") from e
+        arguments = arguments or {}
+        if not isinstance(arguments, dict):
+            raise ToolArgumentError(f"Arguments of '{name}' must be an object, got {type(arguments).__name__}")
+
+        parameters = self._schemas[name]["function"]["parameters"]
+        unknown = set(arguments) - set(parameters["properties"])
+        if unknown:
+            raise ToolArgumentError(f"Unexpected arguments for '{name}': {sorted(unknown)}")
+        missing = [key for key in parameters["required"] if key not in arguments]
+        if missing:
+            raise ToolArgumentError(f"Missing required arguments for '{name}': {missing}")
+
+        coerced = {}
+        for key, value in arguments.items():
+            if value is None and key not in parameters["required"]:
+                coerced[key] = None
+                continue
+            value = self._coerce(value, tool.argument_schemas[key], f"{name}.{key}")
+            hint = tool.type_hints.get(key)
+            if hint in (datetime.date, datetime.datetime) and isinstance(value, str):
+                try:
+                    value = hint.fromisoformat(value)
+                except ValueError as e:
+                    raise ToolArgumentError(f"{name}.{key}: expected an ISO date, got {value!r}") from e
+            coerced[key] = value
+        return coerced
+
+    def call(self, name: str, arguments: Union[str, Dict[str, Any], None]) -> Any:
+        """Validate the arguments and invoke the tool"""
+        return self._tools[name](**self.validate(name, arguments))
+
+    def _coerce(self, value: Any, schema: dict, path: str) -> Any:
+        expected = schema.get("type")
+
+        if "enum" in schema:
+            if value not in schema["enum"]:
+                raise ToolArgumentError(f"{path}: {value!r} is not one of {schema['enum']}")
+            return value
+
+        if expected == "string":
+            if isinstance(value, str):
+                return value
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return str(value)
+        elif expected == "integer":
+            if isinstance(value, int) and not isinstance(value, bool):
+                return value
+            if isinstance(value, float) and value.is_integer():
+                return int(value)
+            if isinstance(value, str):
+                try:
+                    return int(value.strip())
+                except ValueError:
+                    pass
+        elif expected == "number":
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return value
+            if isinstance(value, str):
+                try:
+                    return float(value.strip())
+                except ValueError:
+                    pass
+        elif expected == "boolean":
+            if isinstance(value, bool):
+                return value
+            if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+                return value.strip().lower() == "true"
+        elif expected == "array":
+            if isinstance(value, list):
+                return [self._coerce(item, schema["items"], f"{path}[{i}]") for i, item in enumerate(value)]
+        elif expected == "object":
+            if isinstance(value, dict):
+                return {
+                    k: self._coerce(v, schema["additionalProperties"], f"{path}.{k}")
+                    for k, v in value.items()
+                }
+        else:
+            return value
+
+        raise ToolArgumentError(f"{path}: expected {expected}, got {type(value).__name__} {value!r}")
+
 
 def tool(func=None, *, name: str = None, description: str = None):
     def wrapper(f):
@@ -0,0 +1,27 @@
+"""
+Pytest configuration and fixtures for the UdaPlay library tests.
+
+LLM calls go to the local StubOpenAIServer from the benchmarks, so the tests
+exercise the real HTTP client without network access or an API key.
+"""
+import pytest
+
+from lib.agents import Agent
+from lib.llm import LLM
+from benchmarks.stub_server import StubOpenAIServer
+
+
+@pytest.fixture
+def stub_server():
+    """Stub OpenAI server answering every chat request with a text reply."""
+    with StubOpenAIServer() as server:
+        yield server
+
+
+@pytest.fixture
+def make_agent(stub_server):
+    """Factory for agents talking to the stub server."""
+    def factory(**kwargs):
+        kwargs.setdefault("llm", LLM(model="gpt-4o-mini", api_key="stub", base_url=stub_server.base_url))
+        return Agent(model_name="gpt-4o-mini", instructions="You are a test agent.", **kwargs)
+    return factory
@@ -0,0 +1,187 @@
+"""
+Tests for the Agent loop: tool calls, streaming and context trimming.
+"""
+import json
+import threading
+import time
+
+import pytest
+
+from lib.context import LastTurns
+from lib.state_machine import ReducedUpdate
+from lib.tooling import tool
+
+
+@tool
+def slow_lookup(title: str) -> str:
+    """Look up a game slowly"""
+    time.sleep(0.2)
+    return f"{title}: released 1998"
+
+
+# Released by the tests once the agent has moved on without the answer
+lookup_released = threading.Event()
+
+
+@tool
+def hanging_lookup(title: str) -> str:
+    """Look up a game that never answers in time"""
+    lookup_released.wait(5)
+    return "too late"
+
+
+# Both lookups of a turn must be in flight at once to get past the barrier
+lookup_barrier = threading.Barrier(2, timeout=5)
+
+
+@tool
+def paired_lookup(title: str) -> str:
+    """Look up a game alongside another lookup"""
+    lookup_barrier.wait()
+    return f"{title}: released 1998"
+
+
+@tool
+def thread_lookup(title: str) -> str:
+    """Report the thread the lookup runs on"""
+    return threading.current_thread().name
+
+
+@tool
+async def async_lookup(title: str) -> str:
+    """Look up a game asynchronously"""
+    return f"{title}: async"
+
+
+def call_tools(*calls):
+    """Stub script: call the given tools once per turn, then answer"""
+    def script(body):
+        messages = body["messages"]
+        last_user = max(i for i, m in enumerate(messages) if m["role"] == "user")
+        if not any(m["role"] == "tool" for m in messages[last_user:]):
+            return {"tool_calls": [{"name": name, "arguments": arguments} for name, arguments in calls]}
+        return {"content": "Done: " + ", ".join(json.loads(m["content"]) for m in messages[last_user:] if m["role"] == "tool")}
+    return script
+
+
+class TestToolCalls:
+
+    def test_tool_calls_of_one_turn_run_concurrently(self, make_agent, stub_server):
+        stub_server.script = call_tools(("paired_lookup", {"title": "Zelda"}), ("paired_lookup", {"title": "Mario"}))
+        agent = make_agent(tools=[paired_lookup])
+
+        lookup_barrier.reset()
+        run = agent.invoke("When were they released?")
+        # Run one after the other, the first call breaks the barrier and reports an error
+        assert not lookup_barrier.broken
+        # Results keep the order of the calls
+        assert run.get_final_state()["messages"][-1].content == "Done: Zelda: released 1998, Mario: released 1998"
+
+    def test_sequential_mode(self, make_agent, stub_server):
+        stub_server.script = call_tools(("slow_lookup", {"title": "Zelda"}), ("async_lookup", {"title": "Mario"}))
+        agent = make_agent(tools=[slow_lookup, async_lookup], parallel_tool_calls=False)
+        answer = agent.invoke("Hi").get_final_state()["messages"][-1].content
+        assert answer == "Done: Zelda: released 1998, Mario: async"
+
+    def test_timed_out_tool_is_reported_to_the_model(self, make_agent, stub_server):
+        stub_server.script = call_tools(("hanging_lookup", {"title": "Zelda"}), ("async_lookup", {"title": "Mario"}))
+        agent = make_agent(tools=[hanging_lookup, async_lookup], tool_timeout=0.1)
+
+        lookup_released.clear()
+        try:
+            answer = agent.invoke("Hi").get_final_state()["messages"][-1].content
+            # The turn finished while the lookup was still waiting to be released
+            assert not lookup_released.is_set()
+        finally:
+            lookup_released.set()
+            agent.close()
+        assert "timed out after 0.1s" in answer
+        assert "Mario: async" in answer
+
+    def test_single_call_without_timeout_runs_inline(self, make_agent, stub_server):
+        stub_server.script = call_tools(("thread_lookup", {"title": "Zelda"}))
+        agent = make_agent(tools=[thread_lookup])
+        answer = agent.invoke("Hi").get_final_state()["messages"][-1].content
+        assert not answer.startswith("Done: agent-tool")
+        assert agent._tool_executor is None
+
+    def test_turns_reuse_one_bounded_pool(self, make_agent, stub_server):
+        stub_server.script = call_tools(("thread_lookup", {"title": "Zelda"}), ("thread_lookup", {"title": "Mario"}))
+        agent = make_agent(tools=[thread_lookup], max_tool_workers=2)
+        agent.invoke("Hi")
+        executor = agent._tool_executor
+        answer = agent.invoke("Again").get_final_state()["messages"][-1].content
+        assert agent._tool_executor is executor and executor._max_workers == 2
+        assert all(name.startswith("agent-tool") for name in answer[len("Done: "):].split(", "))
+        agent.close()
+        assert agent._tool_executor is None
+
+    def test_timed_out_calls_are_counted(self, make_agent, stub_server):
+        stub_server.script = call_tools(("hanging_lookup", {"title": "Zelda"}))
+        agent = make_agent(tools=[hanging_lookup], tool_timeout=0.05)
+        lookup_released.clear()
+        try:
+            agent.invoke("Hi")
+        finally:
+            lookup_released.set()
+            agent.close()
+        assert agent.timed_out_tool_calls == 1
+
+    def test_snapshots_store_only_new_messages(self, make_agent, stub_server):
+        stub_server.script = call_tools(("thread_lookup", {"title": "Zelda"}))
+        agent = make_agent(tools=[thread_lookup])
+        agent.invoke("First")
+        run = agent.invoke("Second")
+
+        history = len(run.snapshots[0].delta["messages"])
+        new_messages = [
+            len(snapshot.delta["messages"].update)
+            for snapshot in run.snapshots[1:] if isinstance(snapshot.delta.get("messages"), ReducedUpdate)
+        ]
+        # user, assistant with the tool call, tool result, answer
+        assert history == 5 and new_messages == [1, 1, 1, 1]
+        assert len(run.get_final_state()["messages"]) == 9
+
+    def test_invalid_arguments_are_reported_to_the_model(self, make_agent, stub_server):
+        stub_server.script = call_tools(("slow_lookup", {"year": 1998}))
+        agent = make_agent(tools=[slow_lookup])
+        answer = agent.invoke("Hi").get_final_state()["messages"][-1].content
+        assert answer.startswith("Done: Error: Unexpected arguments")
+
+
+class TestStreaming:
+
+    def test_stream_yields_tokens_and_returns_the_run(self, make_agent):
+        agent = make_agent()
+        stream = agent.stream("Hello there")
+        tokens = []
+        with pytest.raises(StopIteration) as stop:
+            while True:
+                tokens.append(next(stream))
+        assert "".join(tokens) == "Stub answer to: Hello there"
+        assert stop.value.value.get_final_state()["messages"][-1].content == "Stub answer to: Hello there"
+
+    def test_on_token_callback(self, make_agent):
+        tokens = []
+        make_agent().invoke("Hi", on_token=tokens.append)
+        assert "".join(tokens) == "Stub answer to: Hi"
+
+
+class TestContextPolicy:
+
+    def test_older_turns_are_not_sent(self, make_agent, stub_server):
+        sent = []
+
+        def script(body):
+            sent.append([m["role"] for m in body["messages"]])
+            return {"content": "ok"}
+
+        stub_server.script = script
+        agent = make_agent(context_policy=LastTurns(1))
+        for i in range(3):
+            run = agent.invoke(f"Question {i}")
+
+        assert sent[-1] == ["system", "user"]
+        assert run.get_final_state()["context_tokens_saved"] > 0
+        # Later runs build on the trimmed history
+        assert [m.content for m in run.get_final_state()["messages"][1:]] == ["Question 2", "ok"]
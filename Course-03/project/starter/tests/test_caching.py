@@ -0,0 +1,91 @@
+"""
+Tests for fingerprints and caches.
+"""
+import datetime
+import enum
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import TypedDict
+
+import pytest
+
+from lib.caching import LRUCache, MISSING, SQLiteCache, TieredCache, fingerprint
+from lib.messages import UserMessage
+from lib.state_machine import EntryPoint, StateMachine, Step, Termination
+
+
+class Color(enum.Enum):
+    RED = "red"
+
+
+@dataclass
+class Point:
+    x: int
+    y: int
+
+
+class Opaque:
+    pass
+
+
+class TestFingerprint:
+
+    def test_equal_data_equal_fingerprints(self):
+        assert fingerprint({"b": 1, "a": [1, 2]}) == fingerprint({"a": [1, 2], "b": 1})
+        assert fingerprint(UserMessage(content="Hi")) == fingerprint(UserMessage(content="Hi"))
+        assert fingerprint(Point(1, 2)) != fingerprint(Point(2, 1))
+        assert fingerprint({datetime.date(2024, 1, 1), Color.RED}) == fingerprint({Color.RED, datetime.date(2024, 1, 1)})
+
+    def test_stable_across_processes(self):
+        value = {"date": datetime.datetime(2024, 5, 1, 12, 30), "point": Point(1, 2), "tags": {"a", "b"}}
+        code = (
+            "import datetime; from lib.caching import fingerprint; from tests.test_caching import Point; "
+            "print(fingerprint({'date': datetime.datetime(2024, 5, 1, 12, 30), 'point': Point(1, 2), 'tags': {'b', 'a'}}))"
+        )
+        other = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        assert other.stdout.strip() == fingerprint(value)
+
+    def test_rejects_values_without_stable_encoding(self):
+        with pytest.raises(TypeError, match="Opaque"):
+            fingerprint({"object": Opaque()})
+
+
+class CacheState(TypedDict):
+    query: str
+    client: object
+    answer: str
+
+
+class TestPureSteps:
+
+    def test_memoizes_on_reads_only(self):
+        calls = []
+
+        def answer(state):
+            calls.append(state["query"])
+            return {"answer": state["query"].upper()}
+
+        machine = StateMachine[CacheState](CacheState)
+        entry, termination = EntryPoint(), Termination()
+        step = Step("answer", answer, pure=True, reads=["query"])
+        machine.add_steps([entry, step, termination])
+        machine.connect(entry, step)
+        machine.connect(step, termination)
+
+        for _ in range(3):
+            run = machine.run({"query": "hi", "client": Opaque(), "answer": ""})
+        assert run.get_final_state()["answer"] == "HI"
+        assert calls == ["hi"]
+
+
+class TestCaches:
+
+    def test_tiered_cache_promotes_hits(self, tmp_path):
+        fast, slow = LRUCache(maxsize=2), SQLiteCache(str(tmp_path / "cache.db"))
+        cache = TieredCache([fast, slow])
+        slow.set("key", {"value": 1})
+        assert fast.get("key") is MISSING
+        assert cache.get("key") == {"value": 1}
+        assert fast.get("key") == {"value": 1}
+        slow.close()
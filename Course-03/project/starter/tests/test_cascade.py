@@ -0,0 +1,66 @@
+"""
+Tests for cheap-first model routing.
+"""
+from lib.cascade import CascadingLLM, has_content
+from lib.llm import LLM
+from lib.tooling import tool
+from benchmarks.stub_server import StubOpenAIServer
+
+
+class TestCascadingLLM:
+
+    def test_escalates_only_failed_answers(self, stub_server):
+        with StubOpenAIServer(script=[{"content": ""}, {"content": "cheap answer"}]) as cheap:
+            llm = CascadingLLM(
+                [LLM(model="cheap", api_key="stub", base_url=cheap.base_url),
+                 LLM(model="strong", api_key="stub", base_url=stub_server.base_url)],
+                checks=[has_content],
+            )
+            escalated = llm.invoke("First")
+            answered = llm.invoke("Second")
+
+        assert escalated.content == "Stub answer to: First"
+        assert answered.content == "cheap answer"
+        stats = llm.stats
+        assert stats["calls"] == 2 and stats["escalations"] == 1
+        assert stats["answered_by"] == {"strong": 1, "cheap": 1}
+        assert stats["check_failures"] == {"has_content": 1}
+
+    def test_usage_sums_every_tier_tried(self, stub_server):
+        with StubOpenAIServer(script=[{"content": ""}], completion_tokens=5) as cheap:
+            tiers = [LLM(model="cheap", api_key="stub", base_url=cheap.base_url),
+                     LLM(model="strong", api_key="stub", base_url=stub_server.base_url)]
+            llm = CascadingLLM(tiers)
+            cheap_usage = tiers[0].invoke("Hi").token_usage.total_tokens
+            strong_usage = tiers[1].invoke("Hi").token_usage.total_tokens
+            chunks = list(llm.stream("Hi"))
+
+        assert "".join(c for c in chunks if isinstance(c, str)) == "Stub answer to: Hi"
+        assert chunks[-1].token_usage.total_tokens == cheap_usage + strong_usage
+
+    def test_agent_uses_the_cascade(self, make_agent, stub_server):
+        llm = CascadingLLM([LLM(model="only", api_key="stub", base_url=stub_server.base_url)])
+        agent = make_agent(llm=llm)
+        assert agent.invoke("Hi").get_final_state()["messages"][-1].content == "Stub answer to: Hi"
+        assert llm.stats["calls"] == 1
+
+
+    def test_agents_sharing_a_model_keep_their_own_tools(self, make_agent, stub_server):
+        @tool
+        def a() -> str:
+            """Tool a"""
+            return "a"
+
+        @tool
+        def b() -> str:
+            """Tool b"""
+            return "b"
+
+        llm = LLM(model="shared", api_key="stub", base_url=stub_server.base_url)
+        cascade = CascadingLLM([llm])
+        for model in (llm, cascade):
+            agent_a, agent_b = make_agent(llm=model, tools=[a]), make_agent(llm=model, tools=[b])
+            assert agent_a.tools.names() == ["a"] and agent_b.tools.names() == ["b"]
+            assert agent_a.llm.tools is agent_a.tools
+            assert a in agent_a.tools and a not in agent_b.tools
+        assert len(llm.tools) == 0 and len(cascade.tools) == 0
@@ -0,0 +1,46 @@
+"""
+Tests for LLM response caching and batching.
+"""
+from lib.caching import LRUCache
+from lib.llm import LLM
+from benchmarks.stub_server import StubOpenAIServer
+
+
+class TestResponseCache:
+
+    def test_hits_report_zero_usage(self, stub_server):
+        llm = LLM(api_key="stub", base_url=stub_server.base_url, cache=LRUCache())
+        first = llm.invoke("Hi")
+        second = llm.invoke("Hi")
+        streamed = list(llm.stream("Hi"))[-1]
+
+        assert stub_server.requests == 1
+        assert first.token_usage.total_tokens > 0
+        assert second.content == streamed.content == first.content
+        assert second.token_usage.total_tokens == streamed.token_usage.total_tokens == 0
+
+    def test_endpoints_do_not_share_entries(self, stub_server):
+        cache = LRUCache()
+        with StubOpenAIServer(script=[{"content": "other endpoint"}]) as other:
+            here = LLM(model="gpt-4o-mini", api_key="stub", base_url=stub_server.base_url, cache=cache)
+            there = LLM(model="gpt-4o-mini", api_key="stub", base_url=other.base_url, cache=cache)
+            assert here.invoke("Hi").content == "Stub answer to: Hi"
+            assert there.invoke("Hi").content == "other endpoint"
+            assert stub_server.requests == other.requests == 1
+
+    def test_agent_does_not_count_cached_tokens(self, make_agent, stub_server):
+        llm = LLM(api_key="stub", base_url=stub_server.base_url, cache=LRUCache())
+        agent = make_agent(llm=llm)
+        spent = agent.invoke("Hi", "first").get_final_state()["total_tokens"]
+        cached = agent.invoke("Hi", "second").get_final_state()["total_tokens"]
+        assert spent > 0
+        assert cached == 0
+
+
+class TestBatch:
+
+    def test_results_keep_input_order(self, stub_server):
+        stub_server.latency = 0.05
+        llm = LLM(api_key="stub", base_url=stub_server.base_url)
+        results = llm.batch([f"Prompt {i}" for i in range(8)], max_concurrency=8)
+        assert [r.content for r in results] == [f"Stub answer to: Prompt {i}" for i in range(8)]
@@ -0,0 +1,189 @@
+"""
+Tests for ShortTermMemory, SQLiteShortTermMemory and LongTermMemory.
+"""
+import threading
+import time
+
+import pytest
+
+from lib.memory import LongTermMemory, MemoryFragment, SessionNotFoundError, ShortTermMemory, SQLiteShortTermMemory
+from lib.vector_db import VectorStoreManager
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "sessions.db")
+
+
+class FakeClock:
+    """Stands in for the `time` module of lib.memory, moved on by `advance`"""
+
+    def __init__(self):
+        self.now = time.time()
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class TestShortTermMemory:
+
+    def test_sessions_and_objects(self):
+        memory = ShortTermMemory()
+        memory.create_session("s1")
+        memory.add({"turn": 1}, "s1")
+        memory.add({"turn": 2}, "s1")
+        assert memory.get_last_object("s1") == {"turn": 2}
+        assert memory.get_all_objects("s1") == [{"turn": 1}, {"turn": 2}]
+        with pytest.raises(SessionNotFoundError):
+            memory.get_all_objects("unknown")
+
+    def test_frozen_runs_are_shared_not_copied(self, make_agent):
+        agent = make_agent()
+        run = agent.invoke("Hi")
+        assert run.frozen
+        assert agent.memory.get_last_object() is run
+        # Mutable objects are still copied
+        agent.memory.add({"turn": 1})
+        assert agent.memory.get_last_object() is not agent.memory.get_last_object()
+
+
+class TestSQLiteShortTermMemory:
+
+    def test_persists_across_instances(self, db_path):
+        memory = SQLiteShortTermMemory(db_path)
+        memory.create_session("s1")
+        for turn in range(3):
+            memory.add({"turn": turn}, "s1")
+        memory.close()
+
+        reopened = SQLiteShortTermMemory(db_path)
+        assert reopened.get_last_object("s1") == {"turn": 2}
+        # Only the tail is loaded until the whole history is asked for
+        assert "s1" not in reopened._complete
+        assert reopened.get_all_objects("s1") == [{"turn": 0}, {"turn": 1}, {"turn": 2}]
+        reopened.close()
+
+    def test_evicts_least_recently_used_sessions_from_memory(self, db_path):
+        memory = SQLiteShortTermMemory(db_path, max_loaded_sessions=2)
+        for session_id in ("a", "b", "c"):
+            memory.create_session(session_id)
+            memory.add(session_id, session_id)
+        assert list(memory.sessions) == ["b", "c"]
+        assert memory.get_last_object("a") == "a"
+        memory.close()
+
+    def test_reads_do_not_write(self, db_path):
+        memory = SQLiteShortTermMemory(db_path, ttl=3600)
+        memory.create_session("s1")
+        memory.add("turn", "s1")
+        changes = memory._conn.total_changes
+        for _ in range(20):
+            memory.create_session("s1")
+            memory.get_last_object("s1")
+            memory.get_all_objects("s1")
+        assert memory._conn.total_changes == changes
+        # Access times are written back on the next sweep
+        memory._expire(force=True)
+        assert memory._conn.total_changes > changes
+        memory.close()
+
+    def test_expiry_uses_an_index(self, db_path):
+        memory = SQLiteShortTermMemory(db_path, ttl=60)
+        plan = memory._conn.execute(
+            "EXPLAIN QUERY PLAN SELECT session_id FROM sessions WHERE last_access < ?", (0,)
+        ).fetchall()
+        assert "idx_sessions_last_access" in str(plan)
+        memory.close()
+
+    def test_idle_sessions_expire(self, db_path, monkeypatch):
+        clock = FakeClock()
+        monkeypatch.setattr("lib.memory.time", clock)
+        memory = SQLiteShortTermMemory(db_path, ttl=0.2, expire_interval=0)
+        memory.create_session("idle")
+        memory.add("old", "idle")
+        memory.create_session("active")
+        memory.add("turn", "default")
+        for _ in range(4):
+            clock.advance(0.1)
+            memory.get_last_object("active")
+
+        assert "idle" not in memory.get_all_sessions()
+        assert "active" in memory.get_all_sessions()
+        # The default session is emptied, never deleted
+        assert memory.get_all_objects("default") == []
+        memory.close()
+
+
+@pytest.fixture
+def long_term_memory(tmp_path, stub_server):
+    def factory(**kwargs):
+        manager = VectorStoreManager(str(tmp_path / "chroma"), openai_api_key="stub", openai_base_url=stub_server.base_url)
+        return LongTermMemory(manager, **kwargs)
+    return factory
+
+
+class TestLongTermMemory:
+
+    def test_register_many_embeds_in_batches(self, long_term_memory, stub_server):
+        memory = long_term_memory(batch_size=4)
+        memory.register_many([MemoryFragment(content=f"Likes game {i}", owner="ana") for i in range(10)])
+        assert stub_server.requests == 3
+
+        result = memory.search("Likes game 7", owner="ana", limit=1)
+        assert result.fragments[0].content == "Likes game 7"
+
+    def test_token_budget_splits_batches(self, long_term_memory, stub_server):
+        memory = long_term_memory(batch_size=100, max_batch_tokens=30)
+        memory.register_many([MemoryFragment(content="x" * 80, owner="ana") for _ in range(4)])
+        assert stub_server.requests == 4
+
+    def test_background_writes_are_flushed(self, long_term_memory):
+        memory = long_term_memory(background_writes=True)
+        memory.register_many([MemoryFragment(content="Prefers RPGs", owner="ana", namespace="prefs")])
+        memory.flush()
+        assert memory.search("RPG", owner="ana", namespace="prefs").fragments[0].content == "Prefers RPGs"
+
+    def test_close_drains_the_queue_and_stops_the_worker(self, long_term_memory):
+        before = set(threading.enumerate())
+        with long_term_memory(background_writes=True) as memory:
+            [worker] = [t for t in set(threading.enumerate()) - before if t.name == "long-term-memory-writer"]
+            memory.register_many([MemoryFragment(content="Prefers RPGs", owner="ana")])
+        assert memory.get_owners() == ["ana"]
+        assert not worker.is_alive()
+        # Later writes go straight to the store
+        memory.register_many([MemoryFragment(content="Dislikes puzzles", owner="bo")])
+        assert memory.get_owners() == ["ana", "bo"]
+        memory.close()
+
+    def test_close_raises_pending_write_errors(self, long_term_memory):
+        memory = long_term_memory(background_writes=True)
+
+        def fail(documents):
+            raise ConnectionError("embedding service down")
+
+        memory.vector_store.add = fail
+        memory.register_many([MemoryFragment(content="Lost", owner="ana")])
+        with pytest.raises(ConnectionError, match="down"):
+            memory.close()
+        memory.close()
+
+    def test_namespace_index(self, long_term_memory):
+        memory = long_term_memory()
+        memory.register(MemoryFragment(content="a", owner="ana", timestamp=100))
+        memory.register_many([
+            MemoryFragment(content="b", owner="ana", namespace="prefs", timestamp=300),
+            MemoryFragment(content="c", owner="ana", namespace="prefs", timestamp=200),
+            MemoryFragment(content="d", owner="bo", namespace="prefs", timestamp=50),
+        ])
+
+        assert memory.get_namespaces() == ["default", "prefs"]
+        assert memory.get_namespaces(owner="bo") == ["prefs"]
+        assert memory.get_owners(namespace="prefs") == ["ana", "bo"]
+        [stats] = memory.get_namespace_stats(owner="ana", namespace="prefs")
+        assert (stats.count, stats.first_timestamp, stats.last_timestamp) == (2, 200, 300)
@@ -0,0 +1,87 @@
+"""
+Tests for the client-side rate limiter and retry policy.
+"""
+import threading
+
+import pytest
+
+from lib.ratelimit import RateLimiter, RetryPolicy, TokenBucket
+
+
+class FakeClock:
+    """Stands in for the `time` module of lib.ratelimit: sleeping only advances the clock"""
+
+    def __init__(self):
+        self.now = 0.0
+        self._lock = threading.Lock()
+
+    def monotonic(self):
+        with self._lock:
+            return self.now
+
+    def sleep(self, seconds):
+        with self._lock:
+            self.now += max(seconds, 0.0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr("lib.ratelimit.time", fake)
+    return fake
+
+
+class TestTokenBucket:
+
+    def test_blocks_until_refilled(self, clock):
+        bucket = TokenBucket(capacity=10, period=1.0)
+        bucket.acquire(10)
+        assert clock.now == 0
+        bucket.acquire(5)
+        assert clock.now == pytest.approx(0.5)
+
+    def test_oversized_requests_are_not_starved(self):
+        bucket = TokenBucket(capacity=10, period=0.5)
+        bucket.acquire(25)
+        assert bucket.available < 0
+
+    def test_adjust_returns_unused_tokens(self):
+        bucket = TokenBucket(capacity=100, period=60)
+        bucket.acquire(80)
+        bucket.adjust(-50)
+        assert bucket.try_acquire(60)
+
+    def test_rejects_empty_bucket(self):
+        with pytest.raises(ValueError):
+            TokenBucket(capacity=0)
+
+
+class TestRateLimiter:
+
+    def test_shared_limit_across_threads(self, clock):
+        limiter = RateLimiter(tokens_per_minute=600)  # refills 10 tokens per second
+        limiter.acquire(600)
+        threads = [threading.Thread(target=limiter.acquire, args=(1,)) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Threads sleeping at the same time may overshoot, but 5 more tokens take 0.5 s
+        assert clock.now >= 0.5 - 1e-9
+
+    def test_pause_holds_every_caller(self, clock):
+        limiter = RateLimiter(requests_per_minute=1000)
+        limiter.pause(0.2)
+        limiter.acquire()
+        assert clock.now == pytest.approx(0.2)
+
+
+class TestRetryPolicy:
+
+    def test_full_jitter_is_capped(self):
+        policy = RetryPolicy(base_delay=0.5, max_delay=2.0)
+        assert all(0 <= policy.delay(attempt) <= 2.0 for attempt in range(10) for _ in range(20))
+
+    def test_retry_after_wins(self):
+        policy = RetryPolicy(base_delay=0.1)
+        assert 3.0 <= policy.delay(0, retry_after=3.0) <= 3.1
@@ -0,0 +1,136 @@
+"""
+Tests for concurrent sessions on one Agent and for AgentServer.
+"""
+import asyncio
+import json
+import threading
+
+import pytest
+
+from lib.serving import AgentServer
+
+
+async def request(port, method, path, payload=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(body)}\r\n"
+        f"Connection: close\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(body)
+
+
+async def post(port, path, payload):
+    return await request(port, "POST", path, payload)
+
+
+def serve_and(agent, scenario, **server_kwargs):
+    """Start an AgentServer on a free port, run `scenario(server)` and stop it."""
+    async def main():
+        server = AgentServer(agent, port=0, **server_kwargs)
+        await server.start()
+        try:
+            return await asyncio.wait_for(scenario(server), timeout=20)
+        finally:
+            await server.stop()
+    return asyncio.run(main())
+
+
+class TestSessionLocking:
+    """Turns of one session are serialized, locks don't outlive their turns."""
+
+    def test_concurrent_invokes_keep_every_turn(self, make_agent, stub_server):
+        stub_server.latency = 0.01
+        agent = make_agent()
+        threads = [threading.Thread(target=agent.invoke, args=(f"Question {i}", "shared")) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        runs = agent.get_session_runs("shared")
+        assert len(runs) == 6
+        # system + 6 x (user, assistant)
+        assert len(runs[-1].get_final_state()["messages"]) == 13
+
+    def test_session_locks_are_dropped_when_idle(self, make_agent):
+        agent = make_agent()
+        for i in range(5):
+            agent.invoke("Hi", f"user-{i}")
+        asyncio.run(agent.ainvoke("Hi", "user-async"))
+        agent.reset_session("user-0")
+        agent.delete_session("user-1")
+
+        assert agent._session_locks == {}
+        assert "user-1" not in agent.memory.get_all_sessions()
+
+    def test_reset_every_session(self, make_agent):
+        agent = make_agent()
+        agent.invoke("Hi", "user-0")
+        agent.invoke("Hi", "user-1")
+        entry = agent._checkout_session_lock("user-1")
+        with pytest.raises(RuntimeError, match="in progress"):
+            agent.reset_session()
+        agent._checkin_session_lock("user-1", entry)
+
+        agent.reset_session()
+        assert agent.get_session_runs("user-0") == [] and agent.get_session_runs("user-1") == []
+
+
+class TestAgentServer:
+    """HTTP behaviour of AgentServer."""
+
+    def test_invoke_and_health(self, make_agent):
+        async def scenario(server):
+            status, answer = await post(server.port, "/invoke", {"query": "Hello", "session_id": "s1"})
+            health = await request(server.port, "GET", "/health")
+            return status, answer, health
+
+        status, answer, health = serve_and(make_agent(), scenario)
+        assert status == 200
+        assert answer["session_id"] == "s1"
+        assert answer["answer"] == "Stub answer to: Hello"
+        assert answer["total_tokens"] > 0
+        assert health == (200, {"status": "ok", "in_flight": 0})
+
+    def test_bad_requests(self, make_agent):
+        async def scenario(server):
+            return [
+                await post(server.port, "/invoke", {"session_id": "s1"}),
+                await post(server.port, "/nowhere", {"query": "Hi"}),
+                await request(server.port, "GET", "/invoke"),
+            ]
+
+        (missing_query, _), (unknown_path, _), (wrong_method, _) = serve_and(make_agent(), scenario)
+        assert missing_query == 400
+        assert unknown_path == 404
+        assert wrong_method == 405
+
+    def test_more_same_session_requests_than_workers(self, make_agent, stub_server):
+        stub_server.latency = 0.01
+        agent = make_agent()
+
+        async def scenario(server):
+            return await asyncio.gather(*(
+                post(server.port, "/invoke", {"query": f"Question {i}", "session_id": "hot"})
+                for i in range(12)
+            ))
+
+        responses = serve_and(agent, scenario, max_workers=4)
+        assert [status for status, _ in responses] == [200] * 12
+        assert len(agent.get_session_runs("hot")) == 12
+        assert agent._session_locks == {}
+
+    def test_turns_run_on_the_servers_own_pool(self, make_agent):
+        async def scenario(server):
+            await post(server.port, "/invoke", {"query": "Hi"})
+            return server._executor, asyncio.get_running_loop()._default_executor
+
+        executor, default_executor = serve_and(make_agent(), scenario, max_workers=2)
+        # The loop's default executor was never replaced, the server's pool is shut down
+        assert default_executor is None
+        assert executor._shutdown
@@ -0,0 +1,556 @@
+"""
+Tests for the StateMachine engine.
+"""
+import asyncio
+import operator
+import pickle
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Annotated, List, TypedDict
+
+import pytest
+
+from lib.checkpoints import SQLiteCheckpointStore
+from lib.instrumentation import MetricsCollector
+from lib.state_machine import (EntryPoint, Join, KeepFinalSnapshot, KeepLastSnapshots, Overwrite, ReducedUpdate,
+                               Run, RunCancelled, Snapshot, StateMachine, StateMachineObserver, Step,
+                               Termination)
+
+
+class CounterState(TypedDict):
+    value: int
+    label: str
+
+
+def increment(state: CounterState) -> dict:
+    return {"value": state["value"] + 1}
+
+
+def fail_on_negative(state: CounterState) -> dict:
+    if state["value"] < 0:
+        raise RuntimeError(f"negative value {state['value']}")
+    return {"label": f"value={state['value']}"}
+
+
+def linear_machine(*logic, **kwargs) -> StateMachine[CounterState]:
+    """entry -> step_0 -> step_1 -> ... -> termination"""
+    machine = StateMachine[CounterState](CounterState, **kwargs)
+    entry, termination = EntryPoint(), Termination()
+    steps = [Step(f"step_{i}", fn) for i, fn in enumerate(logic)]
+    machine.add_steps([entry, *steps, termination])
+    chain = [entry, *steps, termination]
+    for source, target in zip(chain, chain[1:]):
+        machine.connect(source, target)
+    return machine
+
+
+class FanState(TypedDict):
+    query: str
+    documents: Annotated[List[str], operator.add]
+    summary: str
+
+
+def search(source, delay=0.1):
+    def logic(state: FanState) -> dict:
+        time.sleep(delay)
+        return {"documents": [f"{source}:{state['query']}"]}
+    return logic
+
+
+async def asearch(state: FanState) -> dict:
+    await asyncio.sleep(0.1)
+    return {"documents": [f"async:{state['query']}"]}
+
+
+def meet(source, barrier):
+    """Branch that only gets past `barrier` when the other branches run at the same time"""
+    def logic(state: FanState) -> dict:
+        barrier.wait()
+        return {"documents": [f"{source}:{state['query']}"]}
+    return logic
+
+
+def ameet(barrier):
+    async def logic(state: FanState) -> dict:
+        await asyncio.to_thread(barrier.wait)
+        return {"documents": [f"async:{state['query']}"]}
+    return logic
+
+
+def arendezvous(parties):
+    """Async branch that returns once `parties` runs are inside it at the same time"""
+    arrived, everyone = [], asyncio.Event()
+
+    async def logic(state: FanState) -> dict:
+        arrived.append(state["query"])
+        if len(arrived) == parties:
+            everyone.set()
+        await asyncio.wait_for(everyone.wait(), timeout=5)
+        return {"documents": [f"async:{state['query']}"]}
+    return logic
+
+
+def summarize(state: FanState) -> dict:
+    return {"summary": " | ".join(state["documents"])}
+
+
+def fan_out_machine(branches, **kwargs) -> StateMachine[FanState]:
+    """entry -> [branches...] -> join(summarize) -> termination"""
+    machine = StateMachine[FanState](FanState, **kwargs)
+    entry, termination = EntryPoint(), Termination()
+    join = Join("join", summarize)
+    steps = [Step(f"branch_{i}", logic) for i, logic in enumerate(branches)]
+    machine.add_steps([entry, *steps, join, termination])
+    machine.connect(entry, steps)
+    for step in steps:
+        machine.connect(step, join)
+    machine.connect(join, termination)
+    return machine
+
+
+class TestFanOut:
+
+    def test_branches_run_concurrently_and_merge_through_reducers(self):
+        barrier = threading.Barrier(3, timeout=5)
+        machine = fan_out_machine([meet("web", barrier), meet("wiki", barrier), meet("db", barrier)])
+        run = machine.run({"query": "zelda", "documents": [], "summary": ""})
+
+        state = run.get_final_state()
+        # Merged in target order, whatever order the branches finished in
+        assert state["documents"] == ["web:zelda", "wiki:zelda", "db:zelda"]
+        assert state["summary"] == "web:zelda | wiki:zelda | db:zelda"
+
+    def test_conflicting_writes_without_reducer_fail(self):
+        machine = fan_out_machine([lambda state: {"summary": "a"}, lambda state: {"summary": "b"}])
+        with pytest.raises(ValueError, match="declare a reducer"):
+            machine.run({"query": "q", "documents": [], "summary": ""})
+
+    def test_branch_must_reach_a_join(self):
+        machine = StateMachine[FanState](FanState)
+        entry, termination = EntryPoint(), Termination()
+        a, b = Step("a", search("a", 0)), Step("b", search("b", 0))
+        machine.add_steps([entry, a, b, termination])
+        machine.connect(entry, [a, b])
+        machine.connect(a, termination)
+        machine.connect(b, termination)
+        with pytest.raises(ValueError, match="before a Join"):
+            machine.run({"query": "q", "documents": [], "summary": ""})
+
+
+class TestCompile:
+
+    def test_plan_is_cached_until_the_graph_changes(self):
+        machine = linear_machine(increment)
+        plan = machine.compile()
+        assert machine.compile() is plan
+        machine.add_steps([Step("extra", increment)])
+        with pytest.raises(ValueError, match="not reachable"):
+            machine.compile()
+
+    def test_rejects_dangling_transitions_and_dead_ends(self):
+        machine = linear_machine(increment)
+        machine.connect("step_0", "nowhere")
+        with pytest.raises(ValueError, match="unknown steps"):
+            machine.compile()
+
+        machine = StateMachine[CounterState](CounterState)
+        entry, loop, termination = EntryPoint(), Step("loop", increment), Termination()
+        machine.add_steps([entry, loop, termination])
+        machine.connect(entry, [loop, termination], lambda state: "loop" if state["value"] else "__termination__")
+        machine.connect(loop, loop)
+        with pytest.raises(ValueError, match="never reach a Termination"):
+            machine.compile()
+
+    def test_undeclared_condition_targets_are_open_edges(self):
+        machine = StateMachine[CounterState](CounterState)
+        entry, loop, termination = EntryPoint(), Step("loop", increment), Termination()
+        machine.add_steps([entry, loop, termination])
+        machine.connect(entry, loop)
+        machine.connect(loop, [], lambda state: "loop" if state["value"] < 3 else termination)
+        machine.compile()
+        assert machine.run({"value": 0}).get_final_state()["value"] == 3
+
+    def test_conditions_must_return_declared_targets(self):
+        machine = StateMachine[CounterState](CounterState)
+        entry, a, b, termination = EntryPoint(), Step("a", increment), Step("b", increment), Termination()
+        machine.add_steps([entry, a, b, termination])
+        machine.connect(entry, [a, b], lambda state: a)
+        machine.connect(a, b, lambda state: termination)
+        machine.connect(b, termination)
+        with pytest.raises(ValueError, match="undeclared steps: \\['__termination__'\\]"):
+            machine.run({"value": 0})
+
+    def test_step_run_uses_the_plan(self, monkeypatch):
+        machine = linear_machine(increment)
+        plan = machine.compile()
+        monkeypatch.setattr("lib.state_machine.get_type_hints", None)
+        assert machine.steps["step_0"].run({"value": 1}, CounterState, plan=plan) == {"value": 2}
+
+    def test_initial_state_needs_a_schema_field(self):
+        with pytest.raises(ValueError, match="at least one field"):
+            linear_machine(increment).run({"zzz": 1})
+
+
+class TestAsync:
+
+    def test_arun_gathers_async_branches(self):
+        barrier = threading.Barrier(3, timeout=5)
+        machine = fan_out_machine([ameet(barrier), ameet(barrier), meet("sync", barrier)])
+        run = asyncio.run(machine.arun({"query": "q", "documents": [], "summary": ""}))
+        assert run.get_final_state()["documents"] == ["async:q", "async:q", "sync:q"]
+
+    def test_many_runs_share_one_loop(self):
+        machine = fan_out_machine([arendezvous(20)])
+
+        async def main():
+            return await asyncio.gather(*(
+                machine.arun({"query": str(i), "documents": [], "summary": ""}) for i in range(20)
+            ))
+
+        runs = asyncio.run(main())
+        assert [run.get_final_state()["summary"] for run in runs] == [f"async:{i}" for i in range(20)]
+
+    def test_run_rejects_async_logic(self):
+        with pytest.raises(TypeError, match="arun"):
+            fan_out_machine([asearch]).run({"query": "q", "documents": [], "summary": ""})
+
+
+class TestSnapshots:
+
+    def test_snapshots_store_deltas_and_share_values(self):
+        machine = linear_machine(increment, increment)
+        label = "x" * 1000
+        run = machine.run({"value": 0, "label": label})
+        entry, first, second = run.snapshots
+
+        assert entry.delta == {"value": 0, "label": label}
+        assert first.delta == {"value": 1}
+        assert second.state_data == {"value": 2, "label": label}
+        # Unchanged values are shared, not copied
+        assert second.state_data["label"] is label
+        # Earlier snapshots keep their own state
+        assert first.state_data["value"] == 1
+
+    def test_reducer_fields_store_only_the_update(self, tmp_path):
+        def add(source):
+            return lambda state: {"documents": [source]}
+
+        machine = StateMachine[FanState](FanState, checkpointer=SQLiteCheckpointStore(str(tmp_path / "runs.db")))
+        entry, termination = EntryPoint(), Termination()
+        steps = [Step("a", add("a")), Step("b", add("b")), Step("reset", lambda state: {"documents": Overwrite(["z"])})]
+        machine.add_steps([entry, *steps, termination])
+        for source, target in zip([entry, *steps], [*steps, termination]):
+            machine.connect(source, target)
+
+        run = machine.run({"query": "q", "documents": ["x"], "summary": ""})
+        _, a, b, reset = run.snapshots
+        assert a.delta == {"documents": ReducedUpdate(operator.add, ["a"])}
+        assert b.state_data["documents"] == ["x", "a", "b"]
+        assert reset.delta == {"documents": ["z"]}
+        # Deltas round-trip through the checkpoint store
+        stored, _ = machine.checkpointer.load_run(run.run_id, FanState)
+        assert [s.state_data["documents"] for s in stored.snapshots] == [["x"], ["x", "a"], ["x", "a", "b"], ["z"]]
+
+    def test_overwrite_in_a_branch_is_applied_at_the_join(self):
+        machine = fan_out_machine([lambda state: {"documents": Overwrite(["only"])}, search("web", 0)])
+        run = machine.run({"query": "q", "documents": ["old"], "summary": ""})
+        assert run.get_final_state()["documents"] == ["only", "web:q"]
+
+    def test_keyframes_bound_delta_chains(self):
+        machine = linear_machine(*[increment] * (2 * Snapshot.KEYFRAME_INTERVAL))
+        run = machine.run({"value": 0, "label": ""})
+        assert max(snapshot.depth for snapshot in run.snapshots) < Snapshot.KEYFRAME_INTERVAL
+        assert run.get_final_state()["value"] == 2 * Snapshot.KEYFRAME_INTERVAL
+
+
+class RecordingObserver(StateMachineObserver):
+
+    def __init__(self):
+        self.events = []
+
+    def on_run_start(self, run, state):
+        self.events.append("run_start")
+
+    def on_step_start(self, run, step, state):
+        self.events.append(f"start:{step.step_id}")
+
+    def on_step_end(self, run, step, snapshot, error):
+        self.events.append(f"end:{step.step_id}:{'error' if error else 'ok'}")
+
+    def on_transition(self, run, source, targets):
+        self.events.append(f"{source}->{','.join(targets)}")
+
+    def on_run_end(self, run, error):
+        self.events.append("run_end:error" if error else "run_end")
+
+
+class TestObservers:
+
+    def test_hooks_follow_the_run(self):
+        observer = RecordingObserver()
+        linear_machine(increment, observers=[observer]).run({"value": 0, "label": ""})
+        assert observer.events == [
+            "run_start",
+            "start:__entry__", "end:__entry__:ok", "__entry__->step_0",
+            "start:step_0", "end:step_0:ok", "step_0->__termination__",
+            "run_end",
+        ]
+
+    def test_failures_are_reported(self):
+        observer = RecordingObserver()
+        machine = linear_machine(fail_on_negative, observers=[observer])
+        with pytest.raises(RuntimeError):
+            machine.run({"value": -1, "label": ""})
+        assert observer.events[-2:] == ["end:step_0:error", "run_end:error"]
+
+    def test_metrics_collector_keeps_bounded_samples(self):
+        collector = MetricsCollector(max_samples=3)
+        machine = linear_machine(increment, observers=[collector])
+        runs = [machine.run({"value": i, "label": ""}) for i in range(5)]
+
+        assert len(collector.latencies("step_0")) == 3
+        assert collector.latencies("step_0") == [r.metrics["steps"][1]["wall_time"] for r in runs[-3:]]
+        summary = collector.summary()["step_0"]
+        assert summary["count"] == 5 and summary["samples"] == 3
+        assert collector.histogram("step_0")["+Inf"] == 3
+
+
+def flaky(failures=1):
+    """Step logic failing on its first `failures` calls"""
+    calls = []
+
+    def logic(state: CounterState) -> dict:
+        calls.append(state)
+        if len(calls) <= failures:
+            raise ConnectionError("interrupted")
+        return {"value": state["value"] * 10}
+    return logic
+
+
+class TestCheckpoints:
+
+    def test_resume_continues_after_the_last_completed_step(self, tmp_path):
+        store = SQLiteCheckpointStore(str(tmp_path / "checkpoints.db"))
+        counted = []
+
+        def count(state):
+            counted.append(state["value"])
+            return {"value": state["value"] + 1}
+
+        machine = linear_machine(count, flaky(), checkpointer=store)
+        with pytest.raises(ConnectionError):
+            machine.run({"value": 1, "label": ""})
+        [run_id] = store.get_incomplete_runs()
+
+        run = machine.resume(run_id)
+        assert run.get_final_state()["value"] == 20
+        # The completed step was not run again
+        assert counted == [1]
+        assert store.get_incomplete_runs() == []
+        # Completed runs are returned as stored
+        assert machine.resume(run_id).get_final_state()["value"] == 20
+        store.close()
+
+    def test_resume_restarts_an_interrupted_fan_out(self, tmp_path):
+        store = SQLiteCheckpointStore(str(tmp_path / "checkpoints.db"))
+        interrupt = flaky()
+
+        def flaky_search(state):
+            interrupt({"value": 0})
+            return {"documents": ["flaky"]}
+
+        machine = fan_out_machine([search("web", 0), flaky_search], checkpointer=store)
+        with pytest.raises(ConnectionError):
+            machine.run({"query": "q", "documents": [], "summary": ""})
+        [run_id] = store.get_incomplete_runs()
+
+        # Loading leaves the interrupted branch's snapshot out but doesn't delete it
+        loaded, _ = store.load_run(run_id, FanState)
+        assert [s.step_id for s in loaded.snapshots] == ["__entry__"]
+        assert len(store.load_snapshots(run_id, FanState)) == 2
+        store.load_run(run_id, FanState)
+        assert len(store.load_snapshots(run_id, FanState)) == 2
+
+        run = machine.resume(run_id)
+        assert run.get_final_state()["documents"] == ["web:q", "flaky"]
+        assert store.prune(run_id) == 0
+        assert [s.step_id for s in store.load_snapshots(run_id, FanState)] == [s.step_id for s in run.snapshots]
+        store.close()
+
+    def test_resume_requires_a_checkpointer(self):
+        with pytest.raises(ValueError, match="checkpointer"):
+            linear_machine(increment).resume("unknown")
+
+
+class TestRunMany:
+
+    def test_runs_every_state(self):
+        machine = linear_machine(increment, fail_on_negative)
+        progress = []
+        runs = list(machine.run_many(
+            [{"value": i, "label": ""} for i in range(10)],
+            on_progress=lambda done, total, run: progress.append((done, total)),
+        ))
+        assert sorted(run.get_final_state()["value"] for run in runs) == list(range(1, 11))
+        assert progress[-1] == (10, 10)
+
+    def test_fail_fast_raises_first_error(self):
+        machine = linear_machine(increment, fail_on_negative)
+        with pytest.raises(RuntimeError, match="negative"):
+            list(machine.run_many([{"value": 1, "label": ""}, {"value": -5, "label": ""}]))
+
+    def test_collects_errors_including_invalid_initial_states(self):
+        machine = linear_machine(increment, fail_on_negative)
+        runs = list(machine.run_many(
+            [{"value": 1, "label": ""}, {"value": -5, "label": ""}, {"zzz": 1}],
+            fail_fast=False,
+        ))
+        assert len(runs) == 3
+        errors = sorted(type(run.error).__name__ for run in runs if run.error is not None)
+        assert errors == ["RuntimeError", "ValueError"]
+        for run in runs:
+            # Failed runs have no end time but still describe themselves
+            assert run.metadata["run_id"] == run.run_id
+            assert (run.metadata["end_timestamp"] is None) == (run.error is not None)
+
+    def test_process_pool(self):
+        machine = linear_machine(increment, fail_on_negative)
+        machine.compile()
+        assert isinstance(pickle.loads(pickle.dumps(machine)), StateMachine)
+
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            runs = list(machine.run_many([{"value": i, "label": ""} for i in range(4)], executor=executor))
+        assert sorted(run.get_final_state()["label"] for run in runs) == [f"value={i}" for i in range(1, 5)]
+        assert all(isinstance(run, Run) and run.error is None for run in runs)
+
+
+class LockCheckingStore(SQLiteCheckpointStore, StateMachineObserver):
+    """Spill store asserting it is never called while the run holds its retention lock."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.runs = {}
+
+    def on_run_start(self, run, state):
+        self.runs[run.run_id] = run
+
+    def save_snapshot(self, run_id, snapshot, branch=False):
+        assert not self.runs[run_id]._retention_lock.locked()
+        super().save_snapshot(run_id, snapshot, branch)
+
+
+class TestRetention:
+
+    def test_keep_last_counts_evicted_snapshots(self):
+        machine = linear_machine(*[increment] * 6, retention=KeepLastSnapshots(2))
+        run = machine.run({"value": 0, "label": ""})
+        assert len(run.snapshots) == 2
+        assert run.snapshot_total == 7  # entry + 6 steps
+        assert run.get_final_state()["value"] == 6
+        # Retained snapshots don't depend on evicted ones
+        assert all(snapshot.parent is None or snapshot.parent in run.snapshots for snapshot in run.snapshots)
+
+    def test_spilled_snapshots_are_saved_outside_the_lock(self, tmp_path):
+        store = LockCheckingStore(str(tmp_path / "spill.db"))
+        machine = linear_machine(*[increment] * 4, retention=KeepFinalSnapshot(spill=store), observers=[store])
+        run = machine.run({"value": 0, "label": ""})
+
+        spilled = store.load_snapshots(run.run_id, CounterState)
+        assert [snapshot.state_data["value"] for snapshot in spilled] == [0, 1, 2, 3]
+        store.close()
+
+    def test_runs_have_their_own_lock_and_pickle(self):
+        machine = linear_machine(increment)
+        first, second = machine.run({"value": 0, "label": ""}), machine.run({"value": 1, "label": ""})
+        assert first._retention_lock is not second._retention_lock
+
+        restored = pickle.loads(pickle.dumps(first))
+        assert restored.get_final_state() == first.get_final_state()
+        restored.frozen = False
+        restored.add_snapshot(restored.snapshots[-1])
+        assert restored.snapshot_total == first.snapshot_total + 1
+
+
+class EndObserver(StateMachineObserver):
+    """Records how runs ended"""
+
+    def __init__(self):
+        self.ended = threading.Event()
+        self.run = None
+
+    def on_run_end(self, run, error):
+        self.run = run
+        self.ended.set()
+
+
+def slow_increment(state: CounterState) -> dict:
+    time.sleep(0.05)
+    return increment(state)
+
+
+class FailingStartObserver(StateMachineObserver):
+
+    def on_run_start(self, run, state):
+        raise RuntimeError("observer failed")
+
+
+class TestStream:
+
+    def test_yields_snapshots_then_returns_the_run(self):
+        machine = linear_machine(increment, increment)
+        stream = machine.stream({"value": 0, "label": ""})
+        steps = []
+        try:
+            while True:
+                steps.append(next(stream).step_id)
+        except StopIteration as stop:
+            run = stop.value
+        assert steps == ["__entry__", "step_0", "step_1"]
+        assert run.get_final_state()["value"] == 2
+
+    def test_failing_step_is_raised(self):
+        machine = linear_machine(fail_on_negative)
+        with pytest.raises(RuntimeError, match="negative"):
+            list(machine.stream({"value": -1, "label": ""}))
+
+    def test_error_before_the_run_starts_is_raised(self):
+        machine = linear_machine(increment, observers=[FailingStartObserver()])
+        with pytest.raises(RuntimeError, match="observer failed"):
+            list(machine.stream({"value": 0, "label": ""}))
+        assert machine._run_observers == {}
+
+    def test_astream_error_before_the_run_starts_is_raised(self):
+        machine = linear_machine(increment, observers=[FailingStartObserver()])
+
+        async def consume():
+            return [snapshot async for snapshot in machine.astream({"value": 0, "label": ""})]
+
+        with pytest.raises(RuntimeError, match="observer failed"):
+            asyncio.run(asyncio.wait_for(consume(), timeout=5))
+
+    def test_closing_stream_stops_the_run(self):
+        observer = EndObserver()
+        machine = linear_machine(*[slow_increment] * 5, observers=[observer])
+        stream = machine.stream({"value": 0, "label": ""})
+        next(stream)
+        stream.close()
+
+        assert observer.ended.wait(timeout=5)
+        assert isinstance(observer.run.error, RunCancelled)
+        assert observer.run.get_final_state()["value"] < 5
+
+    def test_closing_astream_stops_the_run(self):
+        observer = EndObserver()
+        machine = linear_machine(*[slow_increment] * 5, observers=[observer])
+
+        async def consume():
+            stream = machine.astream({"value": 0, "label": ""})
+            await stream.__anext__()
+            await stream.aclose()
+            await asyncio.sleep(0)
+
+        asyncio.run(consume())
+        assert observer.ended.is_set()
+        assert isinstance(observer.run.error, RunCancelled)
+        assert observer.run.get_final_state()["value"] < 5
@@ -0,0 +1,31 @@
+"""
+Tests for the benchmark stub server.
+"""
+import socket
+
+from lib.llm import LLM
+
+
+class TestStubOpenAIServer:
+
+    def test_streamed_answer(self, stub_server):
+        llm = LLM(api_key="stub", base_url=stub_server.base_url)
+        chunks = list(llm.stream("Hi"))
+        assert chunks[-1].content == "Stub answer to: Hi"
+        assert "".join(chunk for chunk in chunks if isinstance(chunk, str)) == "Stub answer to: Hi"
+
+    def test_no_tcp_stall_per_request(self, stub_server, monkeypatch):
+        # Nagle + delayed ACK used to add ~40 ms to every request; check the
+        # socket option instead of timing requests
+        handler = stub_server._httpd.RequestHandlerClass
+        setup = handler.setup
+        nodelay = []
+
+        def recording_setup(self):
+            setup(self)
+            nodelay.append(self.connection.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+
+        monkeypatch.setattr(handler, "setup", recording_setup)
+        llm = LLM(api_key="stub", base_url=stub_server.base_url)
+        llm.invoke("Hi")
+        assert nodelay and all(nodelay)
@@ -0,0 +1,80 @@
+"""
+Tests for ToolRegistry argument validation.
+"""
+import datetime
+from typing import Any, Dict, List, Literal, Optional, Union
+
+import pytest
+from pydantic import BaseModel
+
+from lib.tooling import ToolArgumentError, ToolRegistry, tool
+
+
+class GameDocument(BaseModel):
+    title: str
+    year: int
+
+
+@tool
+def typed(year: int, score: float, title: str, released: datetime.date,
+          platforms: List[str], flags: Dict[str, bool], kind: Literal["rpg", "racing"],
+          online: Optional[bool] = None) -> str:
+    """Tool with only mapped types"""
+    return "ok"
+
+
+@tool
+def loose(a: dict, b: Any, c: Union[int, str], docs: List[GameDocument], d: list, untyped=None) -> str:
+    """Tool with types the schema falls back to string for"""
+    return "ok"
+
+
+@pytest.fixture
+def registry():
+    return ToolRegistry([typed, loose])
+
+
+class TestValidate:
+
+    def test_coerces_inferred_types(self, registry):
+        arguments = registry.validate("typed", {
+            "year": "1998", "score": "9.5", "title": 64, "released": "1998-11-21",
+            "platforms": ["N64"], "flags": {"multiplayer": "true"}, "kind": "rpg",
+        })
+        assert arguments == {
+            "year": 1998, "score": 9.5, "title": "64", "released": datetime.date(1998, 11, 21),
+            "platforms": ["N64"], "flags": {"multiplayer": True}, "kind": "rpg",
+        }
+
+    def test_rejects_mismatched_inferred_types(self, registry):
+        with pytest.raises(ToolArgumentError, match="typed.year"):
+            registry.validate("typed", '{"year": "soon", "score": 1, "title": "x", "released": "1998-01-01", '
+                                       '"platforms": [], "flags": {}, "kind": "rpg"}')
+        with pytest.raises(ToolArgumentError, match="not one of"):
+            registry.validate("typed", {"year": 1, "score": 1, "title": "x", "released": "1998-01-01",
+                                        "platforms": [], "flags": {}, "kind": "puzzle"})
+
+    def test_fallback_types_pass_through(self, registry):
+        docs = [{"title": "Gran Turismo", "year": 1997}]
+        arguments = registry.validate("loose", {
+            "a": {"year": 1998}, "b": [1, "x"], "c": 3, "docs": docs, "d": [{"x": 1}], "untyped": 7,
+        })
+        assert arguments == {"a": {"year": 1998}, "b": [1, "x"], "c": 3, "docs": docs, "d": [{"x": 1}], "untyped": 7}
+
+    def test_model_schema_is_unchanged(self, registry):
+        properties = registry.schema("loose")["function"]["parameters"]["properties"]
+        assert properties["a"] == {"type": "string"}
+        assert properties["c"] == {"type": "string"}
+        assert properties["docs"] == {"type": "array", "items": {"type": "string"}}
+
+    def test_unknown_and_missing_arguments(self, registry):
+        with pytest.raises(ToolArgumentError, match="Unknown tool"):
+            registry.validate("nope", {})
+        with pytest.raises(ToolArgumentError, match="Missing required"):
+            registry.validate("loose", {"a": {}})
+        with pytest.raises(ToolArgumentError, match="Unexpected"):
+            registry.validate("loose", {"a": {}, "b": 1, "c": 1, "docs": [], "d": [], "zzz": 1})
+
+    def test_contains_names_and_tools(self, registry):
+        assert "typed" in registry and typed in registry
+        assert "nope" not in registry and tool(lambda: None) not in registry